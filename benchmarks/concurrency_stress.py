@@ -0,0 +1,82 @@
+# 1つのJsonizerを複数スレッドから使い、区切り文字の異なるメッセージが混ざっても結果が壊れないことを確かめる
+# usage: python benchmarks/concurrency_stress.py [--threads 16] [--rounds 200]
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ssmix2jsonizer import Jsonizer
+
+MESSAGES = [
+    ('ADT-01', '\r'.join([
+        'MSH|^~\\&|HIS123|SEND|GW|RCV|20111220224447.3399||ADT^A08^ADT_A01|20111220000001|P|2.5||||||~ISO IR87||ISO 2022-1994|SS-MIX2_1.20^SS-MIX2^1.2.392.200250.2.1.100.1.2.120^ISO',
+        'EVN||201112202100|||||SEND001',
+        'PID|0001||9999013||患者^太郎^^^^^L^I~カンジャ^タロウ^^^^^L^P||19480405|M|||^^^^422-8033^JPN^H^静岡県静岡市登呂１－３－５||^PRN^PH^^^^^^^^^054-000-0000~^EMR^PH^^^^^^^^^03-5999-9999|^WPN^PH^^^^^^^^^03-3599-9993|||||||||||||||||||20111219121551',
+        'PV1|0001|I|32^302^1^^^N||||220^医師^一郎^^^^^^^L^^^^^I',
+        'OBX|1|NM|9N001000000000001^身長^JC10||167.8|cm^cm^ISO+|||||F',
+        'OBX|2|ST|9N006000000000001^コメント^JC10||注意\\F\\要確認\\S\\再検|||||F',
+        'AL1|1|DA^薬剤アレルギー^HL70127|1^ペニシリン^99XYZ',
+    ])),
+    ('OMP-01', '\r'.join([
+        'MSH|^~\\&|HIS123|SEND|GW|RCV|20111220224447.3399||RDE^O11^RDE_O11|20111220000001|P|2.5||||||~ISO IR87||ISO 2022-1994|SS-MIX2_1.20^SS-MIX2^1.2.392.200250.2.1.100.1.2.120^ISO',
+        'PID|0001||9999013||患者^太郎^^^^^L^I||19480405|M',
+        'ORC|NW|12345678||12345678_01|||||20111220|||123456^医師^一郎^^^^^^^L^^^^^I',
+        'RXE||103835401^ムコダイン錠２５０ｍｇ^HOT||1||TAB^錠^MR9P|||||||||||||||||||||OHP^外来処方^MR9P~OHI^院内処方^MR9P',
+        'TQ1|||1013044400000000&内服・経口・１日３回朝昼夕食後&JAMISDP01|||3^D&日&ISO+|20111220',
+        'RXR|PO^口^HL70162',
+    ])),
+]
+
+# (フィールド, コンポーネント, 繰り返し, エスケープ, サブコンポーネント)
+ENCODINGS = ['|^~\\&', '#$*!@', '%:;?=']
+
+def translate(message, encoding):
+    return message.translate(str.maketrans('|^~\\&', encoding))
+
+def stress(threads=16, rounds=200):
+    # return: (変換の回数, [(データ種別, 区切り文字), ...] 1回目と結果が異なった変換)
+    jsonizer = Jsonizer()
+    cases = [(dataCategory, translate(message, encoding))
+        for dataCategory, message in MESSAGES for encoding in ENCODINGS]
+    expected = [json.dumps(jsonizer.jsonize(dataCategory, message), ensure_ascii=False)
+        for dataCategory, message in cases]
+    failures = []
+
+    def worker(seed):
+        r = random.Random(seed)
+        for _ in range(rounds):
+            i = r.randrange(len(cases))
+            result = json.dumps(jsonizer.jsonize(*cases[i]), ensure_ascii=False)
+            if result != expected[i]:
+                failures.append((cases[i][0], ENCODINGS[i % len(ENCODINGS)]))
+
+    # スレッド切り替えを頻繁にして競合を起こりやすくする
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    return threads * rounds, failures
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    total, failures = stress(args.threads, args.rounds)
+    print(f'{total} conversions, {len(failures)} mismatches')
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
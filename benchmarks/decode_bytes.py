@@ -0,0 +1,71 @@
+# ISO-2022-JPのファイルを、テキストとして1行ずつ読む場合と、bytesで読み必要な行だけデコードする場合
+# (bytes_mode, jisbytes.py)で比べる。合成メッセージ(synthetic.py)を一時ディレクトリにファイルとして書き出し、
+# セグメントへの分割のみ、jsonize全体、射影(--fields)のそれぞれの時間を測る。両者の出力が同じことも確かめる。
+# usage: python benchmarks/decode_bytes.py [--messages 200] [--fields PID.3 OBX.5]
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ssmix2jsonizer import Jsonizer
+from ssmix2jsonizer.main import segmentGenerator
+from synthetic import generateMessages
+
+def writeFiles(directory, categories, count, seed):
+    # return: [(データ種別, パス), ...]
+    files = []
+    for dataCategory in categories:
+        for i, message in enumerate(generateMessages(dataCategory, count, seed)):
+            path = os.path.join(directory, f'{dataCategory}_{i}')
+            # 合成メッセージにはJIS X 0208に無い文字も含まれるので、'?'に置き換える
+            with open(path, 'wb') as f:
+                f.write(message.encode('iso-2022-jp', errors='replace'))
+            files.append((dataCategory, path))
+    return files
+
+def best(run, files, repeat):
+    elapsed = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for dataCategory, path in files:
+            run(dataCategory, path)
+        roundElapsed = time.perf_counter() - start
+        elapsed = roundElapsed if elapsed is None else min(elapsed, roundElapsed)
+    return elapsed
+
+def compare(name, files, repeat, textRun, bytesRun):
+    mismatches = sum(textRun(dataCategory, path) != bytesRun(dataCategory, path) for dataCategory, path in files)
+    textElapsed = best(textRun, files, repeat)
+    bytesElapsed = best(bytesRun, files, repeat)
+    print(f'{name:10s} text {textElapsed * 1000 / len(files):8.3f} ms/file  '
+        f'bytes {bytesElapsed * 1000 / len(files):8.3f} ms/file  {textElapsed / bytesElapsed:5.2f}x  '
+        f'mismatches {mismatches}')
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=200, help='データ種別ごとのメッセージ数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help='測定の回数(最も速かった回を使う)')
+    parser.add_argument('--categories', nargs='*', default=['ADT-00', 'OMP-01', 'OML-11', 'PPR-01'])
+    parser.add_argument('--fields', nargs='*', default=['PID.3', 'OBX.5'], help='射影するフィールド')
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = writeFiles(directory, args.categories, args.messages, args.seed)
+        print(f'{len(files)} files, {sum(os.path.getsize(path) for _, path in files) / len(files):.0f} bytes/file')
+        mismatches = compare('segments', files, args.repeat,
+            lambda dataCategory, path: list(segmentGenerator(path)),
+            lambda dataCategory, path: list(segmentGenerator(path, bytesMode=True)))
+        for name, kwargs in [('jsonize', {}), ('projection', {'fields': args.fields})]:
+            textJsonizer = Jsonizer(**kwargs)
+            bytesJsonizer = Jsonizer(bytes_mode=True, **kwargs)
+            mismatches += compare(name, files, args.repeat, textJsonizer.jsonize, bytesJsonizer.jsonize)
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
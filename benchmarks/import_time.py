@@ -0,0 +1,61 @@
+# import ssmix2jsonizer のコールドスタート時間を計測する
+# usage: python benchmarks/import_time.py [--runs 20]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MESSAGE = ('MSH|^~\\&|HIS123|SEND|GW|RCV|20111220224447.3399||ADT^A08^ADT_A01|20111220000001|P|2.5\r'
+    'PID|0001||9999013||患者^太郎^^^^^L^I||19480405|M')
+
+SCENARIOS = {
+    # 従来(import時に3つのjsonを全て読む)相当
+    'import + eager json.load': '''
+import json, os
+import ssmix2jsonizer
+from ssmix2jsonizer import schema
+for name in ['SSMIX2_FIELD_OPTIONS', 'SEGMENT_STRUCTURE', 'DATATYPE_STRUCTURE']:
+    with open(os.path.join(schema.JSON_DIR, name + '.json'), encoding='utf-8') as f:
+        json.load(f)
+''',
+    'import': '''
+import ssmix2jsonizer
+''',
+    'import + ADT-00 (no cache)': f'''
+import ssmix2jsonizer
+ssmix2jsonizer.schema.USE_SCHEMA_CACHE = False
+ssmix2jsonizer.Jsonizer().jsonize('ADT-00', {MESSAGE!r})
+''',
+    'import + ADT-00 (cache)': f'''
+import ssmix2jsonizer
+ssmix2jsonizer.Jsonizer().jsonize('ADT-00', {MESSAGE!r})
+''',
+}
+
+def measure(code, runs):
+    script = 'import time\nt = time.perf_counter()\n' + code + '\nprint(time.perf_counter() - t)\n'
+    # 実運用と同じく.pycがある状態で計測する
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, check=True,
+            stdout=subprocess.PIPE, universal_newlines=True).stdout
+        times.append(float(out.split()[-1]) * 1000)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+    # キャッシュを作っておく
+    measure(SCENARIOS['import + ADT-00 (cache)'], 1)
+    for name, code in SCENARIOS.items():
+        times = measure(code, args.runs)
+        print(f'{name:32s} median {statistics.median(times):7.2f} ms  min {min(times):7.2f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# MLLPサーバ(ssmix2jsonizer.mllp)に合成メッセージ(synthetic.py)を複数の接続から送り、ACKまでのスループットを測る。
+# usage: python benchmarks/mllp_throughput.py [--messages 2000] [--connections 4] [--executor process]
+import argparse
+import asyncio
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ssmix2jsonizer.mllp import MLLPServer, sendMessages
+from synthetic import generateMessages
+
+async def run(args, messages):
+    received = []
+
+    def sink(dataCategory, result, message):
+        received.append(len(result))
+
+    async with MLLPServer(sink, port=0, executor=args.executor, workers=args.workers, max_pending=args.max_pending,
+            window=args.window, text=True, encoding='utf-8') as server:
+        # プールの起動とフィールドプランの作成を測らないよう、先に一通り送る
+        await sendMessages(messages[:args.window], port=server.port, encoding='utf-8', window=args.window)
+        start = time.perf_counter()
+        acks = await asyncio.gather(*[sendMessages(messages[i::args.connections], port=server.port,
+            encoding='utf-8', window=args.window) for i in range(args.connections)])
+        elapsed = time.perf_counter() - start
+        stats = server.stats()
+    accepted = sum(ack.split('\r')[1].startswith('MSA|AA|') for connectionAcks in acks for ack in connectionAcks)
+    print(f'{len(messages)} messages {elapsed:.2f} s {len(messages) / elapsed:.1f} msg/s accepted {accepted} {stats}')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--categories', nargs='*', default=['ADT-00', 'OMP-01', 'OML-11'])
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--executor', choices=['process', 'thread'], default='process')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-pending', type=int, default=256)
+    parser.add_argument('--window', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+    # 合成メッセージにはISO-2022-JPで表せない文字も含まれるので、UTF-8で送る
+    perCategory = -(-args.messages // len(args.categories))
+    messages = [message for dataCategory in args.categories
+        for message in generateMessages(dataCategory, perCategory, args.seed)][:args.messages]
+    asyncio.run(run(args, messages))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# 仮名化(pseudonym.Pseudonymizer)の費用を測る。合成メッセージ(synthetic.py)を、仮名化なし、
+# 仮名化あり(storeなし)、仮名化あり(SQLiteのstoreに記録)でjsonizeし、messages/secを比べる。
+# 同じIDが何度も現れる実データに近づけるため、--patientsで患者数(PID-3の種類)を絞れる。
+# usage: python benchmarks/pseudonym_overhead.py [--messages 500] [--patients 100]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ssmix2jsonizer import Jsonizer
+from ssmix2jsonizer.pseudonym import Pseudonymizer
+from synthetic import generateMessages
+
+def withPatients(messages, patients, seed):
+    # PID-3の第1成分を、patients人の患者IDのどれかに置き換える
+    rng = random.Random(seed)
+    replaced = []
+    for message in messages:
+        segments = message.split('\r')
+        for i, segment in enumerate(segments):
+            if segment.startswith('PID|'):
+                fields = segment.split('|')
+                if len(fields) > 3:
+                    fields[3] = f'{rng.randrange(patients):010d}' + fields[3][len(fields[3].split('^')[0]):]
+                segments[i] = '|'.join(fields)
+        replaced.append('\r'.join(segments))
+    return replaced
+
+def best(jsonizer, batches, repeat):
+    elapsed = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for dataCategory, messages in batches:
+            for message in messages:
+                jsonizer.jsonize(dataCategory, message)
+        roundElapsed = time.perf_counter() - start
+        elapsed = roundElapsed if elapsed is None else min(elapsed, roundElapsed)
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=500, help='データ種別ごとのメッセージ数')
+    parser.add_argument('--patients', type=int, default=100, help='患者数(PID-3の種類)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help='測定の回数(最も速かった回を使う)')
+    parser.add_argument('--categories', nargs='*', default=['ADT-00', 'OMP-01', 'OML-11', 'PPR-01'])
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    batches = [(dataCategory, withPatients(list(generateMessages(dataCategory, args.messages, args.seed)),
+        args.patients, args.seed)) for dataCategory in args.categories]
+    count = sum(len(messages) for _, messages in batches)
+    with tempfile.TemporaryDirectory() as directory:
+        with Pseudonymizer(os.urandom(32)) as memoryOnly, \
+                Pseudonymizer(os.urandom(32), store=os.path.join(directory, 'tokens.sqlite')) as stored:
+            baseline = None
+            for name, pseudonymizer in [('plain', None), ('memo', memoryOnly), ('store', stored)]:
+                elapsed = best(Jsonizer(pseudonymizer=pseudonymizer), batches, args.repeat)
+                baseline = baseline or elapsed
+                print(f'{name:6s} {count / elapsed:10.0f} messages/sec  overhead {elapsed / baseline - 1:+7.1%}')
+            stored.flush()
+            print('memo', memoryOnly.stats())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# 分割変換(shard.py)を1台で確かめる。合成メッセージ(synthetic.py)で標準化ストレージを一時ディレクトリに作り、
+# --shard-countのシャードをそれぞれ別のプロセス(ssmix2jsonize --shard-index i --shard-count n)で同時に変換する。
+# --kill-afterを指定すると、シャード0のプロセスを(ワーカーのプロセスごと)その秒数後に止め、同じ引数で再実行して続きから変換させる。
+# 止めるのは、シャード0が少なくとも1つの単位をチェックポイントに記録してから。
+# 全シャードの出力を合わせたものが、分割しない変換(bulk.convertStorage)の出力と重複も欠落もなく一致することを確かめる。
+# usage: python benchmarks/shard_local.py [--messages 300] [--shard-count 4] [--kill-after 1.0]
+import argparse
+import glob
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ssmix2jsonizer.bulk import convertStorage
+from ssmix2jsonizer.shard import shardName, shardSummaries
+from synthetic import generateMessages
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATEGORIES = ['ADT-00', 'OMP-01', 'OML-11', 'OMG-01']
+
+def writeStorage(root, categories, count, seed):
+    # root/<pid[0:3]>/<pid[3:6]>/<pid>/<date>/<category>/<file>に書き出す。return: ファイル数
+    files = 0
+    for dataCategory in categories:
+        for i, message in enumerate(generateMessages(dataCategory, count, seed)):
+            pid = message.split('\rPID|', 1)[1].split('|')[2].split('^')[0]
+            directory = os.path.join(root, pid[0:3], pid[3:6], pid, '20210805', dataCategory)
+            os.makedirs(directory, exist_ok=True)
+            name = f'{pid}_20210805_{dataCategory}_{i:015d}_20210805000000000_01_1'
+            # 合成メッセージにはJIS X 0208に無い文字も含まれるので、'?'に置き換える
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(message.encode('iso-2022-jp', errors='replace'))
+            files += 1
+    return files
+
+def launch(root, output, shardIndex, shardCount):
+    # プロセスプールのワーカーごと止められるよう、別のプロセスグループで起動する
+    return subprocess.Popen([sys.executable, '-W', 'ignore', '-m', 'ssmix2jsonizer.bulk', root, output,
+        '--shard-index', str(shardIndex), '--shard-count', str(shardCount), '--processes', '1',
+        '--chunksize', '16'], cwd=PACKAGE_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True)
+
+def kill(process):
+    os.killpg(process.pid, signal.SIGKILL)
+    process.wait()
+
+def unitsDone(output, shardIndex, shardCount):
+    try:
+        summary = shardSummaries(output).get(shardName(shardIndex, shardCount))
+    except OSError:
+        return 0
+    return summary['units'] if summary else 0
+
+def readLines(paths):
+    lines = Counter()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            lines.update(f)
+    return lines
+
+def run(messages=300, seed=0, shardCount=4, killAfter=None, categories=CATEGORIES, log=print):
+    # return: {'files': ファイル数, 'elapsed': 秒, 'killed': シャード0を止めたか,
+    #   'duplicates': 件数, 'missing': 件数, 'unexpected': 件数}
+    with tempfile.TemporaryDirectory() as directory:
+        root = os.path.join(directory, 'storage')
+        files = writeStorage(root, categories, messages, seed)
+        reference = os.path.join(directory, 'reference')
+        convertStorage(root, reference, processes=1)
+        expected = readLines(glob.glob(os.path.join(reference, 'part-*.ndjson')))
+
+        output = os.path.join(directory, 'sharded')
+        start = time.perf_counter()
+        processes = [launch(root, output, i, shardCount) for i in range(shardCount)]
+        killed = False
+        try:
+            if killAfter is not None:
+                time.sleep(killAfter)
+                while processes[0].poll() is None and not unitsDone(output, 0, shardCount):
+                    time.sleep(0.01)
+                if processes[0].poll() is None:
+                    kill(processes[0])
+                    killed = True
+                    log('shard 0 killed:', shardSummaries(output).get(shardName(0, shardCount)))
+                    processes[0] = launch(root, output, 0, shardCount)
+                else:
+                    log('shard 0 finished before --kill-after')
+            for process in processes:
+                process.wait()
+        finally:
+            for process in processes:
+                if process.poll() is None:
+                    kill(process)
+        elapsed = time.perf_counter() - start
+        actual = readLines(path for path in glob.glob(os.path.join(output, 'shard-*-of-*.ndjson'))
+            if not path.endswith('.errors.ndjson'))
+        for name, summary in shardSummaries(output).items():
+            log(name, summary)
+    return {'files': files, 'elapsed': elapsed, 'killed': killed,
+        'duplicates': sum(count - 1 for count in actual.values() if count > 1),
+        'missing': sum((expected - actual).values()), 'unexpected': sum((actual - expected).values())}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=300, help='データ種別ごとのメッセージ数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shard-count', type=int, default=4)
+    parser.add_argument('--kill-after', type=float, default=None, help='シャード0を止めるまでの秒数')
+    parser.add_argument('--categories', nargs='*', default=CATEGORIES)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    result = run(args.messages, args.seed, args.shard_count, args.kill_after, args.categories)
+    print(f"{result['files']} files, {args.shard_count} shards in {result['elapsed']:.2f} s: "
+        f"duplicates {result['duplicates']}, missing {result['missing']}, unexpected {result['unexpected']}")
+    return 1 if result['duplicates'] or result['missing'] or result['unexpected'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
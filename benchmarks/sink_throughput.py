@@ -0,0 +1,64 @@
+# 出力先による変換全体の速さを比べる。合成メッセージ(synthetic.py)をjsonizeToでNDJSONにし、
+# 非圧縮のファイル、同じスレッドで圧縮するgzip.open、圧縮と書き込みを別スレッドで行うsinks.OutputSinkに書き出す。
+# 出力の大きさと、元のメッセージの大きさに対する比も表示する。
+# usage: python benchmarks/sink_throughput.py [--messages 500] [--compression gzip]
+import argparse
+import gzip
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ssmix2jsonizer import Jsonizer
+from ssmix2jsonizer.sinks import OutputSink
+from synthetic import generateMessages
+
+def convert(jsonizer, batches, output):
+    for dataCategory, messages in batches:
+        for message in messages:
+            jsonizer.jsonizeTo(dataCategory, message, output)
+            output.write('\n')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=500, help='データ種別ごとのメッセージ数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='測定の回数(最も速かった回を使う)')
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], default='gzip')
+    parser.add_argument('--level', type=int, default=None)
+    parser.add_argument('--categories', nargs='*', default=['ADT-00', 'OMP-01', 'OML-11', 'PPR-01'])
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    batches = [(dataCategory, generateMessages(dataCategory, args.messages, args.seed))
+        for dataCategory in args.categories]
+    count = sum(len(messages) for _, messages in batches)
+    rawSize = sum(len(message.encode('utf-8')) for _, messages in batches for message in messages)
+    jsonizer = Jsonizer()
+    convert(jsonizer, batches, open(os.devnull, 'w', encoding='utf-8'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'out.ndjson')
+        sinks = [('plain', lambda: open(path, 'w', encoding='utf-8'), lambda output: [path])]
+        if args.compression == 'gzip':
+            level = 6 if args.level is None else args.level
+            sinks.append(('gzip.open', lambda: gzip.open(path + '.gz', 'wt', encoding='utf-8', compresslevel=level),
+                lambda output: [path + '.gz']))
+        sinks.append(('OutputSink', lambda: OutputSink(path, args.compression, args.level),
+            lambda output: output.paths))
+        for name, openOutput, outputPaths in sinks:
+            elapsed = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                with openOutput() as output:
+                    convert(jsonizer, batches, output)
+                roundElapsed = time.perf_counter() - start
+                elapsed = roundElapsed if elapsed is None else min(elapsed, roundElapsed)
+            size = sum(os.path.getsize(p) for p in outputPaths(output))
+            print(f'{name:10s} {count / elapsed:8.0f} messages/sec  {size / 1024 / 1024:8.2f} MB  '
+                f'{size / rawSize:5.2f}x of raw HL7')
+
+if __name__ == '__main__':
+    main()
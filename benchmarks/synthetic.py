@@ -0,0 +1,174 @@
+# ベンチマーク用の合成メッセージ。シードを固定すれば同じメッセージ列を返す。
+# フィールドはSEGMENT_STRUCTURE/DATATYPE_STRUCTUREのデータ型に従って埋め、SS-MIX2で必須('R')のフィールドは必ず、
+# 任意('O')のフィールドは一部を埋める。ORDER, SPECIMENなどのグループは、実データに近い繰り返し数にする。
+# usage: python benchmarks/synthetic.py OMP-01 [--seed 0] [--count 1]
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ssmix2jsonizer.main import SEGMENT_STRUCTURE, DATATYPE_STRUCTURE, SSMIX2_FIELD_OPTIONS
+
+# (セグメント型 or [グループ内の構造], 最小, 最大, 平均)
+ADT_STRUCTURE = [('EVN', 1, 1, 1), ('PID', 1, 1, 1), ('NK1', 0, 3, 0.5), ('PV1', 1, 1, 1), ('PV2', 0, 1, 0.3),
+    ('DB1', 0, 1, 0.1), ('OBX', 0, 10, 3), ('AL1', 0, 4, 0.8), ('IN1', 0, 3, 1)]
+HEADER = [('PID', 1, 1, 1), ('PV1', 1, 1, 1), ('AL1', 0, 3, 0.5)]
+
+CATEGORY_STRUCTURES = {
+    **{category: ADT_STRUCTURE for category in ['ADT-00', 'ADT-01', 'ADT-12', 'ADT-21', 'ADT-22',
+        'ADT-31', 'ADT-32', 'ADT-41', 'ADT-42', 'ADT-51', 'ADT-52']},
+    'ADT-61': [('EVN', 1, 1, 1), ('PID', 1, 1, 1), ('PV1', 0, 1, 0.5), ('IAM', 1, 8, 2)],
+    'PPR-01': [('PID', 1, 1, 1), ([('PRB', 1, 1, 1), ('ZPR', 0, 1, 0.8), ('ZPD', 0, 3, 0.5),
+        ('ZI1', 0, 1, 0.2), ('ORC', 0, 1, 0.5)], 1, 20, 4)],
+    'OMD': HEADER + [([('ORC', 1, 1, 1), ('TQ1', 1, 1, 1), ('ODS', 1, 5, 2)], 1, 6, 2)],
+    'OMP-01': HEADER + [([('ORC', 1, 1, 1), ('RXE', 1, 1, 1), ('TQ1', 1, 1, 1), ('RXR', 1, 2, 1)], 1, 30, 5)],
+    'OMP-11': HEADER + [([('ORC', 1, 1, 1), ('RXE', 1, 1, 1), ('TQ1', 1, 1, 1), ('RXR', 1, 1, 1),
+        ('RXA', 1, 3, 1), ('RXR', 1, 1, 1)], 1, 20, 4)],
+    'OMP-02': HEADER + [([('ORC', 1, 1, 1), ('RXE', 1, 1, 1), ('TQ1', 1, 1, 1), ('RXR', 1, 2, 1),
+        ('RXC', 1, 6, 2), ('OBX', 0, 3, 0.5), ('CTI', 0, 1, 0.2)], 1, 10, 2)],
+    'OMP-12': HEADER + [([('ORC', 1, 1, 1), ('RXE', 1, 1, 1), ('TQ1', 1, 1, 1), ('RXC', 1, 6, 2),
+        ('RXR', 1, 1, 1), ('RXA', 1, 2, 1), ('RXR', 1, 1, 1), ('OBX', 0, 3, 0.5), ('CTI', 0, 1, 0.2)], 1, 10, 2)],
+    'OML-01': HEADER + [([('SPM', 1, 1, 1), ([('ORC', 1, 1, 1), ('TQ1', 1, 1, 1), ('OBR', 1, 1, 1),
+        ('OBX', 1, 40, 10)], 1, 6, 2)], 1, 4, 1.5)],
+    'OML-11': [('PID', 1, 1, 1), ('PV1', 1, 1, 1), ([('SPM', 1, 1, 1), ('OBR', 1, 1, 1), ('ORC', 1, 1, 1),
+        ('OBX', 1, 60, 15)], 1, 4, 1.5)],
+    'OMG-01': [('PID', 1, 1, 1), ('PV1', 1, 1, 1), ([('ORC', 1, 1, 1), ('TQ1', 1, 1, 1), ('OBR', 1, 1, 1),
+        ('OBX', 0, 5, 1)], 1, 6, 2)],
+    'OMG-02': [('PID', 1, 1, 1), ('PV1', 1, 1, 1), ([('ORC', 1, 1, 1), ('TQ1', 1, 1, 1), ('OBR', 1, 1, 1),
+        ('OBX', 0, 5, 1)], 1, 6, 2)],
+    'OMG-03': HEADER + [([('ORC', 1, 1, 1), ('TQ1', 1, 1, 1), ('OBR', 1, 1, 1), ('OBX', 0, 5, 1)], 1, 6, 2)],
+    'OMG-11': [('PID', 1, 1, 1), ('PV1', 1, 1, 1), ([('ORC', 1, 1, 1), ('TQ1', 1, 1, 1), ('OBR', 1, 1, 1),
+        ('OBX', 0, 10, 3), ([('ZE1', 1, 1, 1), ('ZE2', 0, 4, 1)], 0, 3, 1), ('IPC', 0, 2, 0.5)], 1, 4, 1.5)],
+    'OMG-12': [('PID', 1, 1, 1), ('PV1', 1, 1, 1), ([('ORC', 1, 1, 1), ('TQ1', 1, 1, 1), ('OBR', 1, 1, 1),
+        ('OBX', 0, 10, 3), ('ZE1', 0, 2, 0.5), ('IPC', 0, 2, 0.5)], 1, 4, 1.5)],
+    'OMG-13': [('PID', 1, 1, 1), ('PV1', 1, 1, 1), ([('ORC', 1, 1, 1), ('TQ1', 1, 1, 1), ('OBR', 1, 1, 1),
+        ('OBX', 0, 10, 3)], 1, 6, 2)],
+}
+
+MESSAGE_TYPES = {
+    'ADT-00': 'ADT^A08^ADT_A01', 'ADT-01': 'ADT^A54^ADT_A52', 'ADT-12': 'ADT^A04^ADT_A01',
+    'ADT-21': 'ADT^A14^ADT_A05', 'ADT-22': 'ADT^A01^ADT_A01', 'ADT-31': 'ADT^A16^ADT_A16',
+    'ADT-32': 'ADT^A03^ADT_A03', 'ADT-41': 'ADT^A02^ADT_A02', 'ADT-42': 'ADT^A12^ADT_A12',
+    'ADT-51': 'ADT^A08^ADT_A01', 'ADT-52': 'ADT^A08^ADT_A01', 'ADT-61': 'ADT^A60^ADT_A60',
+    'PPR-01': 'PPR^PC1^PPR_PC1', 'OMD': 'OMD^O03^OMD_O03', 'OMP-01': 'RDE^O11^RDE_O11',
+    'OMP-11': 'RAS^O17^RAS_O17', 'OMP-02': 'RDE^O11^RDE_O11', 'OMP-12': 'RAS^O17^RAS_O17',
+    'OML-01': 'OML^O33^OML_O33', 'OML-11': 'OUL^R22^OUL_R22', 'OMG-01': 'OMG^O19^OMG_O19',
+    'OMG-02': 'OMG^O19^OMG_O19', 'OMG-03': 'OMG^O19^OMG_O19', 'OMG-11': 'OMG^O19^OMG_O19',
+    'OMG-12': 'OMG^O19^OMG_O19', 'OMG-13': 'OMG^O19^OMG_O19',
+}
+
+TEXTS = ['患者', '太郎', '花子', '静岡県静岡市登呂１－３－５', 'ムコダイン錠２５０ｍｇ', '内服・経口・１日３回朝昼夕食後',
+    '血液型-ABO式', '身長', '体重', '外来処方', '院内処方', '高血圧症', '本態性高血圧症', '経過観察',
+    '注意\\F\\要確認', '白血球数', 'ヘモグロビン', '医師', '一郎', 'plain text']
+CODES = ['A', 'F', 'N', 'H', 'L', 'I', 'O', 'P', 'M', '1', '01', 'PO', 'TAB', 'ISO+', 'HL70162', 'JC10', 'MR9P', 'HOT']
+OBX_VALUE_TYPES = ['NM', 'NM', 'NM', 'ST', 'CWE', 'TX']
+
+def chooseCount(r, minimum, maximum, mean, depth):
+    # 平均meanの指数分布。depthを大きくすると繰り返しが深くなる
+    maximum = max(minimum, int(maximum * depth))
+    if minimum == maximum:
+        return minimum
+    return min(maximum, minimum + int(r.expovariate(1 / max(mean * depth - minimum, 0.1))))
+
+def primitiveValue(r, dataType, seq):
+    if dataType == 'NM':
+        return f'{r.uniform(0, 300):.1f}'
+    if dataType == 'SI':
+        return str(seq)
+    if dataType == 'DT':
+        return f'{r.randint(1930, 2024)}{r.randint(1, 12):02d}{r.randint(1, 28):02d}'
+    if dataType in ('DTM', 'TS'):
+        return (f'{r.randint(2000, 2024)}{r.randint(1, 12):02d}{r.randint(1, 28):02d}'
+            f'{r.randint(0, 23):02d}{r.randint(0, 59):02d}{r.randint(0, 59):02d}' + r.choice(['', '.1234', '+0900']))
+    if dataType == 'TM':
+        return f'{r.randint(0, 23):02d}{r.randint(0, 59):02d}'
+    if dataType in ('ST', 'TX', 'FT'):
+        return r.choice(TEXTS)
+    return r.choice(CODES)
+
+def compositeValue(r, dataType, separator='^', subSeparator='&', seq=1):
+    if dataType not in DATATYPE_STRUCTURE:
+        return primitiveValue(r, dataType, seq)
+    components = []
+    for i, element in enumerate(DATATYPE_STRUCTURE[dataType]):
+        # 先頭のコンポーネントほど埋まっている
+        if r.random() < (0.9 if i < 3 else 0.15):
+            if element['DataType'] in DATATYPE_STRUCTURE and subSeparator:
+                components.append(compositeValue(r, element['DataType'], subSeparator, None, seq))
+            else:
+                components.append(primitiveValue(r, element['DataType'], seq))
+        else:
+            components.append('')
+    while components and not components[-1]:
+        components.pop()
+    return separator.join(components)
+
+def fieldValue(r, field, seq, dataType=None):
+    dataType = dataType or field['DataType']
+    if dataType in ('', '*', 'TQ'):
+        return ''
+    repeats = 1 + (r.random() < 0.2) * r.randint(1, 2) if field.get('Repeatability') else 1
+    return '~'.join(compositeValue(r, dataType, seq=seq) for _ in range(repeats))
+
+def generateSegment(r, dataCategory, segmentType, seq, patientId):
+    options = SSMIX2_FIELD_OPTIONS[dataCategory if dataCategory in SSMIX2_FIELD_OPTIONS else 'ADT'].get(segmentType, [])
+    structure = SEGMENT_STRUCTURE[segmentType]
+    fields = [segmentType]
+    valueType = None
+    for i, field in enumerate(structure[1:], 1):
+        option = options[i] if i < len(options) else 'O'
+        if segmentType == 'PID' and i == 3:
+            fields.append(f'{patientId}^^^^PI')
+        elif segmentType == 'OBX' and i == 2:
+            valueType = r.choice(OBX_VALUE_TYPES)
+            fields.append(valueType)
+        elif segmentType == 'OBX' and i == 5:
+            fields.append(compositeValue(r, valueType, seq=seq))
+        elif r.random() < {'R': 1.0, 'O': 0.35}.get(option, 0.03):
+            fields.append(fieldValue(r, field, seq))
+        else:
+            fields.append('')
+    while len(fields) > 1 and not fields[-1]:
+        fields.pop()
+    return '|'.join(fields)
+
+def expand(r, structure, depth):
+    # return: セグメント型のリスト
+    segmentTypes = []
+    for item, minimum, maximum, mean in structure:
+        for _ in range(chooseCount(r, minimum, maximum, mean, depth)):
+            if isinstance(item, list):
+                segmentTypes.extend(expand(r, item, depth))
+            else:
+                segmentTypes.append(item)
+    return segmentTypes
+
+def generateMessage(dataCategory, r, depth=1.0, controlId=1):
+    # return: <CR>区切りのメッセージ
+    patientId = f'{r.randint(0, 9999999999):010d}'
+    segments = ['|'.join(['MSH', '^~\\&', 'HIS123', 'SEND', 'GW', 'RCV', primitiveValue(r, 'DTM', 1), '',
+        MESSAGE_TYPES[dataCategory], f'{controlId:020d}', 'P', '2.5', '', '', '', '', '~ISO IR87', '', 'ISO 2022-1994',
+        'SS-MIX2_1.20^SS-MIX2^1.2.392.200250.2.1.100.1.2.120^ISO'])]
+    counts = {}
+    for segmentType in expand(r, CATEGORY_STRUCTURES[dataCategory], depth):
+        counts[segmentType] = counts.get(segmentType, 0) + 1
+        segments.append(generateSegment(r, dataCategory, segmentType, counts[segmentType], patientId))
+    return '\r'.join(segments)
+
+def generateMessages(dataCategory, count, seed=0, depth=1.0):
+    r = random.Random(f'{seed}:{dataCategory}')
+    return [generateMessage(dataCategory, r, depth, i) for i in range(1, count + 1)]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('category', choices=sorted(CATEGORY_STRUCTURES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--depth', type=float, default=1.0)
+    args = parser.parse_args()
+    for message in generateMessages(args.category, args.count, args.seed, args.depth):
+        print(message.replace('\r', '\n'), end='\n\n')
+
+if __name__ == '__main__':
+    main()
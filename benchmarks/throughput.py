@@ -0,0 +1,140 @@
+# 合成メッセージ(synthetic.py)でデータ種別ごと、セグメント型ごとのスループットを測り、結果をJSONで保存する。
+# --compareに以前の結果を渡すと、messages/secがthreshold以上低下したデータ種別を報告し、終了コード1を返す。
+# usage: python benchmarks/throughput.py [--messages 200] [--output result.json] [--compare previous.json]
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ssmix2jsonizer import Jsonizer
+from ssmix2jsonizer.main import MessageContext
+from synthetic import generateMessages
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+def peakRss():
+    # return: 最大常駐メモリ(KB)。測れなければNone
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはbytes
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+def percentiles(values, points=(50, 90, 99)):
+    values = sorted(values)
+    return {f'p{p}': values[min(len(values) - 1, int(len(values) * p / 100))] for p in points}
+
+def benchmarkCategory(jsonizer, dataCategory, messages, mode, repeat):
+    convert = jsonizer.jsonizerDict[dataCategory]
+    if mode == 'jsonizeTo':
+        run = lambda message: convert.jsonizeTo(message, io.StringIO())
+    else:
+        run = convert.jsonize
+    # 1周目はセグメントごとのフィールドプランの作成、スキーマの読み込みを含むので測らない
+    for message in messages:
+        run(message)
+    # スループットはrepeat回のうち最も速かった回、レイテンシは全ての回から求める
+    latencies = []
+    elapsed = None
+    clock = time.perf_counter
+    for _ in range(repeat):
+        roundStart = len(latencies)
+        for message in messages:
+            start = clock()
+            run(message)
+            latencies.append(clock() - start)
+        roundElapsed = sum(latencies[roundStart:])
+        elapsed = roundElapsed if elapsed is None else min(elapsed, roundElapsed)
+    segments = sum(message.count('\r') + 1 for message in messages)
+    return {'messages': len(messages), 'segments': segments, 'seconds': elapsed,
+        'messages_per_sec': len(messages) / elapsed, 'segments_per_sec': segments / elapsed,
+        'latency_ms': {key: value * 1000 for key, value in percentiles(latencies).items()},
+        'peak_rss_kb': peakRss()}
+
+def benchmarkSegments(jsonizer, dataCategory, messages, totals):
+    # セグメント型ごとのjsonizeSegmentの時間をtotalsに足す
+    convert = jsonizer.jsonizerDict[dataCategory]
+    clock = time.perf_counter
+    for message in messages:
+        context = MessageContext()
+        for segment in message.split('\r'):
+            if segment.startswith('MSH'):
+                context.setEncodingCharacters(segment)
+            start = clock()
+            convert.jsonizeSegment(segment, context)
+            elapsed = clock() - start
+            total = totals.setdefault(segment[:3], [0, 0.0])
+            total[0] += 1
+            total[1] += elapsed
+
+def compare(result, previous, threshold):
+    # return: 低下したデータ種別のリスト
+    regressions = []
+    for dataCategory, current in result['categories'].items():
+        if dataCategory not in previous.get('categories', {}):
+            continue
+        ratio = current['messages_per_sec'] / previous['categories'][dataCategory]['messages_per_sec']
+        mark = ' <- regression' if ratio < 1 - threshold else ''
+        print(f'{dataCategory:8s} {ratio:6.2f}x{mark}')
+        if mark:
+            regressions.append(dataCategory)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=200, help='データ種別ごとのメッセージ数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help='測定の回数')
+    parser.add_argument('--depth', type=float, default=1.0, help='グループの繰り返し数の倍率')
+    parser.add_argument('--categories', nargs='*', default=None)
+    parser.add_argument('--mode', choices=['jsonize', 'jsonizeTo'], default='jsonize')
+    parser.add_argument('--output', default=None, help='結果を保存するJSONファイル')
+    parser.add_argument('--compare', default=None, help='比較する以前の結果のJSONファイル')
+    parser.add_argument('--threshold', type=float, default=0.1, help='低下とみなすmessages/secの割合')
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    jsonizer = Jsonizer()
+    categories = args.categories or list(Jsonizer.DATA_CATEGORIES)
+    result = {'python': platform.python_version(), 'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {'messages': args.messages, 'seed': args.seed, 'depth': args.depth, 'mode': args.mode,
+            'repeat': args.repeat},
+        'categories': {}, 'segments': {}}
+    segmentTotals = {}
+    for dataCategory in categories:
+        messages = generateMessages(dataCategory, args.messages, args.seed, args.depth)
+        stats = benchmarkCategory(jsonizer, dataCategory, messages, args.mode, args.repeat)
+        result['categories'][dataCategory] = stats
+        benchmarkSegments(jsonizer, dataCategory, messages, segmentTotals)
+        print(f'{dataCategory:8s} {stats["messages_per_sec"]:9.1f} msg/s {stats["segments_per_sec"]:10.1f} seg/s '
+            f'p50 {stats["latency_ms"]["p50"]:.3f} ms p99 {stats["latency_ms"]["p99"]:.3f} ms')
+    for segmentType, (count, elapsed) in sorted(segmentTotals.items()):
+        result['segments'][segmentType] = {'segments': count, 'seconds': elapsed,
+            'segments_per_sec': count / elapsed if elapsed else None}
+    messages = sum(stats['messages'] for stats in result['categories'].values())
+    elapsed = sum(stats['seconds'] for stats in result['categories'].values())
+    result['total'] = {'messages': messages, 'seconds': elapsed, 'messages_per_sec': messages / elapsed,
+        'peak_rss_kb': peakRss()}
+    print(f'total    {result["total"]["messages_per_sec"]:9.1f} msg/s peak RSS {result["total"]["peak_rss_kb"]} KB')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        return 1 if compare(result, previous, args.threshold) else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,4 +2,8 @@ from setuptools import setup
 
 setup(name='ssmix2jsonizer',
 version='0.0.1',
-packages = ['ssmix2jsonizer'])
\ No newline at end of file
+packages = ['ssmix2jsonizer'],
+entry_points = {'console_scripts': ['ssmix2jsonize = ssmix2jsonizer.bulk:main',
+    'ssmix2jsonize-mllp = ssmix2jsonizer.mllp:main',
+    'ssmix2jsonize-batch = ssmix2jsonizer.batchfile:main',
+    'ssmix2jsonize-timeline = ssmix2jsonizer.timeline:main']})
\ No newline at end of file
@@ -0,0 +1,186 @@
+import argparse
+import io
+import json
+import mmap
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from .bulk import chunked
+from .main import Jsonizer
+from .mllp import DEFAULT_CATEGORY_MAP, asMessage, inferCategory
+
+# 複数のメッセージを連結したファイル、HL7のバッチファイル(FHS/BHS ... BTS/FTS)の読み込み。
+# ファイルをメモリマップし、MSHの位置で分割したメッセージを1つずつ返すので、ファイルの大きさによらず
+# メモリ使用量は一定。メッセージの区切りは、行頭(ファイルの先頭、CR, LF, MLLPのVTの直後)のMSH。
+# FHS, BHS, BTS, FTSの行はメッセージに含めない。
+
+SEGMENT_START = re.compile(rb'(?:\A|(?<=[\r\n\x0b]))(?:MSH|FHS|BHS|BTS|FTS)')
+# メッセージの末尾の改行、MLLPのフレーム文字
+TRAILING_BYTES = b'\r\n\x0b\x1c'
+# 読み終えた範囲のページを手放す単位
+RELEASE_BYTES = 16 * 1024 * 1024
+
+def openMap(path):
+    # return: 読み込み専用のmmap。空のファイルはmmapできないのでNone
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+        buffer.madvise(mmap.MADV_SEQUENTIAL)
+    return buffer
+
+def releasePages(buffer, start, end):
+    # 読み終えた範囲のページを手放し、ファイルが大きくても常駐メモリを増やさない。madviseが無い環境では何もしない
+    if not isinstance(buffer, mmap.mmap) or not hasattr(mmap, 'MADV_DONTNEED'):
+        return
+    start -= start % mmap.PAGESIZE
+    end -= end % mmap.PAGESIZE
+    if end > start:
+        buffer.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+def messageSpans(buffer):
+    # buffer: bytes, mmapなど。return: メッセージごとの(start, end)をyieldする
+    start = None
+    released = 0
+    for m in SEGMENT_START.finditer(buffer):
+        if start is not None:
+            if start - released >= RELEASE_BYTES:
+                releasePages(buffer, released, start)
+                released = start
+            yield start, trimEnd(buffer, start, m.start())
+        start = m.start() if m.group() == b'MSH' else None
+    if start is not None:
+        yield start, trimEnd(buffer, start, len(buffer))
+
+def trimEnd(buffer, start, end):
+    while end > start and buffer[end - 1] in TRAILING_BYTES:
+        end -= 1
+    return end
+
+def decodeSpan(buffer, start, end, encoding):
+    # bytesにコピーせず、バッファから直接デコードする
+    with memoryview(buffer) as view, view[start:end] as span:
+        return str(span, encoding)
+
+def readMessages(path, encoding='iso-2022-jp'):
+    # return: (ファイル内の位置, メッセージの文字列)をyieldする
+    buffer = openMap(path)
+    if buffer is None:
+        return
+    with buffer:
+        for start, end in messageSpans(buffer):
+            yield start, decodeSpan(buffer, start, end, encoding)
+
+def jsonizeBatchFile(path, jsonizer=None, data_category=None, category_map=None, **kwargs):
+    # ファイル内のメッセージを順にJSON化する。data_categoryを省略するとMSH-9から決める(mllp.DEFAULT_CATEGORY_MAP)
+    # return: (ファイル内の位置, データ種別, dict)をyieldする。データ種別が決まらないメッセージはdictがNone
+    jsonizer = jsonizer or Jsonizer(**kwargs)
+    encoding = kwargs.get('encoding', 'iso-2022-jp')
+    categoryMap = {**DEFAULT_CATEGORY_MAP, **(category_map or {})}
+    for offset, message in readMessages(path, encoding):
+        dataCategory = data_category or inferCategory(message, categoryMap)
+        if dataCategory is None:
+            yield offset, None, None
+            continue
+        yield offset, dataCategory, jsonizer.jsonize(dataCategory, asMessage(message))
+
+_workerJsonizer = None
+_workerBuffer = None
+_workerEncoding = None
+
+def _initWorker(path, jsonizerKwargs):
+    # ワーカーごとにファイルをメモリマップするので、メッセージの内容はプロセス間で受け渡さない
+    global _workerJsonizer, _workerBuffer, _workerEncoding
+    _workerJsonizer = Jsonizer(**jsonizerKwargs)
+    _workerBuffer = openMap(path)
+    _workerEncoding = jsonizerKwargs.get('encoding', 'iso-2022-jp')
+
+def _convertSpans(spans, dataCategory, categoryMap):
+    # return: (NDJSONテキスト, 変換件数, [(offset, error), ...])
+    buffer = io.StringIO()
+    count = 0
+    errors = []
+    for start, end in spans:
+        position = buffer.tell()
+        try:
+            message = decodeSpan(_workerBuffer, start, end, _workerEncoding)
+            category = dataCategory or inferCategory(message, categoryMap)
+            if category is None:
+                raise ValueError('Unsupported message type')
+            buffer.write(json.dumps({'offset': start, 'ssmix2_data_category': category},
+                ensure_ascii=False)[:-1] + ', "message": ')
+            _workerJsonizer.jsonizeTo(category, asMessage(message), buffer)
+        except Exception as e:
+            buffer.seek(position)
+            buffer.truncate()
+            errors.append((start, f'{type(e).__name__}: {e}'))
+            continue
+        buffer.write('}\n')
+        count += 1
+    if spans:
+        releasePages(_workerBuffer, spans[0][0], spans[-1][1])
+    return buffer.getvalue(), count, errors
+
+def convertBatchFile(path, output, processes=None, chunksize=256, data_category=None, category_map=None,
+        errors=None, **kwargs):
+    # ファイル内のメッセージをプロセスプールで並列にJSON化し、outputに1行1メッセージで書き出す(ファイル内の順)。
+    # ワーカーには(start, end)の位置だけを渡し、各ワーカーがファイルをメモリマップして読む。
+    # errors: 失敗したメッセージを{"offset": ..., "error": ...}の行で書き出すファイルライクオブジェクト
+    # return: {'converted': 件数, 'failed': 件数}
+    processes = processes or os.cpu_count() or 1
+    categoryMap = {**DEFAULT_CATEGORY_MAP, **(category_map or {})}
+    summary = {'converted': 0, 'failed': 0}
+    buffer = openMap(path)
+    if buffer is None:
+        return summary
+
+    def collect(future):
+        text, count, failures = future.result()
+        output.write(text)
+        summary['converted'] += count
+        summary['failed'] += len(failures)
+        if errors is not None:
+            for offset, error in failures:
+                errors.write(json.dumps({'offset': offset, 'error': error}, ensure_ascii=False) + '\n')
+
+    with buffer, ProcessPoolExecutor(processes, initializer=_initWorker, initargs=(path, kwargs)) as executor:
+        # 順序を保つため、先に投入したものから回収する。走査中の位置を全てキューに積まないよう、実行中のタスク数を制限する
+        pending = []
+        for spans in chunked(messageSpans(buffer), chunksize):
+            if len(pending) >= processes * 2:
+                wait(pending[:1], return_when=FIRST_COMPLETED)
+                collect(pending.pop(0))
+            pending.append(executor.submit(_convertSpans, spans, data_category, categoryMap))
+        for future in pending:
+            collect(future)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ssmix2jsonize-batch',
+        description='複数のメッセージを連結したファイル、HL7バッチファイルをNDJSONに変換します。')
+    parser.add_argument('input', help='入力ファイル')
+    parser.add_argument('output', help='出力するNDJSONファイル')
+    parser.add_argument('--errors', default=None, help='変換に失敗したメッセージを記録するファイル')
+    parser.add_argument('--data-category', default=None, help='省略するとMSH-9から決める')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=256)
+    parser.add_argument('--no-deidentify', dest='deidentify', action='store_false')
+    parser.add_argument('--encoding', default='iso-2022-jp')
+    args = parser.parse_args(argv)
+
+    errors = open(args.errors, 'w', encoding='utf-8') if args.errors else None
+    try:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            summary = convertBatchFile(args.input, output, args.processes, args.chunksize, args.data_category,
+                errors=errors, deidentify=args.deidentify, encoding=args.encoding)
+    finally:
+        if errors is not None:
+            errors.close()
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
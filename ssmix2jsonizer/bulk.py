@@ -0,0 +1,291 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from .main import Jsonizer
+from .pseudonym import Pseudonymizer
+from .sinks import OutputSink
+
+# SS-MIX2標準化ストレージ: root/<pid[0:3]>/<pid[3:6]>/<pid>/<date>/<category>/<file>
+# ファイル名: <pid>_<date>_<category>_<order no>_<timestamp>_<department>_<condition flag>
+STORAGE_DEPTH = 6 # rootからファイルまでの深さ
+
+SUPPORTED_DATA_CATEGORIES = frozenset(Jsonizer.DATA_CATEGORIES)
+
+def inferDataCategory(path):
+    # ディレクトリ名、ファイル名の順にデータ種別を推定する。対応していなければNone
+    directory = os.path.basename(os.path.dirname(path))
+    if directory in SUPPORTED_DATA_CATEGORIES:
+        return directory
+    parts = os.path.basename(path).split('_')
+    if len(parts) > 2 and parts[2] in SUPPORTED_DATA_CATEGORIES:
+        return parts[2]
+    return None
+
+def walkStorage(root, depth=0):
+    # (データ種別, パス)を順にyieldする。データ種別が推定できないファイルはデータ種別Noneで返す
+    # depth: rootの深さ。ストレージの途中のディレクトリ(root/<pid[0:3]>なら1)から走査するときに指定する
+    root = os.fspath(root)
+    stack = [(root, depth)]
+    while stack:
+        directory, depth = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name, reverse=True)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if depth + 1 < STORAGE_DEPTH:
+                    stack.append((entry.path, depth + 1))
+            elif depth + 1 == STORAGE_DEPTH and entry.is_file():
+                yield inferDataCategory(entry.path), entry.path
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class Manifest():
+    # 変換済みファイルの記録(SQLite)。パスはストレージのルートからの相対パス。
+    # 設定(config)が異なる記録は、変換されていないものとして扱う。
+    def __init__(self, path, config):
+        import sqlite3
+        self.config = config
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT, config TEXT)""")
+        self.connection.commit()
+
+    def lookup(self, relpath):
+        # return: (size, mtime_ns, hash)。記録が無いか、設定が異なればNone
+        row = self.connection.execute('SELECT size, mtime_ns, hash, config FROM files WHERE path = ?',
+            (relpath,)).fetchone()
+        if row is None or row[3] != self.config:
+            return None
+        return row[:3]
+
+    def record(self, rows):
+        # rows: [(relpath, size, mtime_ns, hash), ...]
+        self.connection.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+            [(*row, self.config) for row in rows])
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+_workerJsonizer = None
+_workerRoot = None
+_workerEncoding = None
+
+def _initWorker(root, jsonizerKwargs):
+    global _workerJsonizer, _workerRoot, _workerEncoding
+    _workerJsonizer = Jsonizer(**jsonizerKwargs)
+    _workerRoot = root
+    _workerEncoding = jsonizerKwargs.get('encoding', 'iso-2022-jp')
+
+def _convertChunk(chunk, withHash=False):
+    # chunk: [(dataCategory, path, (size, mtime_ns, 前回のhash) or None), ...]
+    # return: (NDJSONテキスト, 変換件数, [(path, error), ...], [(path, size, mtime_ns, hash), ...])
+    # withHashのとき、内容が前回と同じファイルは変換せず、記録だけ返す
+    buffer = io.StringIO()
+    count = 0
+    errors = []
+    records = []
+    for dataCategory, path, state in chunk:
+        relpath = os.path.relpath(path, _workerRoot)
+        position = buffer.tell()
+        try:
+            if withHash:
+                size, mtime, previousHash = state
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                digest = hashlib.sha1(raw).hexdigest()
+                if digest == previousHash:
+                    records.append((relpath, size, mtime, digest))
+                    continue
+                # ファイルを開いたときと同じく、改行はuniversal newlinesで扱う
+                message = io.StringIO(raw.decode(_workerEncoding), newline=None)
+            else:
+                message = path
+            buffer.write(json.dumps({'path': relpath, 'ssmix2_data_category': dataCategory},
+                ensure_ascii=False)[:-1] + ', "message": ')
+            _workerJsonizer.jsonizeTo(dataCategory, message, buffer)
+        except Exception as e:
+            # 書きかけの行を捨てる
+            buffer.seek(position)
+            buffer.truncate()
+            errors.append((relpath, f'{type(e).__name__}: {e}'))
+            continue
+        buffer.write('}\n')
+        count += 1
+        if withHash:
+            records.append((relpath, size, mtime, digest))
+    if _workerJsonizer.pseudonymizer is not None:
+        # 出力を返す前に、このチャンクのトークンをstoreに記録しておく
+        _workerJsonizer.pseudonymizer.flush()
+    return buffer.getvalue(), count, errors, records
+
+def convertStorage(root, outputDir, processes=None, chunksize=256, shards=None, manifest=None,
+        compression=None, rotate_bytes=None, rotate_lines=None, **kwargs):
+    # SS-MIX2標準化ストレージ全体を、プロセスプールで並列にJSON化する。
+    # outputDir/part-XXXXX.ndjsonに1行1メッセージで書き出し、失敗したファイルはerrors.ndjsonに記録する。
+    # manifest: SQLiteファイルのパス。指定すると変換済みのファイルを記録し、次回以降は
+    # 新規・更新されたファイルのみ変換して書き出す(差分変換)。
+    # compression: 'gzip', 'zstd'。rotate_bytes, rotate_lines: part-XXXXXを切り替える大きさ(圧縮後)、行数。
+    # いずれかを指定すると、part-XXXXXは圧縮と書き込みを別スレッドで行うsinks.OutputSinkに書き出す。
+    # kwargsはJsonizerにそのまま渡される。
+    # return: {'converted': 件数, 'unchanged': 前回から変更なしの件数, 'failed': 件数, 'skipped': データ種別不明の件数}
+    root = os.path.abspath(os.fspath(root))
+    processes = processes or os.cpu_count() or 1
+    shards = shards or processes
+    os.makedirs(outputDir, exist_ok=True)
+    summary = {'converted': 0, 'unchanged': 0, 'failed': 0, 'skipped': 0}
+    if manifest is not None:
+        # Pseudonymizerなどはreprで記録する(鍵そのものは含まれない)
+        manifest = Manifest(manifest, json.dumps(kwargs, sort_keys=True, default=repr))
+
+    def targetFiles():
+        for dataCategory, path in walkStorage(root):
+            if dataCategory is None:
+                summary['skipped'] += 1
+                continue
+            if manifest is None:
+                yield dataCategory, path, None
+                continue
+            stat = os.stat(path)
+            previous = manifest.lookup(os.path.relpath(path, root))
+            if previous is not None and previous[:2] == (stat.st_size, stat.st_mtime_ns):
+                summary['unchanged'] += 1
+                continue
+            yield dataCategory, path, (stat.st_size, stat.st_mtime_ns, previous[2] if previous else None)
+
+    if compression is None and rotate_bytes is None and rotate_lines is None:
+        outputs = [open(os.path.join(outputDir, f'part-{i:05d}.ndjson'), 'w', encoding='utf-8')
+            for i in range(shards)]
+    else:
+        outputs = [OutputSink(os.path.join(outputDir, f'part-{i:05d}.ndjson'), compression,
+            max_bytes=rotate_bytes, max_lines=rotate_lines) for i in range(shards)]
+    errorOutput = open(os.path.join(outputDir, 'errors.ndjson'), 'w', encoding='utf-8')
+    written = 0
+
+    def collect(future):
+        nonlocal written
+        text, count, errors, records = future.result()
+        if text:
+            output = outputs[written % shards]
+            output.write(text)
+            written += 1
+            if manifest is not None:
+                # マニフェストに記録する前に出力を書き出しておく
+                output.flush()
+        summary['converted'] += count
+        if manifest is not None:
+            # 更新日時は変わったが内容が同じファイル
+            summary['unchanged'] += len(records) - count
+        summary['failed'] += len(errors)
+        for path, error in errors:
+            errorOutput.write(json.dumps({'path': path, 'error': error}, ensure_ascii=False) + '\n')
+        if records:
+            manifest.record(records)
+
+    try:
+        with ProcessPoolExecutor(processes, initializer=_initWorker, initargs=(root, kwargs)) as executor:
+            # 走査中のファイル一覧を全てキューに積まないよう、実行中のタスク数を制限する
+            pending = set()
+            for chunk in chunked(targetFiles(), chunksize):
+                if len(pending) >= processes * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+                pending.add(executor.submit(_convertChunk, chunk, manifest is not None))
+            for future in pending:
+                collect(future)
+    finally:
+        for output in outputs:
+            output.close()
+        errorOutput.close()
+        if manifest is not None:
+            manifest.close()
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ssmix2jsonize',
+        description='SS-MIX2標準化ストレージをNDJSONに変換します。')
+    parser.add_argument('root', help='SS-MIX2標準化ストレージのルートディレクトリ')
+    parser.add_argument('output', help='出力ディレクトリ')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=256)
+    parser.add_argument('--shards', type=int, default=None, help='出力ファイル(part-XXXXX)の数。既定はプロセス数')
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], default=None,
+        help='出力を圧縮する。zstdはPython 3.14以降かzstandardパッケージが必要')
+    parser.add_argument('--rotate-mb', type=int, default=None, help='出力ファイルをこの大きさ(MB、圧縮後)ごとに切り替える')
+    parser.add_argument('--rotate-lines', type=int, default=None, help='出力ファイルをこの行数ごとに切り替える')
+    parser.add_argument('--shard-index', type=int, default=None,
+        help='分割変換で、このプロセスが変換するシャードの番号(0から)。--shard-countと共に指定する')
+    parser.add_argument('--shard-count', type=int, default=None,
+        help='分割変換のシャードの数。pid[0:3]のディレクトリをシャードに割り当て、中断しても続きから変換できる')
+    parser.add_argument('--manifest', default=None,
+        help='変換済みファイルを記録するSQLiteファイル。指定すると新規・更新されたファイルのみ変換する')
+    parser.add_argument('--no-deidentify', dest='deidentify', action='store_false')
+    parser.add_argument('--field-name-lang', choices=['en', 'ja'], default='en')
+    parser.add_argument('--element-name-lang', choices=['en', 'ja'], default='en')
+    parser.add_argument('--nest-prefix', default='')
+    parser.add_argument('--nest-suffix', default='_Nested')
+    parser.add_argument('--all-fields', dest='ssmix2_only', action='store_false',
+        help="SS-MIX2で'N'のフィールドも出力する")
+    parser.add_argument('--encoding', default='iso-2022-jp')
+    parser.add_argument('--typed-values', action='store_true',
+        help='NMを数値、DT, DTM, TMをISO 8601またはエポックミリ秒で出力する')
+    parser.add_argument('--datetime-format', choices=['iso', 'epoch'], default='iso')
+    parser.add_argument('--default-timezone', default='+0900')
+    parser.add_argument('--bytes-mode', action='store_true',
+        help='ファイルをbytesで読み、必要な行だけデコードする')
+    parser.add_argument('--pseudonym-key-file', default=None,
+        help='仮名化の鍵のファイル。指定するとPID-3などのIDを鍵つきハッシュのトークンに置き換える')
+    parser.add_argument('--token-store', default=None, help='トークンと元の値を記録するSQLiteファイル')
+    parser.add_argument('--pseudonym-fields', nargs='*', default=None, help='仮名化するフィールド(例: PID.3 PV1.19)')
+    args = parser.parse_args(argv)
+    if (args.shard_index is None) != (args.shard_count is None):
+        parser.error('--shard-index and --shard-count must be given together.')
+    if args.shard_count is not None and args.manifest is not None:
+        parser.error('--manifest cannot be used with --shard-count.')
+    if args.shard_count is not None and args.shards is not None:
+        parser.error('--shards (the number of output files) cannot be used with --shard-count.')
+    if args.shard_count is not None and (args.compression or args.rotate_mb or args.rotate_lines):
+        parser.error('--compression, --rotate-mb and --rotate-lines cannot be used with --shard-count.')
+
+    pseudonymizer = None
+    if args.pseudonym_key_file:
+        with open(args.pseudonym_key_file, 'rb') as f:
+            pseudonymizer = Pseudonymizer(f.read().strip(), store=args.token_store)
+
+    jsonizerKwargs = dict(deidentify=args.deidentify, field_name_lang=args.field_name_lang,
+        element_name_lang=args.element_name_lang, nest_prefix=args.nest_prefix,
+        nest_suffix=args.nest_suffix, ssmix2_only=args.ssmix2_only, encoding=args.encoding,
+        typed_values=args.typed_values, datetime_format=args.datetime_format,
+        default_timezone=args.default_timezone, bytes_mode=args.bytes_mode,
+        pseudonymizer=pseudonymizer, pseudonym_fields=args.pseudonym_fields)
+    if args.shard_count is not None:
+        from .shard import convertShard
+        summary = convertShard(args.root, args.output, args.shard_index, args.shard_count,
+            processes=args.processes, chunksize=args.chunksize, **jsonizerKwargs)
+    else:
+        summary = convertStorage(args.root, args.output, processes=args.processes,
+            chunksize=args.chunksize, shards=args.shards, manifest=args.manifest, compression=args.compression,
+            rotate_bytes=args.rotate_mb * 1024 * 1024 if args.rotate_mb else None, rotate_lines=args.rotate_lines,
+            **jsonizerKwargs)
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+
+class LRUCache():
+    # 件数上限つきのLRU。ヒット、ミス、追い出しの回数を数える。
+    # onEvict(key, value)を指定すると、追い出された要素を受け取れる(ディスクへの退避など)。
+    def __init__(self, maxsize=1024, onEvict=None):
+        self.maxsize = maxsize
+        self.onEvict = onEvict
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        evicted = None
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if len(self.data) > self.maxsize:
+                evicted = self.data.popitem(last=False)
+                self.evictions += 1
+        if evicted is not None and self.onEvict is not None:
+            self.onEvict(*evicted)
+
+    def items(self):
+        with self.lock:
+            return list(self.data.items())
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self.data), 'maxsize': self.maxsize, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
@@ -0,0 +1,214 @@
+import csv
+import math
+import os
+import warnings
+
+from .main import MessageContext, segmentGenerator
+from .mllp import asMessage
+from .typed import convertNumbers, parseDateTimes
+
+# OBXセグメントを、辞書を作らずにセグメントの文字列から直接、列ごとの配列に集める。
+# 数値と日時の列は文字列のまま集め、書き出すときにバッチごとにまとめて変換する(typed.py)。
+# (列名, 型) 型: 'str', 'float'(NMなど。数値でなければNaN), 'timestamp'(DTM。datetimeまたはNone)
+OBX_COLUMNS = (
+    ('ssmix2_data_category', 'str'),
+    ('message_control_id', 'str'),   # MSH-10
+    ('message_datetime', 'timestamp'), # MSH-7
+    ('patient_id', 'str'),           # PID-3の1つ目の繰り返しのID
+    ('set_id', 'str'),               # OBX-1
+    ('value_type', 'str'),           # OBX-2
+    ('observation_code', 'str'),     # OBX-3.1
+    ('observation_text', 'str'),     # OBX-3.2
+    ('coding_system', 'str'),        # OBX-3.3
+    ('value', 'str'),                # OBX-5(エスケープを解除した文字列)
+    ('numeric_value', 'float'),      # OBX-5(value_typeがNM, SNのとき)
+    ('units', 'str'),                # OBX-6.1
+    ('abnormal_flags', 'str'),       # OBX-8(繰り返しは'~'で連結)
+    ('status', 'str'),               # OBX-11
+    ('observation_datetime', 'timestamp'), # OBX-14
+)
+
+NUMERIC_VALUE_TYPES = frozenset(['NM', 'SN'])
+
+def numericText(valueType, value, context):
+    # return: 数値にする文字列。数値にしない値は''(NaNになる)
+    # SN(<comparator>^<num1>^<separator/suffix>^<num2>)は、比較演算子、区切りの無い単一の値のみ数値にする
+    if valueType == 'SN':
+        components = value.split(context.COMPONENT_SEPARATOR)
+        if len(components) > 2 and any(components[2:]) or components[0] not in ('', '='):
+            return ''
+        return components[1] if len(components) > 1 else ''
+    return value if valueType == 'NM' else ''
+
+def component(field, context, i=0):
+    components = field.split(context.COMPONENT_SEPARATOR)
+    return components[i] if i < len(components) else ''
+
+class OBXColumns():
+    # OBX_COLUMNSの列ごとのlist。floatとtimestampの列は変換前の文字列で、arrays()で変換する
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.columns = {name: [] for name, columnType in OBX_COLUMNS}
+
+    def arrays(self):
+        # return: {列名: 値}。floatの列はarray('d')(数値でなければNaN)、timestampの列はdatetimeまたはNoneのlist
+        converters = {'float': convertNumbers, 'timestamp': parseDateTimes}
+        return {name: converters[columnType](self.columns[name]) if columnType in converters else self.columns[name]
+            for name, columnType in OBX_COLUMNS}
+
+    def __len__(self):
+        return len(self.columns['value'])
+
+    def add(self, dataCategory, message, encoding='iso-2022-jp'):
+        # messageのOBXを行として追加する。return: 追加した行数
+        context = MessageContext()
+        columns = self.columns
+        controlId = messageDatetime = None
+        patientId = ''
+        count = 0
+        if type(message) is str and message.startswith('MSH'):
+            # メッセージの文字列。MSHだけ(改行を含まない)でもファイルのパスとみなさない
+            message = asMessage(message)
+        for segment in segmentGenerator(message, encoding):
+            segmentType = segment[:3]
+            if segmentType == 'MSH':
+                context.setEncodingCharacters(segment)
+                fields = segment.split(context.FIELD_SEPARATOR)
+                # MSHはMSH-1が区切り文字そのものなので、MSH-nはfields[n-1]
+                messageDatetime = fields[6] if len(fields) > 6 else ''
+                controlId = fields[9] if len(fields) > 9 else ''
+                continue
+            if segmentType == 'PID':
+                fields = segment.split(context.FIELD_SEPARATOR)
+                if len(fields) > 3:
+                    patientId = component(fields[3].split(context.REPETITION_SEPARATOR)[0], context)
+                continue
+            if segmentType != 'OBX':
+                continue
+            fields = segment.split(context.FIELD_SEPARATOR)
+            fields += [''] * (15 - len(fields))
+            valueType = fields[2]
+            value = fields[5]
+            code = fields[3].split(context.COMPONENT_SEPARATOR)
+            code += [''] * (3 - len(code))
+            columns['ssmix2_data_category'].append(dataCategory)
+            columns['message_control_id'].append(controlId)
+            columns['message_datetime'].append(messageDatetime)
+            columns['patient_id'].append(patientId)
+            columns['set_id'].append(fields[1])
+            columns['value_type'].append(valueType)
+            columns['observation_code'].append(context.removeEscape(code[0]))
+            columns['observation_text'].append(context.removeEscape(code[1]))
+            columns['coding_system'].append(code[2])
+            columns['value'].append(context.removeEscape(value) if context.ESCAPE_CHARACTER in value else value)
+            columns['numeric_value'].append(numericText(valueType, value, context)
+                if valueType in NUMERIC_VALUE_TYPES else '')
+            columns['units'].append(context.removeEscape(component(fields[6], context)))
+            columns['abnormal_flags'].append('~'.join(flag for flag in fields[8].split(context.REPETITION_SEPARATOR) if flag))
+            columns['status'].append(fields[11])
+            columns['observation_datetime'].append(fields[14])
+            count += 1
+        return count
+
+class OBXColumnarWriter():
+    # OBXを列形式で書き出す。batch_size行ごとにまとめて書き出す。
+    # format: 'parquet'(pyarrowが必要), 'csv', 'npz'(numpyが必要。バッチごとに<path>-XXXXX.npz)
+    # Noneならpyarrowがあればparquet、無ければcsv
+    def __init__(self, path, format=None, batch_size=65536, encoding='iso-2022-jp'):
+        if format is None:
+            try:
+                import pyarrow
+                format = 'parquet'
+            except ImportError:
+                format = 'csv'
+        if format not in ('parquet', 'csv', 'npz'):
+            raise ValueError(f'format must be "parquet", "csv" or "npz". {format} was given.')
+        self.path = os.fspath(path)
+        self.format = format
+        self.batchSize = batch_size
+        self.encoding = encoding
+        self.buffer = OBXColumns()
+        self.rows = 0
+        self.batches = 0
+        self._writer = None
+
+    def add(self, dataCategory, message):
+        count = self.buffer.add(dataCategory, message, self.encoding)
+        if len(self.buffer) >= self.batchSize:
+            self.flush()
+        return count
+
+    def flush(self):
+        if not len(self.buffer):
+            return
+        getattr(self, f'_write{self.format.capitalize()}')(self.buffer.arrays())
+        self.rows += len(self.buffer)
+        self.batches += 1
+        self.buffer.clear()
+
+    def _writeParquet(self, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        types = {'str': pa.string(), 'float': pa.float64(), 'timestamp': pa.timestamp('us')}
+        table = pa.table({name: pa.array(columns[name], type=types[columnType], from_pandas=True)
+            for name, columnType in OBX_COLUMNS})
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def _writeCsv(self, columns):
+        if self._writer is None:
+            self._file = open(self.path, 'w', encoding='utf-8', newline='')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow([name for name, columnType in OBX_COLUMNS])
+        formatted = []
+        for name, columnType in OBX_COLUMNS:
+            if columnType == 'float':
+                formatted.append(['' if math.isnan(v) else repr(v) for v in columns[name]])
+            elif columnType == 'timestamp':
+                formatted.append(['' if v is None else v.isoformat() for v in columns[name]])
+            else:
+                formatted.append(columns[name])
+        self._writer.writerows(zip(*formatted))
+
+    def _writeNpz(self, columns):
+        import numpy as np
+        arrays = {}
+        for name, columnType in OBX_COLUMNS:
+            if columnType == 'float':
+                arrays[name] = np.frombuffer(columns[name], dtype=np.float64)
+            elif columnType == 'timestamp':
+                arrays[name] = np.array(['NaT' if v is None else v.isoformat() for v in columns[name]],
+                    dtype='datetime64[us]')
+            else:
+                arrays[name] = np.array(columns[name], dtype=str)
+        np.savez_compressed(f'{self.path}-{self.batches:05d}.npz', **arrays)
+
+    def close(self):
+        self.flush()
+        if self._writer is not None and self.format == 'parquet':
+            self._writer.close()
+        elif self._writer is not None and self.format == 'csv':
+            self._file.close()
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def exportStorage(root, path, format=None, batch_size=65536, encoding='iso-2022-jp'):
+    # SS-MIX2標準化ストレージのOBXを列形式で書き出す。return: 書き出した行数
+    from .bulk import walkStorage
+    with OBXColumnarWriter(path, format, batch_size, encoding) as writer:
+        for dataCategory, filePath in walkStorage(root):
+            if dataCategory is None:
+                continue
+            try:
+                writer.add(dataCategory, filePath)
+            except (OSError, UnicodeDecodeError) as e:
+                warnings.warn(f'{filePath}: {type(e).__name__}: {e}')
+    return writer.rows
@@ -0,0 +1,139 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from decimal import Decimal
+
+from .cache import LRUCache
+from .main import Jsonizer
+
+def readMessage(message, encoding):
+    # return: (ハッシュ用のバイト列, jsonizerに渡すメッセージ)
+    # ファイルは一度だけ読み、そのバイト列から変換する
+    if isinstance(message, (bytes, bytearray)):
+        raw = bytes(message)
+    elif isinstance(message, str) and ('\r' in message or '\n' in message):
+        return message.encode('utf-8'), message
+    elif isinstance(message, (str, os.PathLike)):
+        with open(message, 'rb') as f:
+            raw = f.read()
+    else:
+        lines = [line.rstrip() for line in message]
+        return '\r'.join(lines).encode('utf-8'), lines
+    # ファイルを開いたときと同じく、改行はuniversal newlinesで扱う
+    return raw, io.StringIO(raw.decode(encoding), newline=None)
+
+class MessageDeduplicator():
+    # データ種別とバイト列が同じメッセージを重複として検出し、変換結果(JSONテキスト)を再利用する。
+    # 変換結果は件数上限つきのLRUに保持し、spillにSQLiteファイルのパスを指定すると、
+    # LRUから追い出された結果とclose時の結果をそこに退避して、次回以降の実行でも再利用する。
+    # 追い出された結果はbatch_size件ごとにコミットするので、途中で止まっても退避済みの結果は失われない。
+    def __init__(self, jsonizer=None, maxsize=4096, spill=None, batch_size=1024, **kwargs):
+        self.jsonizer = jsonizer or Jsonizer(**kwargs)
+        self.messages = 0
+        self.duplicates = 0
+        self.lock = threading.Lock()
+        self.batchSize = batch_size
+        self.uncommitted = 0 # コミットしていない退避の件数
+        self.spill = None
+        if spill is not None:
+            import sqlite3
+            self.spill = sqlite3.connect(spill, check_same_thread=False)
+            self.spill.execute('CREATE TABLE IF NOT EXISTS messages (key TEXT PRIMARY KEY, value TEXT)')
+            self.spill.commit()
+        self.cache = LRUCache(maxsize, onEvict=self._spill if self.spill is not None else None)
+
+    def _spill(self, key, value):
+        if value is None or self.spill is None:
+            return
+        with self.lock:
+            self.spill.execute('INSERT OR REPLACE INTO messages VALUES (?, ?)', (key, value))
+            self.uncommitted += 1
+            if self.uncommitted >= self.batchSize:
+                self.spill.commit()
+                self.uncommitted = 0
+
+    def _lookup(self, key):
+        # return: (見つかったか, JSONテキストまたはNone)
+        value = self.cache.get(key, self)
+        if value is not self:
+            return True, value
+        if self.spill is None:
+            return False, None
+        with self.lock:
+            row = self.spill.execute('SELECT value FROM messages WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return False, None
+        self.cache.put(key, row[0])
+        return True, row[0]
+
+    def key(self, dataCategory, raw):
+        configKey = self.jsonizer.jsonizerDict[dataCategory].configKey()
+        h = hashlib.sha1(f'{dataCategory}\0{configKey!r}\0'.encode('utf-8'))
+        h.update(raw)
+        return h.hexdigest()
+
+    def _prepare(self, dataCategory, message):
+        raw, source = readMessage(message, self.jsonizer.jsonizerDict[dataCategory].encoding)
+        key = self.key(dataCategory, raw)
+        found, text = self._lookup(key)
+        with self.lock:
+            self.messages += 1
+            if found:
+                self.duplicates += 1
+        return key, source, found, text
+
+    def isDuplicate(self, dataCategory, message):
+        # 変換せずに重複かどうかだけを返し、メッセージを既出として記録する
+        key, source, found, text = self._prepare(dataCategory, message)
+        if not found:
+            self.cache.put(key, None)
+        return found
+
+    def jsonize(self, dataCategory, message):
+        # Jsonizer.jsonizeと同じ。重複していれば保存してある結果から復元する(呼び出しごとに別のdict)
+        key, source, found, text = self._prepare(dataCategory, message)
+        jsonizer = self.jsonizer.jsonizerDict[dataCategory]
+        if text is not None:
+            if jsonizer.typed is None or jsonizer.typed[0] != 'decimal':
+                return json.loads(text)
+            # numeric_type='decimal'の数値はDecimalに戻す。出力の整数はNMかエポックミリ秒だけなので、
+            # datetime_format='epoch'では整数のNMはintになる
+            return json.loads(text, parse_float=Decimal, parse_int=Decimal if jsonizer.typed[1] != 'epoch' else None)
+        d = self.jsonizer.jsonize(dataCategory, source)
+        self.cache.put(key, jsonizer.jsonEncoder()(d))
+        return d
+
+    def jsonizeTo(self, dataCategory, message, fp):
+        # Jsonizer.jsonizeToと同じ。return: 重複していたか
+        key, source, found, text = self._prepare(dataCategory, message)
+        if text is None:
+            buffer = io.StringIO()
+            self.jsonizer.jsonizeTo(dataCategory, source, buffer)
+            text = buffer.getvalue()
+            self.cache.put(key, text)
+        fp.write(text)
+        return found
+
+    def stats(self):
+        stats = self.cache.stats()
+        with self.lock:
+            stats.update(messages=self.messages, duplicates=self.duplicates)
+        return stats
+
+    def close(self):
+        if self.spill is None:
+            return
+        with self.lock:
+            self.spill.executemany('INSERT OR REPLACE INTO messages VALUES (?, ?)',
+                [(key, value) for key, value in self.cache.items() if value is not None])
+            self.spill.commit()
+            self.spill.close()
+        self.spill = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,65 @@
+import threading
+import warnings
+from collections import namedtuple
+
+# 変換中に見つかったデータの問題。
+# code: 問題の種類(ISSUE_MESSAGESのキー), segment: セグメント型, field: フィールドのシーケンス番号,
+# offset: メッセージ内のセグメントの位置(0始まり), value: 問題のあった値
+Issue = namedtuple('Issue', ['code', 'segment', 'field', 'offset', 'value'])
+
+# 警告として出すときの文言。Noneのコードは警告を出さない(記録と集計のみ)
+ISSUE_MESSAGES = {
+    'DT_FORMAT': '{value} does not match DT pattern (ex)20210805.',
+    'DTM_FORMAT': '{value} does not match DTM pattern (ex)20210805020000.00+0900',
+    'TM_FORMAT': '{value} does not match TM pattern (ex)090000.000+0900',
+    'NM_FORMAT': None,
+    'UNCLOSED_ESCAPE': 'Escapeが閉じていません: "{value}"',
+    'COMPLEX_SUBCOMPONENT': 'Subcomponent "{value}" consists of Complex DataType: "{dataType}".',
+    'OBX2_INVALID': 'OBX-2 must be values on HL7 table 0125, but "{value}". Whole segment: {segmentText}',
+    'UNDEFINED_SEGMENT': 'Undefined segment type: {value} in {dataCategory}. Message: {message}',
+}
+
+class Diagnostics():
+    # 問題をコードごとに数え、一部を記録する。Jsonizer(diagnostics=Diagnostics())で指定する。
+    # warn: 問題をwarnings.warnでも通知する(既定のjsonizerと同じ文言)
+    # sample: コードごとに記録するIssueの数(最初のsample件)
+    # rate_limits: {code: 件数}。コードごとに、警告とsampleへの記録を行う上限。上限を超えた問題は数えるだけ
+    # default_rate_limit: rate_limitsに無いコードの上限。Noneなら上限なし
+    # 警告の文言を作るのは警告を出すときだけなので、warn=Falseなら問題の多いデータでも遅くならない。
+    def __init__(self, warn=False, sample=100, rate_limits=None, default_rate_limit=None):
+        self.warn = warn
+        self.sample = sample
+        self.rateLimits = dict(rate_limits or {})
+        self.defaultRateLimit = default_rate_limit
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.samples = {}
+
+    def report(self, code, value, segment=None, field=None, offset=None, issues=None, **details):
+        # issues: メッセージごとの問題のリスト。Noneでなければ追加する
+        with self.lock:
+            count = self.counts.get(code, 0) + 1
+            self.counts[code] = count
+            limit = self.rateLimits.get(code, self.defaultRateLimit)
+            limited = limit is not None and count > limit
+            issue = None
+            if not limited and count <= self.sample:
+                issue = Issue(code, segment, field, offset, value)
+                self.samples.setdefault(code, []).append(issue)
+        if issues is not None:
+            issues.append(issue or Issue(code, segment, field, offset, value))
+        if self.warn and not limited and ISSUE_MESSAGES.get(code) is not None:
+            warnings.warn(ISSUE_MESSAGES[code].format(value=value, **details))
+
+    def stats(self):
+        # return: {code: 件数}
+        with self.lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+            self.samples.clear()
+
+# diagnosticsを指定しないjsonizerが使う。従来どおり警告を出し、記録はしない
+WARNINGS = Diagnostics(warn=True, sample=0)
@@ -0,0 +1,169 @@
+import hashlib
+import http.client
+import io
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from .main import Jsonizer, segmentGenerator
+from .mllp import asMessage
+
+# Elasticsearchの_bulk API向けに、アクション行とドキュメント行の組をNDJSONで書き出す。
+# 1回のリクエスト(チャンク)はmax_bytesとmax_docsのどちらかに達したところで区切る。
+
+def documentId(dataCategory, segments):
+    # _id: <データ種別>_<MSH-10(メッセージ制御ID)>。MSH-10が無ければ、メッセージ全体のハッシュ
+    msh = segments[0] if segments else ''
+    fields = msh.split(msh[3]) if msh.startswith('MSH') and len(msh) > 3 else []
+    controlId = fields[9] if len(fields) > 9 else ''
+    if controlId:
+        return f'{dataCategory}_{controlId}'
+    digest = hashlib.sha1('\r'.join(segments).encode('utf-8')).hexdigest()
+    return f'{dataCategory}_{digest}'
+
+class BulkWriter():
+    # send(body)にチャンク(bytes)を渡す。sendにはHTTPSenderや、ファイルのwriteなどを指定する。
+    # op_type: 'index'(上書き)または'create'(既存の_idはエラー)
+    # id_function(dataCategory, segments): _idを返す関数
+    def __init__(self, send, index, jsonizer=None, max_bytes=5*1024*1024, max_docs=1000,
+        op_type='index', id_function=documentId, **kwargs):
+        self.send = send
+        self.index = index
+        self.jsonizer = jsonizer or Jsonizer(**kwargs)
+        self.maxBytes = max_bytes
+        self.maxDocs = max_docs
+        self.opType = op_type
+        self.idFunction = id_function
+        self.chunk = []
+        self.chunkBytes = 0
+        self.docs = 0
+        self.chunks = 0
+
+    def add(self, dataCategory, message):
+        # message: メッセージの文字列、bytes、ファイルのパス、またはセグメントのiterable。return: ドキュメントの_id
+        if type(message) is str and message.startswith('MSH'):
+            # メッセージの文字列。MSHだけ(改行を含まない)でもファイルのパスとみなさない
+            message = asMessage(message)
+        segments = list(segmentGenerator(message, self.jsonizer.jsonizerDict[dataCategory].encoding))
+        docId = self.idFunction(dataCategory, segments)
+        buffer = io.StringIO()
+        buffer.write(json.dumps({self.opType: {'_index': self.index, '_id': docId}}, ensure_ascii=False))
+        buffer.write('\n')
+        self.jsonizer.jsonizeTo(dataCategory, segments, buffer)
+        buffer.write('\n')
+        pair = buffer.getvalue().encode('utf-8')
+        # max_bytesより大きいドキュメントは単独のチャンクにする
+        if self.chunk and (self.chunkBytes + len(pair) > self.maxBytes or len(self.chunk) >= self.maxDocs):
+            self.flush()
+        self.chunk.append(pair)
+        self.chunkBytes += len(pair)
+        self.docs += 1
+        return docId
+
+    def flush(self):
+        if not self.chunk:
+            return
+        body = b''.join(self.chunk)
+        self.chunk = []
+        self.chunkBytes = 0
+        self.chunks += 1
+        self.send(body)
+
+    def close(self):
+        self.flush()
+        close = getattr(self.send, 'close', None)
+        if close is not None:
+            close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class BulkError(Exception):
+    pass
+
+class HTTPSender():
+    # チャンクを_bulk APIにPOSTする。最大concurrency件を並行して送り、それ以上は送信が終わるまで待つ(背圧)。
+    # 429と5xx、接続エラー、レスポンスが読めない(途中で切れた、JSONでない)場合はbackoff秒から倍々に待って最大retries回再送する。
+    # 再送しても失敗したチャンクと、レスポンスのitemsでエラーになったドキュメントはfailuresに記録する。
+    # url: _bulk APIのURL(http://localhost:9200/_bulkなど)
+    def __init__(self, url, concurrency=4, retries=3, backoff=0.5, timeout=30, headers=None):
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/x-ndjson', **(headers or {})}
+        self.executor = ThreadPoolExecutor(concurrency)
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+        self.failures = [] # [(_id or None, エラー), ...]
+        self.futures = set() # 送信中か、予期しない例外で終わった送信
+
+    def __call__(self, body):
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(self._post, body)
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        # 予期しない例外で終わった送信は、closeで送出するために残す
+        if future.exception() is None:
+            with self.lock:
+                self.futures.discard(future)
+        self.slots.release()
+
+    def _post(self, body):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self.lock:
+                    self.retried += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            request = urllib.request.Request(self.url, data=body, headers=self.headers, method='POST')
+            try:
+                with self.lock:
+                    self.requests += 1
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    result = json.loads(response.read().decode('utf-8'))
+                if not isinstance(result, dict):
+                    raise ValueError(f'unexpected response: {type(result).__name__}')
+            except urllib.error.HTTPError as e:
+                error = f'HTTP {e.code}'
+                if e.code == 429 or e.code >= 500:
+                    continue
+                break
+            except (urllib.error.URLError, OSError, http.client.HTTPException, ValueError) as e:
+                error = f'{type(e).__name__}: {e}'
+                continue
+            if result.get('errors'):
+                with self.lock:
+                    for item in result.get('items', []):
+                        action = next(iter(item.values()))
+                        if 'error' in action:
+                            self.failures.append((action.get('_id'), action['error']))
+            return
+        with self.lock:
+            self.failures.append((None, error))
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'retried': self.retried, 'failures': len(self.failures)}
+
+    def close(self):
+        # 送信中のチャンクを待つ。予期しない例外で終わった送信があればその例外、失敗があればBulkError
+        self.executor.shutdown(wait=True)
+        for future in self.futures:
+            future.result()
+        if self.failures:
+            raise BulkError(f'{len(self.failures)} failures: {self.failures[:3]}')
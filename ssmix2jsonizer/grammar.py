@@ -0,0 +1,174 @@
+# データ種別ごとの、セグメントを出力のどこに追加するかの規則(文法)。
+# jsonizerごとにネスト名(nest_prefix + 名前 + nest_suffix)を埋め込んだ追加関数にコンパイルし、
+# セグメント型から追加関数を辞書で引く。データ種別を増やすときはMESSAGE_GRAMMARSに規則を足す。
+#
+# 規則
+#   (SET, path)                 要素[セグメント型] = 値
+#   (SET_NESTED, path)          要素[ネスト名(セグメント型)] = 値
+#   (APPEND, path)              要素.setdefault(ネスト名(セグメント型), []).append(値)
+#   (START, path, group)        要素.setdefault(ネスト名(group), []).append({セグメント型: 値})。グループの要素を始める
+#   (CHOOSE, test, 規則, 規則)  testが真なら1つ目、偽なら2つ目の規則
+# path: dからたどるグループ名のタプル。グループのリストの最後の要素をたどる(無ければKeyError)。
+#   OPEN(group)は、リストが無ければ[{}]で始める
+# test
+#   (HAS, path, group)          要素にネスト名(group)がある
+#   (HAS_SEGMENT, path)         要素にセグメント型がある
+#   (HAS_SEGMENT_OR_MISSING, path)  要素にセグメント型がある、またはpathのグループが無い
+# SET, SET_NESTEDは値を作って(jsonizeSegment)から要素をたどり、それ以外は要素をたどってから値を作る
+# (書き換える前のif/elifの代入文、setdefault(...).append(...)の評価順と同じ)。
+
+SET = 'set'
+SET_NESTED = 'setNested'
+APPEND = 'append'
+START = 'start'
+CHOOSE = 'choose'
+HAS = 'has'
+HAS_SEGMENT = 'hasSegment'
+HAS_SEGMENT_OR_MISSING = 'hasSegmentOrMissing'
+
+def OPEN(group):
+    return (group,)
+
+HEADER = {'MSH': (SET, ()), 'PID': (SET, ()), 'PV1': (SET, ())}
+ALLERGY = {'AL1': (APPEND, ())}
+ORDER = {'ORC': (START, (), 'ORDER')}
+# RXAの後のRXRはADMINISTRATIONの要素に、それより前はORDERの要素に入る
+ADMINISTRATION_RXR = (CHOOSE, (HAS, ('ORDER',), 'ADMINISTRATION'),
+    (SET, ('ORDER', 'ADMINISTRATION')), (APPEND, ('ORDER',)))
+# nest内の初の要素が繰り返し
+ADMINISTRATION_RXA = (APPEND, ('ORDER', OPEN('ADMINISTRATION')))
+
+MESSAGE_GRAMMARS = {
+    'ADT': {'MSH': (SET, ()), 'EVN': (SET, ()), 'PID': (SET, ()), 'PV1': (SET, ()), 'PV2': (SET, ()),
+        'NK1': (APPEND, ()), 'DB1': (APPEND, ()), 'OBX': (APPEND, ()), 'AL1': (APPEND, ()), 'IN1': (APPEND, ())},
+    'ADT-61': {'MSH': (SET, ()), 'EVN': (SET, ()), 'PID': (SET, ()), 'PV1': (SET, ()), 'IAM': (APPEND, ())},
+    'PPR-01': {'MSH': (SET, ()), 'PID': (SET, ()), 'PRB': (START, (), 'PROBLEM'), 'ZPR': (SET, ('PROBLEM',)),
+        'ZPD': (APPEND, ('PROBLEM',)), 'ZI1': (APPEND, ('PROBLEM',)), 'ORC': (APPEND, ('PROBLEM',))},
+    'OMD': {**HEADER, **ALLERGY, **ORDER, 'TQ1': (APPEND, ('ORDER',)), 'ODS': (APPEND, ('ORDER',))},
+    # TQ1: 「[SS-MIX2] ORC、RXE に対して常に１件しか使用しない。」
+    'OMP-01': {**HEADER, **ALLERGY, **ORDER, 'TQ1': (SET, ('ORDER',)), 'RXE': (SET, ('ORDER',)),
+        'RXR': (APPEND, ('ORDER',))},
+    'OMP-11': {**HEADER, **ALLERGY, **ORDER, 'TQ1': (SET, ('ORDER',)), 'RXE': (SET, ('ORDER',)),
+        'RXR': ADMINISTRATION_RXR, 'RXA': ADMINISTRATION_RXA},
+    'OMP-02': {**HEADER, **ALLERGY, **ORDER, 'TQ1': (SET, ('ORDER',)), 'RXE': (SET, ('ORDER',)),
+        'RXR': (APPEND, ('ORDER',)), 'RXC': (APPEND, ('ORDER',)), 'OBX': (APPEND, ('ORDER',)),
+        'CTI': (APPEND, ('ORDER',))},
+    'OMP-12': {**HEADER, **ALLERGY, **ORDER, 'TQ1': (SET, ('ORDER',)), 'RXE': (SET, ('ORDER',)),
+        'RXC': (APPEND, ('ORDER',)), 'RXR': ADMINISTRATION_RXR, 'RXA': ADMINISTRATION_RXA,
+        'OBX': (APPEND, ('ORDER', 'ADMINISTRATION')), 'CTI': (APPEND, ('ORDER',))},
+    'OML-01': {**HEADER, **ALLERGY, 'SPM': (START, (), 'SPECIMEN'), 'ORC': (SET, ('SPECIMEN', OPEN('ORDER'))),
+        'TQ1': (SET, ('SPECIMEN', 'ORDER')), 'OBR': (SET, ('SPECIMEN', 'ORDER')),
+        'OBX': (APPEND, ('SPECIMEN', 'ORDER'))},
+    'OML-11': {**HEADER, 'SPM': (START, (), 'SPECIMEN'), 'OBR': (SET_NESTED, ('SPECIMEN', OPEN('ORDER'))),
+        'ORC': (SET, ('SPECIMEN', 'ORDER')), 'OBX': (APPEND, ('SPECIMEN', 'ORDER'))},
+    'OMG-01': {**HEADER, **ORDER, 'TQ1': (APPEND, ('ORDER',)), 'OBX': (APPEND, ('ORDER',)),
+        'OBR': (SET, ('ORDER',))},
+    'OMG-11': {**HEADER, **ORDER, 'OBX': (APPEND, ('ORDER',)), 'ZE1': (APPEND, ('ORDER',)),
+        'IPC': (APPEND, ('ORDER',)), 'TQ1': (SET, ('ORDER',)), 'OBR': (SET, ('ORDER',)),
+        'ZE2': (APPEND, ('ORDER', 'ZE1'))},
+    'OMG-02': {**HEADER, **ORDER, 'TQ1': (APPEND, ('ORDER',)), 'OBX': (APPEND, ('ORDER',)),
+        'OBR': (SET, ('ORDER',))},
+    # 2つ目以降のOBRはZE1の要素に入る
+    'OMG-12': {**HEADER, **ORDER, 'TQ1': (APPEND, ('ORDER',)), 'OBX': (APPEND, ('ORDER',)),
+        'ZE1': (APPEND, ('ORDER',)), 'IPC': (APPEND, ('ORDER',)),
+        'OBR': (CHOOSE, (HAS_SEGMENT, ('ORDER',)), (APPEND, ('ORDER', 'ZE1')), (SET, ('ORDER',)))},
+    'OMG-03': {**HEADER, **ALLERGY, **ORDER, 'TQ1': (APPEND, ('ORDER',)), 'OBX': (APPEND, ('ORDER',)),
+        'OBR': (SET, ('ORDER',))},
+    # 直前のORCが省略されていて、ORDERブロックを開始し、要素を開始する時
+    # ORDERブロックは存在するものの、直前のORCが省略されていて、ORDERブロックの要素を開始する時
+    'OMG-13': {**HEADER, **ORDER, 'TQ1': (APPEND, ('ORDER',)), 'OBX': (APPEND, ('ORDER',)),
+        'OBR': (CHOOSE, (HAS_SEGMENT_OR_MISSING, ('ORDER',)), (START, (), 'ORDER'), (SET, ('ORDER',)))},
+}
+
+_GRAMMAR_CACHE = {}
+
+def compileSteps(path, nested):
+    # return: ((キー, リストが無ければ[{}]で始めるか), ...)
+    return tuple((nested(step[0]), True) if type(step) is tuple else (nested(step), False) for step in path)
+
+def walk(d, steps):
+    for key, opens in steps:
+        d = (d.setdefault(key, [{}]) if opens else d[key])[-1]
+    return d
+
+def compileTest(test, segmentType, nested):
+    kind, path = test[0], test[1]
+    steps = compileSteps(path, nested)
+    if kind == HAS:
+        key = nested(test[2])
+        return lambda d: key in walk(d, steps)
+    if kind == HAS_SEGMENT:
+        return lambda d: segmentType in walk(d, steps)
+    if kind == HAS_SEGMENT_OR_MISSING:
+        def test(d):
+            for key, opens in steps:
+                if key not in d:
+                    return True
+                d = d[key][-1]
+            return segmentType in d
+        return test
+    raise ValueError(f'Unknown test in grammar: {kind}')
+
+def compileRule(rule, segmentType, nested):
+    # return: add(d, segment, context, jsonizeSegment)
+    op = rule[0]
+    if op == CHOOSE:
+        test = compileTest(rule[1], segmentType, nested)
+        ifTrue = compileRule(rule[2], segmentType, nested)
+        ifFalse = compileRule(rule[3], segmentType, nested)
+        def add(d, segment, context, jsonizeSegment):
+            (ifTrue if test(d) else ifFalse)(d, segment, context, jsonizeSegment)
+        return add
+    steps = compileSteps(rule[1], nested)
+    if op in (SET, SET_NESTED):
+        key = segmentType if op == SET else nested(segmentType)
+        if not steps:
+            def add(d, segment, context, jsonizeSegment):
+                d[key] = jsonizeSegment(segment, context)
+        else:
+            def add(d, segment, context, jsonizeSegment):
+                value = jsonizeSegment(segment, context)
+                walk(d, steps)[key] = value
+        return add
+    if op == APPEND:
+        key = nested(segmentType)
+        if not steps:
+            def add(d, segment, context, jsonizeSegment):
+                d.setdefault(key, []).append(jsonizeSegment(segment, context))
+        else:
+            def add(d, segment, context, jsonizeSegment):
+                walk(d, steps).setdefault(key, []).append(jsonizeSegment(segment, context))
+        return add
+    if op == START:
+        key = nested(rule[2])
+        def add(d, segment, context, jsonizeSegment):
+            walk(d, steps).setdefault(key, []).append({segmentType: jsonizeSegment(segment, context)})
+        return add
+    raise ValueError(f'Unknown rule in grammar: {op}')
+
+def compileGrammar(dataCategory, nestPrefix='', nestSuffix='_Nested'):
+    # return: {セグメント型: add(d, segment, context, jsonizeSegment)}。同じ設定なら共有する
+    key = (dataCategory, nestPrefix, nestSuffix)
+    if key not in _GRAMMAR_CACHE:
+        nested = lambda name: nestPrefix + name + nestSuffix
+        _GRAMMAR_CACHE[key] = {segmentType: compileRule(rule, segmentType, nested)
+            for segmentType, rule in MESSAGE_GRAMMARS[dataCategory].items()}
+    return _GRAMMAR_CACHE[key]
+
+def ruleGroup(rule):
+    # return: 規則の追加先のトップレベルのグループ名。トップレベルに直接追加するならNone
+    if rule[0] == CHOOSE:
+        return ruleGroup(rule[2]) or ruleGroup(rule[3])
+    path = rule[1]
+    if path:
+        return path[0][0] if type(path[0]) is tuple else path[0]
+    return rule[2] if rule[0] == START else None
+
+def segmentGroups(dataCategory):
+    # return: {グループ名: [セグメント型, ...]}。jsonizeToで、グループの要素が確定したかの判定に使う
+    groups = {}
+    for segmentType, rule in MESSAGE_GRAMMARS[dataCategory].items():
+        group = ruleGroup(rule)
+        if group is not None:
+            groups.setdefault(group, []).append(segmentType)
+    return groups
@@ -0,0 +1,111 @@
+import codecs
+import io
+
+# bytesのままセグメントに分割し、必要な部分だけをデコードする(jsonizerのbytes_mode)。
+# ISO-2022-JPでは、区切り文字(|^~\&)やCR, LFのバイトはASCIIの状態でしか区切り文字にならない。
+# 漢字の状態(ESC $ B)では'|'も2バイト文字の片割れになり('淫'は0x30 0x7C)、状態は改行をまたいで続く。
+# そこで行ごとに行頭の状態を追跡し、
+#   - ASCIIの状態で始まりESCを含まない行は、'ascii'でデコードする(コーデックを通すより速い)
+#   - それ以外の行は、行頭の状態のエスケープシーケンスを前に付けてコーデックでデコードする
+#   - 射影で選ばれていないセグメント、匿名化で全体を伏せるセグメントは、ASCIIの状態で始まる行ならデコードせず、
+#     状態だけを追跡してセグメント型を返す(jsonizeSegmentはセグメント型しか見ない)
+# 結果は、ファイルをテキストとして1行ずつ読んだ場合(segmentGenerator)と同じ。
+# ただし、デコードしないセグメントに不正なバイトがあっても例外にならない。
+
+ESCAPE = 0x1b
+ESCAPE_BYTES = b'\x1b'
+# ASCIIに戻すエスケープシーケンス。ESC ( JはJIS X 0201ローマ字('\'が'¥'になる)なのでASCIIとはみなさない
+ASCII_DESIGNATION = b'\x1b(B'
+ESCAPE_SEQUENCE_LENGTH = 3
+# 1バイトの区切り文字と改行が、マルチバイト文字の途中に現れない文字コード
+LINE_SAFE_CODECS = frozenset(['utf-8', 'ascii', 'euc_jp', 'cp1252', 'iso8859-1'])
+
+def readBytes(message):
+    # message: bytes、またはファイルのパス
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        return bytes(message)
+    with open(message, 'rb') as f:
+        return f.read()
+
+def shiftAfter(line, shift):
+    # return: 行末で有効なエスケープシーケンス。ASCIIならb''
+    i = line.rfind(ESCAPE_BYTES)
+    if i < 0:
+        return shift
+    designation = line[i:i + ESCAPE_SEQUENCE_LENGTH]
+    return b'' if designation == ASCII_DESIGNATION else designation
+
+def decodeSegments(data, encoding='iso-2022-jp', wanted=None, masked=frozenset()):
+    # data: bytes。return: rstripしたセグメントの文字列をyieldする
+    # wanted: デコードするセグメント型(bytes)の集合(Noneなら全て)。masked: デコードしないセグメント型(bytes)の集合
+    # デコードしないセグメントは、セグメント型の文字列だけをyieldする
+    name = codecs.lookup(encoding).name
+    if name == 'iso2022_jp':
+        yield from _decodeStateful(data, encoding, wanted, masked)
+    elif name in LINE_SAFE_CODECS:
+        yield from _decodeLines(data, encoding, wanted, masked)
+    else:
+        # Shift_JIS、UTF-16などは、テキストとして読む
+        with io.TextIOWrapper(io.BytesIO(data), encoding) as f:
+            for segment in f:
+                yield segment.rstrip()
+
+def _segmentTypeOnly(line, segmentType, separator, types):
+    # return: デコードを省けるならセグメント型の文字列、省けなければNone
+    if line[3:4] != separator or segmentType == b'MSH' or not segmentType.isascii() or ESCAPE in segmentType:
+        return None
+    if segmentType not in types:
+        types[segmentType] = segmentType.decode('ascii')
+    return types[segmentType]
+
+def _decodeStateful(data, encoding, wanted, masked):
+    # コーデックは呼び出しごとの費用より1バイトあたりの費用が大きいので、ESCを含む行(と漢字の状態で始まる行)
+    # だけを集め、行末でASCIIに戻して1回でデコードする。ESCを含まない行は'ascii'でデコードする
+    lines = data.splitlines()
+    segments = [None] * len(lines)
+    shifted = [] # コーデックでデコードする行の位置
+    buffer = []
+    shift = b'' # 行頭で有効なエスケープシーケンス
+    separator = b'|'
+    types = {}
+    for i, line in enumerate(lines):
+        if line[:3] == b'MSH':
+            separator = line[3:4]
+        segmentType = line[:3]
+        if not shift and (segmentType in masked or wanted is not None and segmentType not in wanted):
+            segmentType = _segmentTypeOnly(line, segmentType, separator, types)
+            if segmentType is not None:
+                segments[i] = segmentType
+                if ESCAPE in line:
+                    shift = shiftAfter(line, shift)
+                continue
+        if not shift and ESCAPE not in line and line.isascii():
+            segments[i] = line.decode('ascii').rstrip()
+            continue
+        # ASCII以外のバイト(不正なバイト)もコーデックに任せ、同じ例外を出す
+        shifted.append(i)
+        buffer.append(shift + line + ASCII_DESIGNATION)
+        shift = shiftAfter(line, shift)
+    if shifted:
+        for i, segment in zip(shifted, b'\n'.join(buffer).decode(encoding).split('\n')):
+            segments[i] = segment.rstrip()
+    return segments
+
+def _decodeLines(data, encoding, wanted, masked):
+    separator = b'|'
+    types = {}
+    for line in data.splitlines():
+        segmentType = line[:3]
+        if segmentType in masked or wanted is not None and segmentType not in wanted:
+            segmentType = _segmentTypeOnly(line, segmentType, separator, types)
+            if segmentType is not None:
+                yield segmentType
+                continue
+        segment = line.decode(encoding)
+        if segment[:3] == 'MSH' and len(segment) > 3:
+            separator = segment[3].encode(encoding)
+        yield segment.rstrip()
+
+def segmentsFromBytes(message, encoding='iso-2022-jp', wanted=None, masked=frozenset()):
+    # message: bytes、またはファイルのパス
+    return decodeSegments(readBytes(message), encoding, wanted, masked)
@@ -0,0 +1,226 @@
+import re
+import sys
+from array import array
+
+from .main import (MessageContext, DEIDENTIFIED, FIELD_SKIP, FIELD_MASK, FIELD_RAW, FIELD_VARIES,
+    PRIMARY_CONVERTER_SET)
+
+# メッセージの遅延ビュー。jsonizer.view(message)で作る。
+# 作成時にはセグメントの境界だけを索引し、フィールドの境界はセグメントを初めて参照したときに索引する。
+# 値は元の文字列(またはbytes)へのオフセットとして保持し、参照されたフィールドだけをjsonizeSegmentと
+# 同じ名前・匿名化の規則で変換する。
+#
+#   message = jsonizer.view('OML-11', path)
+#   message['PID.3']               # PID-3の変換結果(jsonizeSegmentの値と同じ)
+#   message.rawValue('OBX.5')      # エスケープを解除していない文字列
+#   message.segments('OBX')[2][5]  # 3つ目のOBXのOBX-5
+#   message.asDict()               # jsonizeと同じ結果
+
+SEGMENT_REGEX = re.compile(r'[^\r\n]+')
+SEGMENT_REGEX_BYTES = re.compile(rb'[^\r\n]+')
+# 区切り文字がマルチバイト文字の途中に現れない文字コード。これ以外のbytesは最初にデコードする
+BYTE_SAFE_ENCODINGS = frozenset(['utf-8', 'utf8', 'ascii', 'us-ascii'])
+
+def convertField(jsonizer, view, seq, field, context):
+    # jsonizeSegmentのフィールド1つ分の変換
+    # return: (フィールド名, 値)。出力されないフィールドは(None, None)
+    fieldName, action, isRepeat, converter = jsonizer.fieldPlans[view.segmentType][seq]
+    context.fieldSequence = seq
+    if action == FIELD_SKIP:
+        return None, None
+    if action == FIELD_RAW:
+        return fieldName, field
+    if action == FIELD_VARIES:
+        valueType = view.raw(2)
+        if valueType not in converter:
+            context.report('OBX2_INVALID', valueType, segmentText=view.text)
+            return None, None
+        fieldName, action, converter = converter[valueType]
+    if action == FIELD_MASK:
+        return fieldName, DEIDENTIFIED
+    if jsonizer.fieldMemo is not None and converter not in PRIMARY_CONVERTER_SET:
+        return fieldName, jsonizer.convertMemoized(converter, context, field, isRepeat)
+    if isRepeat:
+        return fieldName, [converter(context, singleFieldData)
+            for singleFieldData in field.split(context.REPETITION_SEPARATOR) if singleFieldData]
+    return fieldName, converter(context, field)
+
+class SegmentView():
+    # セグメント1つのビュー。view[seq]でフィールドの変換結果、view.raw(seq)で元の文字列
+    __slots__ = ('message', 'index', 'segmentType', '_separators', '_values')
+
+    def __init__(self, message, index, segmentType):
+        self.message = message
+        self.index = index
+        self.segmentType = segmentType
+        self._separators = None # フィールドの区切り文字の位置
+        self._values = None # {seq: (フィールド名, 値)}
+
+    def __repr__(self):
+        return f'<SegmentView {self.segmentType} #{self.index}>'
+
+    @property
+    def text(self):
+        message = self.message
+        return message.decode(message.starts[self.index], message.ends[self.index])
+
+    def fieldBounds(self, seq):
+        # return: (start, end)。フィールドが無ければNone
+        message = self.message
+        start, end = message.starts[self.index], message.ends[self.index]
+        if self._separators is None:
+            separator = message.fieldSeparator
+            positions = array('I')
+            position = message.text.find(separator, start, end)
+            while position >= 0:
+                positions.append(position)
+                position = message.text.find(separator, position + 1, end)
+            self._separators = positions
+        separators = self._separators
+        # MSH-1は区切り文字そのもの、MSH-2以降はn-1番目の区切り文字の後ろ
+        i = seq - 1 if self.segmentType == 'MSH' else seq
+        if seq == 1 and self.segmentType == 'MSH':
+            return (separators[0], separators[0] + 1) if separators else None
+        if i < 1 or i > len(separators):
+            return None
+        return separators[i - 1] + 1, separators[i] if i < len(separators) else end
+
+    def raw(self, seq):
+        # return: フィールドの元の文字列(エスケープを解除しない)。無ければ''
+        bounds = self.fieldBounds(seq)
+        return self.message.decode(*bounds) if bounds else ''
+
+    def field(self, seq):
+        # return: (フィールド名, 値)。空のフィールド、出力されないフィールドは(None, None)
+        if self._values is None:
+            self._values = {}
+        if seq in self._values:
+            return self._values[seq]
+        message = self.message
+        jsonizer = message.jsonizer
+        context = message.context
+        context.segmentType = self.segmentType
+        context.segmentIndex = self.index
+        if self.segmentType in jsonizer.maskedSegments:
+            entry = (None, None)
+        elif jsonizer.projectedFields is not None and seq not in jsonizer.projectedFields.get(self.segmentType, ()):
+            entry = (None, None)
+        else:
+            field = self.raw(seq)
+            if not field and not (seq == 2 and self.segmentType == 'MSH'):
+                entry = (None, None)
+            else:
+                entry = convertField(jsonizer, self, seq, field, context)
+        self._values[seq] = entry
+        return entry
+
+    def __getitem__(self, seq):
+        fieldName, value = self.field(seq)
+        if fieldName is None:
+            raise KeyError(f'{self.segmentType}.{seq}')
+        return value
+
+    def get(self, seq, default=None):
+        fieldName, value = self.field(seq)
+        return default if fieldName is None else value
+
+    def name(self, seq):
+        # return: jsonizeSegmentの出力でのフィールド名(OBX-5は値の型ごとの名前)。出力されなければNone
+        return self.field(seq)[0]
+
+    def asDict(self):
+        # return: jsonizeSegmentと同じdict
+        message = self.message
+        context = message.context
+        context.segmentIndex = self.index
+        return message.jsonizer.jsonizeSegment(self.text, context)
+
+class Message():
+    # text: メッセージの文字列、またはbytes。UTF-8などのbytesはそのまま保持し、参照した部分だけデコードする
+    def __init__(self, jsonizer, text, encoding=None, issues=None):
+        encoding = encoding or jsonizer.encoding
+        if isinstance(text, (bytes, bytearray)) and encoding.lower() not in BYTE_SAFE_ENCODINGS:
+            # ISO-2022-JPは状態を持ち、Shift_JISは2バイト目に'|'などが現れるので、部分ごとにはデコードできない
+            text = bytes(text).decode(encoding)
+        self.jsonizer = jsonizer
+        self.text = text
+        self.encoding = encoding
+        self.isBytes = not isinstance(text, str)
+        self.context = MessageContext(jsonizer.diagnostics, issues)
+        self.starts = array('I')
+        self.ends = array('I')
+        for m in (SEGMENT_REGEX_BYTES if self.isBytes else SEGMENT_REGEX).finditer(text):
+            self.starts.append(m.start())
+            self.ends.append(m.end())
+        # セグメント型の文字列は全メッセージで共有する
+        self.segmentTypeList = [sys.intern(self.decode(start, start + 3)) for start in self.starts]
+        self._views = {}
+        self.fieldSeparator = b'|' if self.isBytes else '|'
+        if self.segmentTypeList and self.segmentTypeList[0] == 'MSH':
+            msh = self.decode(self.starts[0], min(self.ends[0], self.starts[0] + 8))
+            if len(msh) >= 8:
+                self.context.setEncodingCharacters(msh)
+                self.fieldSeparator = msh[3].encode(encoding) if self.isBytes else msh[3]
+
+    def __repr__(self):
+        return f'<Message {len(self)} segments>'
+
+    def decode(self, start, end):
+        if self.isBytes:
+            return self.text[start:end].decode(self.encoding)
+        return self.text[start:end]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def segmentTypes(self):
+        return list(self.segmentTypeList)
+
+    def view(self, index):
+        if index not in self._views:
+            self._views[index] = SegmentView(self, index, self.segmentTypeList[index])
+        return self._views[index]
+
+    def segments(self, segmentType=None):
+        # return: SegmentViewのリスト(出現順)
+        return [self.view(i) for i, t in enumerate(self.segmentTypeList) if segmentType is None or t == segmentType]
+
+    def segment(self, segmentType, n=0):
+        # return: n番目のsegmentTypeのSegmentView。無ければNone
+        for i, t in enumerate(self.segmentTypeList):
+            if t == segmentType:
+                if not n:
+                    return self.view(i)
+                n -= 1
+        return None
+
+    def parsePath(self, path):
+        # 'PID.3'(または'PID-3') -> (SegmentView or None, 3)。'PID' -> (SegmentView or None, None)
+        segmentType, _, seq = path.replace('-', '.').partition('.')
+        return self.segment(segmentType), int(seq) if seq else None
+
+    def __getitem__(self, path):
+        # 'PID'なら最初のPIDのSegmentView、'PID.3'なら最初のPIDのPID-3の変換結果
+        segment, seq = self.parsePath(path)
+        if segment is None:
+            raise KeyError(path)
+        return segment if seq is None else segment[seq]
+
+    def get(self, path, default=None):
+        try:
+            return self[path]
+        except KeyError:
+            return default
+
+    def rawValue(self, path):
+        # return: 最初のセグメントのフィールドの元の文字列。無ければ''
+        segment, seq = self.parsePath(path)
+        return segment.raw(seq) if segment is not None and seq is not None else ''
+
+    def asDict(self):
+        # return: jsonizer.jsonize(message)と同じdict
+        text = self.text.decode(self.encoding) if self.isBytes else self.text
+        if '\r' not in text and '\n' not in text:
+            # 1セグメントだけのメッセージ(パスとみなされないように)
+            text = [text]
+        return self.jsonizer.jsonize(text, self.context.issues)
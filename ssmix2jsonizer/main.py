@@ -1,10 +1,14 @@
-import json
 #import pandas as pd
 import re
 import os
+import threading
 import warnings
+import weakref
 
-from pathlib import WindowsPath, PosixPath
+from .cache import LRUCache
+from .diagnostics import WARNINGS
+from .grammar import MESSAGE_GRAMMARS, compileGrammar, segmentGroups
+from .schema import SchemaTable
 
 DT_PATTERN = re.compile(r'^\d{4}((0[1-9]|1[0-2])(0[1-9]|[12][0-9]|3[01])?)?$')
 DTM_PATTERN = re.compile(r'^\d{4}((0[1-9]|1[0-2])((0[1-9]|[12][0-9]|3[01])(([01][0-9]|2[0-4])(([0-5][0-9])(([0-5][0-9])(\.[0-9]{1,4})?)?)?)?)?)?([+-](0[0-9]|1[0-3])[0-5][0-9])?$')
@@ -28,55 +32,358 @@ IDENTITY_FIELDS={
     'ZI1': [*range(3,42), *range(43,53)], #2: Insurance Plan ID, 42  Insured's Employment Status.
 }
 
-def DTValidator(dt):
-    if bool(re.match(DT_PATTERN, dt)):
-        return True
-    else:
-        warnings.warn(f'{dt} does not match DT pattern (ex)20210805.')
-        return False
-
-def DTMValidator(dtm):
-    if bool(re.match(DTM_PATTERN, dtm)):
-        return True
-    else:
-        warnings.warn(f'{dtm} does not match DTM pattern (ex)20210805020000.00+0900')
-        return False
+# 初めて参照されたときに読み込まれる(schema.SchemaTable)
+SSMIX2_FIELD_OPTIONS = SchemaTable('SSMIX2_FIELD_OPTIONS.json')
+DATATYPE_STRUCTURE = SchemaTable('DATATYPE_STRUCTURE.json')
+SEGMENT_STRUCTURE = SchemaTable('SEGMENT_STRUCTURE.json')
 
-def TMValidator(tm):
-    if bool(re.match(TM_PATTERN, tm)):
-        return True
-    else:
-        warnings.warn(f'{tm} does not match TM pattern (ex)090000.000+0900')
-        return False
+PRIMARY_DATA_TYPES = ['', 'DT','DTM','FT','GTS','ID','IS','NM', 'SI','ST','TM','TX']
+# ''は各セグメントの０番目のフィールド。「MSH」などのため
 
-with open(os.path.join(os.path.abspath(os.path.dirname(__file__)),
-        './json/SSMIX2_FIELD_OPTIONS.json'), 'r', encoding='utf-8') as f:
-    SSMIX2_FIELD_OPTIONS = json.load(f)
+OBX5_DATA_TYPES = ['AD','CWE','CF','CK','CN','CP','CX','DT','ED','FT'
+    'MO','NM','PN','RP','SN','ST','TM','TN','TS','TX','XAD','XCN','XON','XPN','XTN', 'ZRD']
+# ZRD型は日本のHL7拡張
+
+DEIDENTIFIED = '**DEIDENTIFIED**'
+
+# フィールドプランのaction
+FIELD_CONVERT = 0
+FIELD_SKIP = 1 # ssmix2_onlyで'N'のフィールド
+FIELD_MASK = 2 # 匿名化で伏せるフィールド
+FIELD_RAW = 3 # MSH-2
+FIELD_VARIES = 4 # OBX-5。データ型がOBX-2で決まる
+
+class MessageContext():
+    # メッセージごとの解析状態。MSHで宣言された区切り文字と、問題の報告先(diagnostics.Diagnostics)を保持する。
+    # jsonizeの呼び出しごとに作られるので、同じjsonizerを複数スレッドから使える。
+    def __init__(self, diagnostics=WARNINGS, issues=None):
+        self.diagnostics = diagnostics
+        self.issues = issues # メッセージの問題(diagnostics.Issue)を追加するリスト
+        self.reported = None # メモする変換の間だけ、報告した問題を(code, value, details)で追加するリスト
+        self.segmentType = None
+        self.segmentIndex = None
+        self.fieldSequence = None
+        self.FIELD_SEPARATOR = '|'
+        self.COMPONENT_SEPARATOR = '^'
+        self.REPETITION_SEPARATOR = '~'
+        self.ESCAPE_CHARACTER = '\\'
+        self.SUBCOMPONENT_SEPARATOR = '&'
+        self.encodingCharacters = '|^~\\&'
+
+    def setEncodingCharacters(self, segment):
+        # segment: MSHセグメント
+        self.FIELD_SEPARATOR = segment[3]
+        self.COMPONENT_SEPARATOR = segment[4]
+        self.REPETITION_SEPARATOR = segment[5]
+        self.ESCAPE_CHARACTER = segment[6]
+        self.SUBCOMPONENT_SEPARATOR = segment[7]
+        self.encodingCharacters = segment[3:8]
+
+    def report(self, code, value, **details):
+        # 現在のセグメント、フィールドの問題として報告する
+        if self.reported is not None:
+            self.reported.append((code, value, details))
+        self.diagnostics.report(code, value, self.segmentType, self.fieldSequence, self.segmentIndex,
+            self.issues, **details)
 
-with open(os.path.join(os.path.abspath(os.path.dirname(__file__)),
-        './json/DATATYPE_STRUCTURE.json'), 'r', encoding='utf-8') as f:
-    DATATYPE_STRUCTURE = json.load(f)
+    def removeEscape(self, txt):
+        # /H/や/B/, /Cxxyy/, /Mxxyyzz/といったエスケープ表記には対応していない
+        # 閉じないescapeにも警告を発しない
+        strings = txt.split(self.ESCAPE_CHARACTER)
+        if not len(strings)%2:
+            self.report('UNCLOSED_ESCAPE', txt)
+        for i, string in enumerate(strings):
+            if not i%2:
+                continue
+            if string=='F':
+                strings[i]= self.FIELD_SEPARATOR
+            elif string=='S':
+                strings[i] = self.COMPONENT_SEPARATOR
+            elif string=='T':
+                strings[i] = self.SUBCOMPONENT_SEPARATOR
+            elif string=='R':
+                strings[i] = self.REPETITION_SEPARATOR
+            elif string=='E':
+                strings[i] = self.ESCAPE_CHARACTER
+            elif string=='':
+                if i < len(strings)-1:
+                    strings[i] = self.ESCAPE_CHARACTER
+            else:
+                strings[i] = ''
+        return ''.join(strings)
 
-with open(os.path.join(os.path.abspath(os.path.dirname(__file__)),
-        './json/SEGMENT_STRUCTURE.json'),'r', encoding='utf-8') as f:
-    SEGMENT_STRUCTURE = json.load(f)
+def convertNumeric(context, data):
+    try:
+        float(data)
+        return data
+    except ValueError:
+        context.report('NM_FORMAT', data)
+        return None
+
+def convertDate(context, data):
+    if DT_PATTERN.match(data):
+        return data
+    context.report('DT_FORMAT', data)
+    return ''
+
+def convertDateTime(context, data):
+    if DTM_PATTERN.match(data):
+        return data
+    context.report('DTM_FORMAT', data)
+    return ''
+
+def convertTime(context, data):
+    if TM_PATTERN.match(data):
+        return data
+    context.report('TM_FORMAT', data)
+    return ''
+
+def convertText(context, data):
+    if context.ESCAPE_CHARACTER not in data:
+        return data
+    return context.removeEscape(data)
+
+def convertAsIs(context, data):
+    return data
+
+PRIMARY_CONVERTERS = {
+    'NM': convertNumeric,
+    'DT': convertDate,
+    'DTM': convertDateTime,
+    'TM': convertTime,
+    'FT': convertText,
+    'ST': convertText,
+    'TX': convertText,
+    'CF': convertText,
+}
+# メモ化しない変換関数。型つき出力の変換関数もprimaryConvertersで追加される
+PRIMARY_CONVERTER_SET = set([*PRIMARY_CONVERTERS.values(), convertAsIs])
+_PRIMARY_CONVERTERS_CACHE = {None: PRIMARY_CONVERTERS}
+
+def primaryConverters(typed=None):
+    # typed: None(値は文字列のまま) or (numeric_type, datetime_format, default_timezone)。typed.pyを参照
+    if typed not in _PRIMARY_CONVERTERS_CACHE:
+        from .typed import compileTypedConverters
+        converters = {**PRIMARY_CONVERTERS, **compileTypedConverters(*typed)}
+        PRIMARY_CONVERTER_SET.update(converters.values())
+        _PRIMARY_CONVERTERS_CACHE[typed] = converters
+    return _PRIMARY_CONVERTERS_CACHE[typed]
+
+
+_CONVERTER_CACHE = {}
+_FIELD_PLAN_CACHE = {}
+
+def compileMissingDataType(dataType, separatorName='COMPONENT_SEPARATOR'):
+    # DATATYPE_STRUCTUREに無いデータ型(TQなど)は、空でない要素が現れた時点でKeyError
+    def convert(context, data):
+        if any(data.split(getattr(context, separatorName))):
+            raise KeyError(dataType)
+        return {}
+    return convert
+
+def compileSubcomponentConverter(dataType, elementNameKey, typed=None):
+    # サブコンポーネントはプリミティブ型のみ想定
+    if dataType not in DATATYPE_STRUCTURE:
+        return compileMissingDataType(dataType, 'SUBCOMPONENT_SEPARATOR')
+    converters = primaryConverters(typed)
+    subelements = tuple(
+        (element[elementNameKey], element['DataType'],
+            converters.get(element['DataType'], convertAsIs)
+            if element['DataType'] in PRIMARY_DATA_TYPES else None)
+        for element in DATATYPE_STRUCTURE[dataType])
+
+    def convert(context, data):
+        d = {}
+        for j, subcomponent in enumerate(data.split(context.SUBCOMPONENT_SEPARATOR)):
+            if not subcomponent:
+                continue
+            subcomponentName, subcomponentDataType, converter = subelements[j]
+            if converter is None:
+                context.report('COMPLEX_SUBCOMPONENT', subcomponent, dataType=subcomponentDataType)
+                d[subcomponentName] = subcomponent
+            else:
+                d[subcomponentName] = converter(context, subcomponent)
+        return d
+    return convert
+
+def compileDataType(dataType, elementNameKey, deidentify, typed=None):
+    # データ型ごとの変換関数 converter(context, data) を返す。設定ごとにキャッシュされる。
+    key = (dataType, elementNameKey, deidentify, typed)
+    if key in _CONVERTER_CACHE:
+        return _CONVERTER_CACHE[key]
+    converters = primaryConverters(typed)
+    if dataType in PRIMARY_DATA_TYPES:
+        converter = converters.get(dataType, convertAsIs)
+        _CONVERTER_CACHE[key] = converter
+        return converter
+
+    if dataType not in DATATYPE_STRUCTURE:
+        converter = compileMissingDataType(dataType)
+        _CONVERTER_CACHE[key] = converter
+        return converter
+
+    maskedElements = IDENTITY_DATA_TYPES_ELEMENT.get(dataType, []) if deidentify else []
+    elements = []
+    for i, element in enumerate(DATATYPE_STRUCTURE[dataType]):
+        if i in maskedElements:
+            componentConverter = None
+        elif element['DataType'] in PRIMARY_DATA_TYPES:
+            componentConverter = converters.get(element['DataType'], convertAsIs)
+        else:
+            componentConverter = compileSubcomponentConverter(element['DataType'], elementNameKey, typed)
+        elements.append((element[elementNameKey], componentConverter))
+    elements = tuple(elements)
 
-PRIMARY_DATA_TYPES = ['', 'DT','DTM','FT','GTS','ID','IS','NM', 'SI','ST','TM','TX']
-# ''は各セグメントの０番目のフィールド。「MSH」などのため
+    def convert(context, data):
+        d = {}
+        for i, component in enumerate(data.split(context.COMPONENT_SEPARATOR)):
+            if not component:
+                continue
+            componentName, componentConverter = elements[i]
+            if componentConverter is None:
+                d[componentName] = DEIDENTIFIED
+            else:
+                d[componentName] = componentConverter(context, component)
+        return d
+    _CONVERTER_CACHE[key] = convert
+    return convert
+
+class FieldPlans(dict):
+    # {segmentType: segmentPlan}。セグメント型ごとに、初めて参照されたときにコンパイルする
+    def __init__(self, ssmix2DataCategory, fieldNameKey, elementNameKey, deidentify,
+            ssmix2Only, nestPrefix, nestSuffix, typed=None):
+        super().__init__()
+        self.config = (ssmix2DataCategory, fieldNameKey, elementNameKey, deidentify,
+            ssmix2Only, nestPrefix, nestSuffix, typed)
+
+    def __missing__(self, segmentType):
+        segmentPlan = compileSegmentPlan(segmentType, *self.config)
+        self[segmentType] = segmentPlan
+        return segmentPlan
+
+def compileSegmentPlan(segmentType, ssmix2DataCategory, fieldNameKey, elementNameKey, deidentify,
+        ssmix2Only, nestPrefix, nestSuffix, typed=None):
+    # SEGMENT_STRUCTURE, DATATYPE_STRUCTURE, SSMIX2_FIELD_OPTIONSから、セグメントのフィールドプランを作る。
+    # return: ((fieldName, action, isRepeat, converter), ...)。インデックスはフィールドのシーケンス番号。
+    # FIELD_VARIESのときはconverterの位置に{OBX-2の値: (fieldName, action, converter)}が入る。
+    # IDENTITY_*はコンパイル時に読まれるので、カスタマイズはJsonizer生成前に行うこと。
+    def nestIfNeeded(fieldName, isRepeat, dataType):
+        if isRepeat and dataType not in PRIMARY_DATA_TYPES:
+            return nestPrefix + fieldName + nestSuffix
+        return fieldName
+
+    fieldStructures = SEGMENT_STRUCTURE[segmentType]
+    fieldOptions = SSMIX2_FIELD_OPTIONS[ssmix2DataCategory][segmentType] if ssmix2Only else None
+    maskedFields = IDENTITY_FIELDS.get(segmentType, []) if deidentify else []
+    segmentPlan = []
+    for seq, fieldStructure in enumerate(fieldStructures):
+        fieldName = fieldStructure[fieldNameKey]
+        dataType = fieldStructure['DataType']
+        isRepeat = fieldStructure['Repeatability']
+        action = FIELD_MASK if seq in maskedFields else FIELD_CONVERT
+        if segmentType == 'MSH' and seq == 2:
+            # ST型だけどエスケープ処理されないので
+            segmentPlan.append((fieldName, FIELD_RAW, False, None))
+        elif ssmix2Only and fieldOptions[seq] == 'N':
+            segmentPlan.append((fieldName, FIELD_SKIP, isRepeat, None))
+        elif segmentType == 'OBX' and seq == 5:
+            # 同じフィールドにNM型、TX型などが混在すると有効なインデックスが作れない
+            variants = {}
+            for variantDataType in OBX5_DATA_TYPES:
+                variants[variantDataType] = (
+                    nestIfNeeded(fieldName + '_' + variantDataType, isRepeat, variantDataType),
+                    action, compileDataType(variantDataType, elementNameKey, deidentify, typed))
+            segmentPlan.append((fieldName, FIELD_VARIES, isRepeat, variants))
+        else:
+            segmentPlan.append((nestIfNeeded(fieldName, isRepeat, dataType), action, isRepeat,
+                compileDataType(dataType, elementNameKey, deidentify, typed)))
+    return tuple(segmentPlan)
+
+def compileFieldPlans(ssmix2DataCategory, fieldNameKey, elementNameKey, deidentify,
+        ssmix2Only, nestPrefix, nestSuffix, typed=None):
+    # 設定ごとのFieldPlansを返す。ssmix2_only=Falseならデータ種別に依存しない
+    if not ssmix2Only:
+        ssmix2DataCategory = None
+    key = (ssmix2DataCategory, fieldNameKey, elementNameKey, deidentify, ssmix2Only, nestPrefix, nestSuffix, typed)
+    if key not in _FIELD_PLAN_CACHE:
+        _FIELD_PLAN_CACHE[key] = FieldPlans(*key)
+    return _FIELD_PLAN_CACHE[key]
+
+def compileProjection(fields):
+    # fields: ['PID.3', 'OBX.5', 'ORC', ...]。'セグメント型.シーケンス番号'('PID-3'も可)、またはセグメント型のみ(全フィールド)
+    # return: ((segmentType, (seq, ...)), ...)。セグメント型、シーケンス番号の順
+    projection = {}
+    for path in fields:
+        segmentType, _, seq = path.replace('-', '.').partition('.')
+        if segmentType not in SEGMENT_STRUCTURE:
+            raise ValueError(f'Unknown segment type in field path: {path}')
+        fieldCount = len(SEGMENT_STRUCTURE[segmentType])
+        if not seq:
+            projection[segmentType] = set(range(1, fieldCount))
+            continue
+        if not seq.isdigit() or not 0 < int(seq) < fieldCount:
+            raise ValueError(f'Field path must be like "PID.3". {path} was given.')
+        projection.setdefault(segmentType, set()).add(int(seq))
+    return tuple((segmentType, tuple(sorted(seqs))) for segmentType, seqs in sorted(projection.items()))
+
+class SkippedSegment(dict):
+    # 射影(fields)で選ばれなかったセグメントの代わり。グループの構造を保つために置き、pruneSkippedで取り除く
+    pass
+
+_PRUNED = object()
+
+def pruneSkipped(value):
+    # SkippedSegmentと、それを取り除いて空になったグループを取り除く
+    if isinstance(value, dict):
+        pruned = {}
+        for k, v in value.items():
+            v = pruneSkipped(v)
+            if v is not _PRUNED:
+                pruned[k] = v
+        if not pruned and (value or type(value) is SkippedSegment):
+            return _PRUNED
+        return pruned
+    if type(value) is list:
+        pruned = [v for v in map(pruneSkipped, value) if v is not _PRUNED]
+        return pruned if pruned or not value else _PRUNED
+    return value
+
+def segmentGenerator(message, encoding='iso-2022-jp', bytesMode=False, wanted=None, masked=frozenset()):
+    # message: メッセージの文字列、bytes、ファイルのパス、またはセグメントのiterable
+    # bytesMode: ファイルをbytesで読み、必要な行だけデコードする(jisbytes.py)。
+    # wanted, masked: bytesで読むとき、デコードするセグメント型(Noneなら全て)、デコードしないセグメント型
+    if type(message) is str and ('\r' in message or '\n' in message):
+        #SSMIX規約上、行末は<CR>
+        for segment in message.splitlines():
+            yield segment
+    elif isinstance(message, (bytes, bytearray, memoryview)) or bytesMode and isinstance(message, (str, os.PathLike)):
+        from .jisbytes import segmentsFromBytes
+        yield from segmentsFromBytes(message, encoding, wanted, masked)
+    elif isinstance(message, (str, os.PathLike)):
+        with open(message, encoding=encoding) as f:
+            for segment in f:
+                yield segment.rstrip()
+    else:
+        for segment in message:
+            yield segment.rstrip()
 
 class ssmix2MessageJsonizer():
     def __init__(self, deidentify=True, nest_prefix='', nest_suffix='_Nested', 
         is_seq_prefix_in_field_name=True, field_name_lang='en',
         is_seq_prefix_in_element_name=True, element_name_lang='en',
-        ssmix2_only=True, ssmix2_data_category=None, encoding='iso-2022-jp'):
+        ssmix2_only=True, ssmix2_data_category=None, encoding='iso-2022-jp',
+        memo_size=0, field_memo=None, profiler=None, diagnostics=None,
+        typed_values=False, numeric_type='float', datetime_format='iso', default_timezone='+0900',
+        fields=None, bytes_mode=False, pseudonymizer=None, pseudonym_fields=None):
         self.deidentify = deidentify
+        # 仮名化(pseudonym.Pseudonymizer)。pseudonym_fieldsのフィールドのIDを鍵つきハッシュのトークンに置き換える
+        self.pseudonymizer = pseudonymizer
+        self.pseudonymFields = tuple(pseudonym_fields) if pseudonym_fields is not None else None
+        # データの問題の報告先(diagnostics.Diagnostics)。Noneなら従来どおりwarnings.warnで警告する
+        self.diagnostics = diagnostics or WARNINGS
+        # jsonizeSegmentなどをcontextなしで直接呼んだときに使う。jsonize, jsonizeToは呼び出しごとに作る
+        self.context = MessageContext(self.diagnostics)
 
-        self.FIELD_SEPARATOR = FIELD_SEPARATOR = '|'
-        self.COMPONENT_SEPARATOR = COMPONENT_SEPARATOR = '^'
-        self.REREPETITION_SEPARATOR = REPETITION_SEPARATOR = '~'
-        self.ESCAPE_CHARACTER = ESCAPE_CHARACTER = '\\'
-        self.SUBCOMPONENT_SEPARATOR = SUBCOMPONENT_SEPARATOR = '&'
-        
         self.nestPrefix = nest_prefix
         self.nestSuffix = nest_suffix
         #self.fieldNameLang = field_name_lang
@@ -101,206 +408,318 @@ class ssmix2MessageJsonizer():
         self.ssmix2FieldOptions = SSMIX2_FIELD_OPTIONS[self.ssmix2DataCategory]
         self.ssmix2Only = ssmix2_only
         self.encoding = encoding
+        # ファイルをbytesで読み、区切り文字で分割してから必要な行だけデコードする。出力は変わらない
+        self.bytesMode = bytes_mode
+        # 型つき出力。NMを数値に、DT, DTM, TMをISO 8601の文字列かエポックミリ秒にする(typed.py)
+        self.typed = (numeric_type, datetime_format, default_timezone) if typed_values else None
+        primaryConverters(self.typed)
+        # 複合型フィールドの変換結果のメモ(LRUCache)。field_memoを渡せば複数のjsonizerで共有できる
+        if field_memo is None and memo_size:
+            field_memo = LRUCache(memo_size)
+        self.fieldMemo = field_memo
+
+        self.fieldPlans = self.compileFieldPlans()
+        self.maskedSegments = frozenset(IDENTITY_SEGMENTS) if self.deidentify else frozenset()
+        # セグメントの追加先(grammar.py)。groupOf: 繰り返し構造(ORDERなど)に入るセグメント型 -> グループ名。jsonizeToで使う
+        if self.ssmix2DataCategory in MESSAGE_GRAMMARS:
+            self.grammar = compileGrammar(self.ssmix2DataCategory, self.nestPrefix, self.nestSuffix)
+            self.segmentGroups = segmentGroups(self.ssmix2DataCategory)
+        else:
+            self.grammar = None
+            self.segmentGroups = {}
+        self.groupOf = {segmentType: group
+            for group, segmentTypes in self.segmentGroups.items() for segmentType in segmentTypes}
+        # 射影。fieldsを指定すると、選んだセグメント・フィールドだけを分割・変換する
+        self.projection = compileProjection(fields) if fields is not None else None
+        self.projectedFields = dict(self.projection) if fields is not None else None
+        # bytesで読むとき、射影に含まれないセグメント、全体を伏せるセグメントはデコードしない
+        self.wantedSegments = frozenset([b'MSH'] + [segmentType.encode('ascii') for segmentType in self.projectedFields]
+            ) if fields is not None else None
+        self.maskedSegmentBytes = frozenset(segmentType.encode('ascii') for segmentType in self.maskedSegments)
+        self.profiler = None
+        if profiler is not None:
+            self.setProfiler(profiler)
+
+    def setProfiler(self, profiler):
+        # profiling.Profilerで計測する。Noneなら計測をやめる
+        self.__dict__.pop('jsonizeSegment', None)
+        self.fieldPlans = self.compileFieldPlans()
+        self.profiler = profiler
+        if profiler is not None:
+            self.fieldPlans = profiler.wrapPlans(self.fieldPlans)
+            self.jsonizeSegment = profiler.wrapSegment(self.jsonizeSegment)
+
+    def compileFieldPlans(self):
+        fieldPlans = compileFieldPlans(self.ssmix2DataCategory, self.fieldNameKey, self.elementNameKey,
+            self.deidentify, self.ssmix2Only, self.nestPrefix, self.nestSuffix, self.typed)
+        if self.pseudonymizer is not None:
+            fieldPlans = self.pseudonymizer.wrapPlans(fieldPlans, self.pseudonymFields)
+        return fieldPlans
+
+    def configKey(self):
+        # 出力に影響する設定。同じconfigKeyのjsonizerは同じメッセージから同じ結果を返す
+        pseudonym = (self.pseudonymizer.configKey(), self.pseudonymFields) if self.pseudonymizer is not None else None
+        return (self.ssmix2DataCategory, self.fieldNameKey, self.elementNameKey, self.deidentify,
+            self.ssmix2Only, self.nestPrefix, self.nestSuffix, self.encoding, self.typed, self.projection, pseudonym)
+
+    def jsonEncoder(self):
+        # return: 値をjson.dumps(value, ensure_ascii=False)と同じテキストにする関数。
+        # numeric_type='decimal'ならDecimalを数値として書き出す(json.loads(text, parse_float=Decimal)で戻る)
+        import json
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+        if self.typed is not None and self.typed[0] == 'decimal':
+            from .typed import decimalEncoder
+            return decimalEncoder(encode)
+        return encode
 
     def segmentGenerator(self, message):
-        if type(message) is str and ('\r' in message or '\n' in message):
-            #SSMIX規約上、行末は<CR>
-            for segment in message.splitlines():
-                yield segment
-        elif type(message) in [str, WindowsPath, PosixPath]:
-            with open(message, encoding=self.encoding) as f:
-                for segment in f:
-                    yield segment.rstrip()
-        else:
-            for segment in message:
-                yield segment.rstrip()
-        
-    def removeEscape(self, txt):
-        # /H/や/B/, /Cxxyy/, /Mxxyyzz/といったエスケープ表記には対応していない
-        # 閉じないescapeにも警告を発しない
-        strings = txt.split(self.ESCAPE_CHARACTER)
-        if not len(strings)%2:
-            warnings.warn(f'Escapeが閉じていません: "{txt}"')
-        for i, string in enumerate(strings):
-            if not i%2:
-                continue
-            if string=='F':
-                strings[i]= self.FIELD_SEPARATOR
-            elif string=='S':
-                strings[i] = self.COMPONENT_SEPARATOR
-            elif string=='T':
-                strings[i] = self.SUBCOMPONENT_SEPARATOR
-            elif string=='R':
-                strings[i] = self.REPETITION_SEPARATOR
-            elif string=='E':
-                strings[i] = self.ESCAPE_CHARACTER
-            elif string=='':
-                if i < len(strings)-1:
-                    strings[i] = self.ESCAPE_CHARACTER
-            else:
-                strings[i] = ''
-        return ''.join(strings)
+        return segmentGenerator(message, self.encoding, self.bytesMode, self.wantedSegments, self.maskedSegmentBytes)
 
-    def convertPrimaryDataTypeData(self, dataType, data):
-        if dataType == 'NM':
-            try:
-                float(data)
-                return data
-            except:
-                # logger.warning
-                return None
-        elif dataType == 'DT':
-            if DTValidator(data):
-                return data
-            else:
-                return ''  
-        elif dataType =='DTM':
-            if DTMValidator(data):
-                return data
-            else:
-                return ''
-        elif dataType =='TM':
-            if TMValidator(data):
-                return data
-            else:
-                return ''
-        elif dataType in ['FT','ST','TX','CF']:
-            return self.removeEscape(data)
-        else:
-            return data
+    def removeEscape(self, txt, context=None):
+        return (context or self.context).removeEscape(txt)
+
+    def convertPrimaryDataTypeData(self, dataType, data, context=None):
+        return primaryConverters(self.typed).get(dataType, convertAsIs)(context or self.context, data)
 
     def createNestedFieldName(self,fieldName):
         nestedFieldName = self.nestPrefix + fieldName + self.nestSuffix
         return nestedFieldName
     
-    def jsonizeSingleField(self, fieldData, fieldDataType):
+    def jsonizeSingleField(self, fieldData, fieldDataType, context=None):
         # fieldData should not be empty.
         # return: value or {componentName: object}, or their array
-        if fieldDataType in PRIMARY_DATA_TYPES:
-            value = self.convertPrimaryDataTypeData(fieldDataType, fieldData)
-            return value
+        converter = compileDataType(fieldDataType, self.elementNameKey, self.deidentify, self.typed)
+        if self.fieldMemo is not None and converter not in PRIMARY_CONVERTER_SET:
+            return self.convertMemoized(converter, context or self.context, fieldData, False)
+        return converter(context or self.context, fieldData)
+
+    def convertMemoized(self, converter, context, fieldData, isRepeat):
+        # キー: (変換関数(データ型と出力設定ごとに1つ), 区切り文字, 値)
+        # メモ内の結果を書き換えられないよう、コピーを返す。
+        # 変換時に報告した問題も結果と一緒にメモし、ヒットしたときは現在のメッセージの問題として報告し直す
+        memo = self.fieldMemo
+        if isRepeat:
+            return [self.convertMemoized(converter, context, singleFieldData, False)
+                for singleFieldData in fieldData.split(context.REPETITION_SEPARATOR) if singleFieldData]
+        key = (converter, context.encodingCharacters, fieldData)
+        entry = memo.get(key, memo)
+        if entry is memo:
+            outer = context.reported
+            context.reported = reported = []
+            try:
+                value = converter(context, fieldData)
+            finally:
+                context.reported = outer
+            if outer is not None:
+                outer.extend(reported)
+            # 複合型の変換結果は{component: 値 or {subcomponent: 値}}なので、2段のコピーで十分
+            nestedKeys = tuple(k for k, v in value.items() if type(v) is dict) if type(value) is dict else None
+            memo.put(key, (value, nestedKeys, tuple(reported)))
         else:
-            d = {}
-            components = fieldData.split(self.COMPONENT_SEPARATOR)
+            value, nestedKeys, reported = entry
+            for code, issueValue, details in reported:
+                context.report(code, issueValue, **details)
+        if nestedKeys is None:
+            return value
+        value = value.copy()
+        for k in nestedKeys:
+            value[k] = value[k].copy()
+        return value
 
-            for i, component in enumerate(components):
-                if not component:
-                    continue
-                componentDataType = DATATYPE_STRUCTURE[fieldDataType][i]['DataType']
-                componentName = DATATYPE_STRUCTURE[fieldDataType][i][self.elementNameKey]
-                if self.deidentify:
-                    if (fieldDataType in IDENTITY_DATA_TYPES_ELEMENT) and (
-                        i in IDENTITY_DATA_TYPES_ELEMENT[fieldDataType]):
-                        d[componentName] = '**DEIDENTIFIED**'
-                        continue
-                if componentDataType in PRIMARY_DATA_TYPES:
-                    value = self.convertPrimaryDataTypeData(componentDataType, component)
-                    d[componentName] = value
-                else:
-                    d[componentName] = {}
-                    subcomponents = component.split(self.SUBCOMPONENT_SEPARATOR)
-                    for j, subcomponent in enumerate(subcomponents):
-                        if not subcomponent:
-                            continue
-                        subcomponentDataType = DATATYPE_STRUCTURE[componentDataType][j]['DataType']
-                        subcomponentName = DATATYPE_STRUCTURE[componentDataType][j][self.elementNameKey]
-                        if subcomponentDataType in PRIMARY_DATA_TYPES:
-                            value = self.convertPrimaryDataTypeData(subcomponentDataType, subcomponent)
-                        else:
-                            value = subcomponent
-                            warnings.warn(f'Subcomponent "{subcomponent}" consists of Complex DataType: "{subcomponentDataType}".')
-                        d[componentName][subcomponentName] = value
-            return d
-   
+    def memoStats(self):
+        # return: 複合型フィールドのメモのヒット率、追い出し数など。メモが無効ならNone
+        return self.fieldMemo.stats() if self.fieldMemo is not None else None
 
-    def jsonizeField(self, segmentType, segmentSequence, fieldData, fieldDataType):
+    def jsonizeField(self, segmentType, segmentSequence, fieldData, fieldDataType, context=None):
         # fieldData is not empty.
+        context = context or self.context
         if SEGMENT_STRUCTURE[segmentType][segmentSequence]['Repeatability']:
-            # self.REPETITION_SEPARATORの有無でも良いかも。それならsegmentType引数が不要。
-            multipleFields = [self.jsonizeSingleField(singleFieldData, fieldDataType) 
-                    for singleFieldData in fieldData.split(self.REPETITION_SEPARATOR) if singleFieldData]
+            # REPETITION_SEPARATORの有無でも良いかも。それならsegmentType引数が不要。
+            multipleFields = [self.jsonizeSingleField(singleFieldData, fieldDataType, context) 
+                    for singleFieldData in fieldData.split(context.REPETITION_SEPARATOR) if singleFieldData]
             return multipleFields
         else:
-            return self.jsonizeSingleField(fieldData, fieldDataType)
+            return self.jsonizeSingleField(fieldData, fieldDataType, context)
+
+    def addSegment(self, d, segmentType, segment, message, context):
+        # データ種別の文法(grammar.MESSAGE_GRAMMARS)に従って、セグメントをdに追加する
+        if self.grammar is None:
+            raise ValueError(f'No message grammar is defined for data category {self.ssmix2DataCategory!r}. '
+                'Add it to grammar.MESSAGE_GRAMMARS.')
+        add = self.grammar.get(segmentType)
+        if add is None:
+            self.undefinedSegment(segmentType, message, context)
+        else:
+            add(d, segment, context, self.jsonizeSegment)
+
+    def undefinedSegment(self, segmentType, message, context):
+        context.segmentType = segmentType
+        context.fieldSequence = None
+        context.report('UNDEFINED_SEGMENT', segmentType, dataCategory=self.ssmix2DataCategory, message=message)
+
+    def jsonize(self, message, issues=None):
+        # issues: リストを渡すと、このメッセージの問題(diagnostics.Issue)が追加される
+        d = {}
+        context = MessageContext(self.diagnostics, issues)
+        for i, segment in enumerate(self.segmentGenerator(message)):
+            context.segmentIndex = i
+            self.addSegment(d, segment[:3], segment, message, context)
+        if self.projectedFields is not None:
+            return pruneSkipped(d)
+        return d
+
+    def view(self, message, issues=None):
+        # return: lazy.Message。セグメントの境界だけを索引し、参照されたフィールドだけを変換する
+        from .lazy import Message
+        if isinstance(message, os.PathLike) or type(message) is str and '\r' not in message and '\n' not in message:
+            with open(message, encoding=self.encoding) as f:
+                message = f.read()
+        elif not isinstance(message, (str, bytes, bytearray)):
+            # セグメントのiterable
+            message = '\r'.join(segment.rstrip() for segment in message)
+        return Message(self, message, issues=issues)
+
+    def jsonizeTo(self, message, fp, issues=None):
+        # json.dumps(self.jsonize(message), ensure_ascii=False)と同じテキストをfpに書き出す。
+        # 以降のセグメントで変更されないことが確定した部分(トップレベルの値、グループの要素)から順に書き出し、
+        # 書き出した値は保持しない。例外が起きた場合、それまでの部分は書き出されている。
+        dumps = self.jsonEncoder()
+        if self.projectedFields is not None:
+            # 射影の結果は小さいので、まとめて書き出す
+            fp.write(dumps(self.jsonize(message, issues)))
+            return
+        segments = list(self.segmentGenerator(message))
+        groupOf = self.groupOf
+        # route(グループ名またはセグメント型)ごとに、最後に現れるセグメントの位置
+        lastIndex = {}
+        for i, segment in enumerate(segments):
+            segmentType = segment[:3]
+            lastIndex[groupOf.get(segmentType, segmentType)] = i
 
-    def jsonizeSegment(self, segment):
+        d = {}
+        context = MessageContext(self.diagnostics, issues)
+        keys = []
+        routes = {}
+        written = 0 # 書き出し済みのトップレベルキーの数
+        openedElements = None # keys[written]のリストで、書き出し済みの要素数
+        fp.write('{')
+
+        def flush(i):
+            nonlocal written, openedElements
+            while written < len(keys):
+                key = keys[written]
+                value = d[key]
+                final = lastIndex[routes[key]] <= i
+                if openedElements is None:
+                    if final or type(value) is not list:
+                        if not final:
+                            return
+                        fp.write((', ' if written else '') + dumps(key) + ': ' + dumps(value))
+                        d[key] = None
+                        written += 1
+                        continue
+                    fp.write((', ' if written else '') + dumps(key) + ': [')
+                    openedElements = 0
+                # リストの要素は[-1]以外変更されない
+                end = len(value) if final else len(value) - 1
+                for j in range(openedElements, end):
+                    fp.write((', ' if j else '') + dumps(value[j]))
+                    value[j] = None
+                openedElements = max(openedElements, end)
+                if not final:
+                    return
+                fp.write(']')
+                d[key] = None
+                written += 1
+                openedElements = None
+
+        for i, segment in enumerate(segments):
+            segmentType = segment[:3]
+            context.segmentIndex = i
+            self.addSegment(d, segmentType, segment, message, context)
+            if len(d) > len(keys):
+                for key in list(d)[len(keys):]:
+                    keys.append(key)
+                    routes[key] = groupOf.get(segmentType, segmentType)
+            flush(i)
+        flush(len(segments))
+        fp.write('}')
+
+    def jsonizeSegment(self, segment, context=None):
+        # context: MessageContext。MSHの区切り文字はcontextに記録され、以降のセグメントで使われる
+        if context is None:
+            context = self.context
         d = {}
         segmentType = segment[:3]
-        if self.deidentify and segmentType in IDENTITY_SEGMENTS:
-            d[segmentType] = '**DEIDENTIFIED**'
+        context.segmentType = segmentType
+        projectedFields = self.projectedFields
+        if projectedFields is not None and segmentType not in projectedFields:
+            if segmentType == 'MSH':
+                context.setEncodingCharacters(segment)
+            return SkippedSegment()
+        if segmentType in self.maskedSegments:
+            d[segmentType] = DEIDENTIFIED
             return d
         if segmentType == 'MSH':
-            self.FIELD_SEPARATOR = segment[3]
-            self.COMPONENT_SEPARATOR = segment[4]
-            self.REPETITION_SEPARATOR = segment[5]
-            self.ESCAPE_CHARACTER = segment[6]
-            self.SUBCOMPONENT_SEPARATOR = segment[7]
-            fields = ['MSH', self.FIELD_SEPARATOR] + segment.split(self.FIELD_SEPARATOR)[1:]
+            context.setEncodingCharacters(segment)
+            fields = ['MSH', context.FIELD_SEPARATOR] + segment.split(context.FIELD_SEPARATOR)[1:]
+        elif projectedFields is not None:
+            # 最後に選ばれたフィールドより後ろは分割しない
+            lastSeq = projectedFields[segmentType][-1]
+            fields = segment.split(context.FIELD_SEPARATOR, lastSeq)
+            if len(fields) > lastSeq:
+                fields[lastSeq] = fields[lastSeq].split(context.FIELD_SEPARATOR, 1)[0]
         else:
-            fields = segment.split(self.FIELD_SEPARATOR)
+            fields = segment.split(context.FIELD_SEPARATOR)
 
-        for seq, field in enumerate(fields[1:],1):
-            if segmentType == 'MSH' and seq == 2:
-                # ST型だけどエスケープ処理されないので
-                fieldName = SEGMENT_STRUCTURE[segmentType][seq][self.fieldNameKey]
-                d[fieldName] = field
-            elif not field:
+        segmentPlan = self.fieldPlans[segmentType]
+        memo = self.fieldMemo
+        if projectedFields is None:
+            items = enumerate(fields[1:], 1)
+        else:
+            items = [(seq, fields[seq]) for seq in projectedFields[segmentType] if seq < len(fields)]
+        for seq, field in items:
+            if not field and not (seq == 2 and segmentType == 'MSH'):
                 continue
-            elif self.ssmix2Only and self.ssmix2FieldOptions[segmentType][seq] == 'N':
+            fieldName, action, isRepeat, converter = segmentPlan[seq]
+            context.fieldSequence = seq
+            if action == FIELD_SKIP:
+                continue
+            elif action == FIELD_RAW:
+                d[fieldName] = field
                 continue
+            elif action == FIELD_VARIES:
+                fieldDataType = fields[2]
+                if fieldDataType not in converter:
+                    context.report('OBX2_INVALID', fieldDataType, segmentText=segment)
+                    continue
+                fieldName, action, converter = converter[fieldDataType]
+
+            if action == FIELD_MASK:
+                # XAD,XTN,XAD,XPNは他のDataTypeの入れ子となっておらず、Fieldとしてしか登場しない。
+                # LA1 > AD があるが、LA1はSSMIX2は使用せず、そもそもRXEの「配布先」なので問題ない
+                d[fieldName] = DEIDENTIFIED
+            elif memo is not None and converter not in PRIMARY_CONVERTER_SET:
+                d[fieldName] = self.convertMemoized(converter, context, field, isRepeat)
+            elif isRepeat:
+                d[fieldName] = [converter(context, singleFieldData)
+                    for singleFieldData in field.split(context.REPETITION_SEPARATOR) if singleFieldData]
             else:
-                # fieldDataType
-                if segmentType =='OBX' and seq == 5:
-                    fieldDataType = fields[2]
-                    if fieldDataType not in ['AD','CWE','CF','CK','CN','CP','CX','DT','ED','FT'
-                        'MO','NM','PN','RP','SN','ST','TM','TN','TS','TX','XAD','XCN','XON','XPN','XTN', 'ZRD']:
-                        # ZRD型は日本のHL7拡張
-                        warnings.warn(f'OBX-2 must be values on HL7 table 0125, but "{fieldDataType}". Whole segment: {segment}')
-                        continue
-                else:
-                    fieldDataType = SEGMENT_STRUCTURE[segmentType][seq]['DataType']
-                
-                # fieldName
-                fieldName = SEGMENT_STRUCTURE[segmentType][seq][self.fieldNameKey]
-                if segmentType =='OBX' and seq == 5:
-                    fieldName += '_' + fieldDataType
-                    # 同じフィールドにNM型、TX型などが混在すると有効なインデックスが作れない
-                if SEGMENT_STRUCTURE[segmentType][seq]['Repeatability'] and (
-                    fieldDataType not in PRIMARY_DATA_TYPES):
-                    fieldName = self.createNestedFieldName(fieldName)
-
-                if self.deidentify:
-                    # XAD,XTN,XAD,XPNは他のDataTypeの入れ子となっておらず、Fieldとしてしか登場しない。
-                    # LA1 > AD があるが、LA1はSSMIX2は使用せず、そもそもRXEの「配布先」なので問題ない
-                    if segmentType in IDENTITY_FIELDS and seq in IDENTITY_FIELDS[segmentType]:
-                        d[fieldName] = '**DEIDENTIFIED**'
-                        continue
-                
-                d[fieldName] = self.jsonizeField(segmentType, seq, field, fieldDataType)
+                d[fieldName] = converter(context, field)
         return d
 
-class ADTMessageJsonizer(ssmix2MessageJsonizer):
+class CategoryMessageJsonizer(ssmix2MessageJsonizer):
+    # データ種別が決まっているjsonizer。セグメントの追加先はgrammar.MESSAGE_GRAMMARS[DATA_CATEGORY]
+    DATA_CATEGORY = None
+
     def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='ADT':
+        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!=self.DATA_CATEGORY:
             warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='ADT'
+        kwargs['ssmix2_data_category']=self.DATA_CATEGORY
         super().__init__(**kwargs)
 
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['EVN','PID','PV1','PV2']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['NK1','DB1','OBX','AL1','IN1',]:
-                d.setdefault(self.createNestedFieldName(segmentType),[]).append(self.jsonizeSegment(segment))
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
+class ADTMessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'ADT'
 
 class ADT00MessageJsonizer(ADTMessageJsonizer):pass
 class ADT01MessageJsonizer(ADTMessageJsonizer):pass
@@ -314,585 +733,166 @@ class ADT42MessageJsonizer(ADTMessageJsonizer):pass
 class ADT51MessageJsonizer(ADTMessageJsonizer):pass
 class ADT52MessageJsonizer(ADTMessageJsonizer):pass
 
-class ADT61MessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='ADT-61':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='ADT-61'
-        super().__init__(**kwargs)
-
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['EVN','PID','PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['IAM',]:
-                d.setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
-
-class PPR01MessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='PPR-01':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='PPR-01'
-        super().__init__(**kwargs)
-
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType == 'PRB':
-                d.setdefault(self.createNestedFieldName('PROBLEM'),[]).append({
-                    segmentType: self.jsonizeSegment(segment)
-                })
-            elif segmentType =='ZPR':
-                d[self.createNestedFieldName('PROBLEM')][-1][segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['ZPD','ZI1','ORC']:
-                d[self.createNestedFieldName('PROBLEM')][-1].setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
-
-class OMDMessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='OMD':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='OMD'
-        super().__init__(**kwargs)
-
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID', 'PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['AL1',]:
-                d.setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType == 'ORC':
-                d.setdefault(self.createNestedFieldName('ORDER'),[]).append({
-                    segmentType: self.jsonizeSegment(segment)
-                })
-            elif segmentType in ['TQ1','ODS']:
-                d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
-
-class OMP01MessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='OMP-01':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='OMP-01'
-        super().__init__(**kwargs)
-
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID', 'PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['AL1',]:
-                d.setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType == 'ORC':
-                d.setdefault(self.createNestedFieldName('ORDER'),[]).append({
-                    segmentType: self.jsonizeSegment(segment)
-                })
-            elif segmentType in ['TQ1','RXE']:
-                # TQ1: 「[SS-MIX2] ORC、RXE に対して常に１件しか使用しない。」
-                d[self.createNestedFieldName('ORDER')][-1][segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['RXR']:
-                d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
-
-class OMP11MessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='OMP-11':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='OMP-11'
-        super().__init__(**kwargs)
-
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID', 'PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['AL1',]:
-                d.setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType == 'ORC':
-                d.setdefault(self.createNestedFieldName('ORDER'),[]).append({
-                    segmentType: self.jsonizeSegment(segment)
-                })
-            elif segmentType in ['TQ1','RXE']:
-                # TQ1: 「[SS-MIX2] ORC、RXE に対して常に１件しか使用しない。」
-                d[self.createNestedFieldName('ORDER')][-1][segmentType] = self.jsonizeSegment(segment)
-            elif segmentType == 'RXR':
-                if self.createNestedFieldName('ADMINISTRATION') in d[self.createNestedFieldName('ORDER')][-1]:
-                    d[self.createNestedFieldName('ORDER')][-1][self.createNestedFieldName('ADMINISTRATION')][-1][segmentType] = self.jsonizeSegment(segment)
-                else:
-                    d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName(segmentType),[]).append(
-                        self.jsonizeSegment(segment)
-                    )
-            elif segmentType == 'RXA':
-                # nest内の初の要素が繰り返し
-                d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName('ADMINISTRATION'),[{}]
-                    )[-1].setdefault(self.createNestedFieldName(segmentType), []).append(
-                        self.jsonizeSegment(segment)
-                    )
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
+class ADT61MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'ADT-61'
 
+class PPR01MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'PPR-01'
 
-class OMP02MessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='OMP-02':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='OMP-02'
-        super().__init__(**kwargs)
-
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID', 'PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['AL1',]:
-                d.setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType == 'ORC':
-                d.setdefault(self.createNestedFieldName('ORDER'),[]).append({
-                    segmentType: self.jsonizeSegment(segment)
-                })
-            elif segmentType in ['TQ1','RXE']:
-                # TQ1: 「[SS-MIX2] ORC、RXE に対して常に１件しか使用しない。」
-                d[self.createNestedFieldName('ORDER')][-1][segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['RXR','RXC','OBX','CTI']:
-                d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
+class OMDMessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'OMD'
 
-class OMP12MessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='OMP-12':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='OMP-12'
-        super().__init__(**kwargs)
+class OMP01MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'OMP-01'
 
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID', 'PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['AL1',]:
-                d.setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType == 'ORC':
-                d.setdefault(self.createNestedFieldName('ORDER'),[]).append({
-                    segmentType: self.jsonizeSegment(segment)
-                })
-            elif segmentType in ['TQ1','RXE']:
-                # TQ1: 「[SS-MIX2] ORC、RXE に対して常に１件しか使用しない。」
-                d[self.createNestedFieldName('ORDER')][-1][segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['RXC']:
-                d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType == 'RXR':
-                if self.createNestedFieldName('ADMINISTRATION') in d[self.createNestedFieldName('ORDER')][-1]:
-                    d[self.createNestedFieldName('ORDER')][-1][self.createNestedFieldName('ADMINISTRATION')][-1][segmentType] = self.jsonizeSegment(segment)
-                else:
-                    d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName(segmentType),[]).append(
-                        self.jsonizeSegment(segment)
-                    )
-            elif segmentType == 'RXA':
-                # nest内の初の要素が繰り返し
-                d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName('ADMINISTRATION'),[{}]
-                    )[-1].setdefault(self.createNestedFieldName(segmentType), []).append(
-                        self.jsonizeSegment(segment)
-                    )
-            elif segmentType =='OBX':
-                d[self.createNestedFieldName('ORDER')][-1][self.createNestedFieldName('ADMINISTRATION')][-1].setdefault(
-                    self.createNestedFieldName(segmentType),[]
-                ).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType =='CTI':
-                d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName(segmentType), []).append(
-                    self.jsonizeSegment(segment)
-                )
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
-
-class OML01MessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='OML-01':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='OML-01'
-        super().__init__(**kwargs)
-
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID', 'PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['AL1',]:
-                d.setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType == 'SPM':
-                d.setdefault(self.createNestedFieldName('SPECIMEN'),[]).append(
-                    {segmentType:self.jsonizeSegment(segment)}
-                )
-            elif segmentType =='ORC':
-                d[self.createNestedFieldName('SPECIMEN')][-1].setdefault(self.createNestedFieldName('ORDER'),[{}]
-                    )[-1][segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['TQ1', 'OBR']:
-                d[self.createNestedFieldName('SPECIMEN')][-1][self.createNestedFieldName('ORDER')][-1][segmentType]=self.jsonizeSegment(segment)
-            elif segmentType == 'OBX':
-                d[self.createNestedFieldName('SPECIMEN')][-1][self.createNestedFieldName('ORDER')][-1].setdefault(
-                    self.createNestedFieldName(segmentType), []
-                ).append(self.jsonizeSegment(segment))
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
+class OMP11MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'OMP-11'
 
-class OML11MessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='OML-11':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='OML-11'
-        super().__init__(**kwargs)
+class OMP02MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'OMP-02'
 
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID', 'PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType == 'SPM':
-                d.setdefault(self.createNestedFieldName('SPECIMEN'),[]).append(
-                    {segmentType:self.jsonizeSegment(segment)}
-                )
-            elif segmentType =='OBR':
-                d[self.createNestedFieldName('SPECIMEN')][-1].setdefault(self.createNestedFieldName('ORDER'),[{}]
-                    )[-1][self.createNestedFieldName(segmentType)]=self.jsonizeSegment(segment)            
-            elif segmentType =='ORC':
-                d[self.createNestedFieldName('SPECIMEN')][-1][self.createNestedFieldName('ORDER')][-1][segmentType] = self.jsonizeSegment(segment)
-            elif segmentType == 'OBX':
-                d[self.createNestedFieldName('SPECIMEN')][-1][self.createNestedFieldName('ORDER')][-1].setdefault(
-                    self.createNestedFieldName(segmentType), []
-                ).append(self.jsonizeSegment(segment))
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
+class OMP12MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'OMP-12'
 
-class OMG01MessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='OMG-01':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='OMG-01'
-        super().__init__(**kwargs)
+class OML01MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'OML-01'
 
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID', 'PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType == 'ORC':
-                d.setdefault(self.createNestedFieldName('ORDER'),[]).append(
-                    {segmentType:self.jsonizeSegment(segment)}
-                )
-            elif segmentType in ['TQ1','OBX']:
-                d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType =='OBR':
-                d[self.createNestedFieldName('ORDER')][-1][segmentType] = self.jsonizeSegment(segment)
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
+class OML11MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'OML-11'
 
+class OMG01MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'OMG-01'
 
-class OMG11MessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='OMG-11':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='OMG-11'
-        super().__init__(**kwargs)
+class OMG11MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'OMG-11'
 
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID', 'PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType == 'ORC':
-                d.setdefault(self.createNestedFieldName('ORDER'),[]).append(
-                    {segmentType:self.jsonizeSegment(segment)}
-                )
-            elif segmentType in ['OBX','ZE1','IPC']:
-                d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType in ['TQ1','OBR']:
-                d[self.createNestedFieldName('ORDER')][-1][segmentType] = self.jsonizeSegment(segment)
-            elif segmentType == 'ZE2':
-                d[self.createNestedFieldName('ORDER')][-1][self.createNestedFieldName('ZE1')][-1].setdefault(
-                    self.createNestedFieldName(segmentType),[]
-                ).append(self.jsonizeSegment(segment))
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
+class OMG02MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'OMG-02'
 
-class OMG02MessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='OMG-02':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='OMG-02'
-        super().__init__(**kwargs)
+class OMG12MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'OMG-12'
 
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID', 'PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType == 'ORC':
-                d.setdefault(self.createNestedFieldName('ORDER'),[]).append(
-                    {segmentType:self.jsonizeSegment(segment)}
-                )
-            elif segmentType in ['TQ1','OBX']:
-                d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType =='OBR':
-                d[self.createNestedFieldName('ORDER')][-1][segmentType] = self.jsonizeSegment(segment)
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
+class OMG03MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'OMG-03'
 
+class OMG13MessageJsonizer(CategoryMessageJsonizer):
+    DATA_CATEGORY = 'OMG-13'
 
-class OMG12MessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='OMG-12':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='OMG-12'
-        super().__init__(**kwargs)
+JSONIZER_CLASSES = {
+    'ADT-00': ADTMessageJsonizer, 'ADT-01': ADTMessageJsonizer, 'ADT-12': ADTMessageJsonizer,
+    'ADT-21': ADTMessageJsonizer, 'ADT-22': ADTMessageJsonizer, 'ADT-31': ADTMessageJsonizer,
+    'ADT-32': ADTMessageJsonizer, 'ADT-41': ADTMessageJsonizer, 'ADT-42': ADTMessageJsonizer,
+    'ADT-51': ADTMessageJsonizer, 'ADT-52': ADTMessageJsonizer, 'ADT-61': ADT61MessageJsonizer,
+    'PPR-01': PPR01MessageJsonizer, 'OMD': OMDMessageJsonizer,
+    'OMP-01': OMP01MessageJsonizer, 'OMP-11': OMP11MessageJsonizer,
+    'OMP-02': OMP02MessageJsonizer, 'OMP-12': OMP12MessageJsonizer,
+    'OML-01': OML01MessageJsonizer, 'OML-11': OML11MessageJsonizer,
+    'OMG-01': OMG01MessageJsonizer, 'OMG-11': OMG11MessageJsonizer,
+    'OMG-02': OMG02MessageJsonizer, 'OMG-12': OMG12MessageJsonizer,
+    'OMG-03': OMG03MessageJsonizer, 'OMG-13': OMG13MessageJsonizer,
+}
 
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID', 'PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType == 'ORC':
-                d.setdefault(self.createNestedFieldName('ORDER'),[]).append(
-                    {segmentType:self.jsonizeSegment(segment)}
-                )
-            elif segmentType in ['TQ1','OBX','ZE1','IPC']:
-                d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType in ['OBR']:
-                if segmentType not in d[self.createNestedFieldName('ORDER')][-1]:
-                    d[self.createNestedFieldName('ORDER')][-1][segmentType] = self.jsonizeSegment(segment)
-                else:
-                    d[self.createNestedFieldName('ORDER')][-1][self.createNestedFieldName('ZE1')][-1].setdefault(
-                        self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
+# データ種別ごとのjsonizerのプロセス内の共有。クラスと正規化した設定が同じなら、どのJsonizerも同じインスタンスを使う。
+# どのJsonizerからも使われなくなったインスタンスは捨てる(フィールドプランなどのコンパイル結果は別にキャッシュされている)
+_JSONIZER_POOL = weakref.WeakValueDictionary()
+_JSONIZER_POOL_LOCK = threading.Lock()
+
+def jsonizerDefaults():
+    # return: ssmix2MessageJsonizer.__init__の{引数名: 既定値}(引数の順)。inspectはimportが重いので使わない
+    init = ssmix2MessageJsonizer.__init__
+    names = init.__code__.co_varnames[1:init.__code__.co_argcount]
+    return dict(zip(names, init.__defaults__))
+
+_JSONIZER_DEFAULTS = jsonizerDefaults()
+
+def freezeConfigValue(value):
+    # リストなどはタプルに、辞書は項目のタプルにする。diagnostics, field_memoなどのオブジェクトはそのもの(同一性)で比べる
+    if isinstance(value, (list, tuple)):
+        return tuple(freezeConfigValue(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(value))
+    if isinstance(value, dict):
+        return tuple(sorted((k, freezeConfigValue(v)) for k, v in value.items()))
+    return value
+
+def normalizeConfig(kwargs):
+    # return: 既定値を補ったkwargsのハッシュ可能な表現。指定の有無・順序によらず、同じ設定なら同じになる
+    for name in kwargs:
+        if name not in _JSONIZER_DEFAULTS:
+            raise TypeError(f'__init__() got an unexpected keyword argument {name!r}')
+    return tuple((name, freezeConfigValue(kwargs.get(name, default))) for name, default in _JSONIZER_DEFAULTS.items())
+
+def pooledJsonizer(jsonizerClass, kwargs, config=None):
+    # return: jsonizerClass(**kwargs)と同じ設定の、共有されたインスタンス
+    if kwargs.get('profiler') is not None:
+        # 計測するjsonizerは共有しない(setProfilerで書き換えても、他のJsonizerに影響しない)
+        return jsonizerClass(**kwargs)
+    key = (jsonizerClass, config or normalizeConfig(kwargs))
+    try:
+        hash(key)
+    except TypeError:
+        # ハッシュできないオブジェクトを含む設定は共有しない
+        return jsonizerClass(**kwargs)
+    with _JSONIZER_POOL_LOCK:
+        jsonizer = _JSONIZER_POOL.get(key)
+        if jsonizer is None:
+            jsonizer = jsonizerClass(**kwargs)
+            _JSONIZER_POOL[key] = jsonizer
+    return jsonizer
+
+class CategoryJsonizers(dict):
+    # {データ種別: jsonizer}。データ種別ごとに、初めて参照されたときにプールから取り出す
+    def __init__(self, kwargs, projections=None):
+        super().__init__()
+        self.kwargs = kwargs
+        self.projections = projections or {}
+        self.config = normalizeConfig(kwargs)
+
+    def __missing__(self, dataCategory):
+        jsonizerClass = JSONIZER_CLASSES[dataCategory]
+        if dataCategory in self.projections:
+            # 射影するデータ種別ごとに、別のjsonizerを使う
+            kwargs = dict(self.kwargs, fields=self.projections[dataCategory])
+            jsonizer = pooledJsonizer(jsonizerClass, kwargs)
+        else:
+            jsonizer = pooledJsonizer(jsonizerClass, self.kwargs, self.config)
+        self[dataCategory] = jsonizer
+        return jsonizer
 
+class Jsonizer():
+    DATA_CATEGORIES = tuple(JSONIZER_CLASSES)
 
-class OMG03MessageJsonizer(ssmix2MessageJsonizer):
     def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='OMG-03':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='OMG-03'
-        super().__init__(**kwargs)
+        # データ種別ごとのjsonizerは初めて使うときに作り、同じ設定のJsonizerの間で共有する(pooledJsonizer)
+        # memo_size: 複合型フィールドの変換結果のメモの件数。全データ種別で1つのメモを共有する
+        # fields: 射影するフィールドのリスト(全データ種別)、または{データ種別: リスト}
+        if kwargs.get('memo_size') and kwargs.get('field_memo') is None:
+            kwargs['field_memo'] = LRUCache(kwargs['memo_size'])
+        projections = kwargs.pop('fields', None)
+        # pseudonymizer: pseudonym.Pseudonymizer。全データ種別で1つを共有する
+        self.pseudonymizer = kwargs.get('pseudonymizer')
+        if projections is not None and not isinstance(projections, dict):
+            kwargs['fields'] = projections
+            projections = None
+        self.kwargs = kwargs
+        self.jsonizerDict = CategoryJsonizers(kwargs, projections)
+    
+    def jsonize(self, dataCategory, message, issues=None):
+        return self.jsonizerDict[dataCategory].jsonize(message, issues)
 
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID', 'PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['AL1',]:
-                d.setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType == 'ORC':
-                d.setdefault(self.createNestedFieldName('ORDER'),[]).append(
-                    {segmentType:self.jsonizeSegment(segment)}
-                )
-            elif segmentType in ['TQ1','OBX']:
-                d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType =='OBR':
-                d[self.createNestedFieldName('ORDER')][-1][segmentType] = self.jsonizeSegment(segment)
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
+    def view(self, dataCategory, message, issues=None):
+        # message: メッセージの文字列、bytes、またはファイルのパス。return: lazy.Message
+        return self.jsonizerDict[dataCategory].view(message, issues)
 
-class OMG13MessageJsonizer(ssmix2MessageJsonizer):
-    def __init__(self, **kwargs):
-        if 'ssmix2_data_category' in kwargs and kwargs['ssmix2_data_category']!='OMG-13':
-            warnings.warn(f'ssmix2_data_categoryパラメータ：{kwargs["ssmix2_data_category"]}は無視されます。')
-        kwargs['ssmix2_data_category']='OMG-13'
-        super().__init__(**kwargs)
+    def jsonizeTo(self, dataCategory, message, fp, issues=None):
+        # json.dumps(self.jsonize(dataCategory, message), ensure_ascii=False)と同じテキストをfpに逐次書き出す
+        self.jsonizerDict[dataCategory].jsonizeTo(message, fp, issues)
 
-    def jsonize(self, message):
-        d = {}
-        gen = self.segmentGenerator(message)
-        for segment in gen:
-            segmentType = segment[:3]
-            if segmentType == 'MSH':
-                #FIELD_SEPARATOR = segment[3]
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType in ['PID', 'PV1']:
-                d[segmentType] = self.jsonizeSegment(segment)
-            elif segmentType == 'ORC':
-                d.setdefault(self.createNestedFieldName('ORDER'),[]).append(
-                    {segmentType:self.jsonizeSegment(segment)}
-                )
-            elif segmentType in ['TQ1','OBX']:
-                d[self.createNestedFieldName('ORDER')][-1].setdefault(self.createNestedFieldName(segmentType),[]).append(
-                    self.jsonizeSegment(segment)
-                )
-            elif segmentType in ['OBR']:
-                if self.createNestedFieldName('ORDER') not in d or (segmentType in d[self.createNestedFieldName('ORDER')][-1]):
-                    # 直前のORCが省略されていて、ORDERブロックを開始し、要素を開始する時
-                    # ORDERブロックは存在するものの、直前のORCが省略されていて、ORDERブロックの要素を開始する時
-                    d.setdefault(self.createNestedFieldName('ORDER'),[]).append(
-                    {segmentType:self.jsonizeSegment(segment)}
-                    )
-                else:
-                    d[self.createNestedFieldName('ORDER')][-1][segmentType] = self.jsonizeSegment(segment)
-            else:
-                warnings.warn(f'Undefined segment type: {segmentType} in {self.ssmix2DataCategory}. Message: {message}')
-        return d
+    def memoStats(self):
+        memo = self.kwargs.get('field_memo')
+        return memo.stats() if memo is not None else None
 
-class Jsonizer():
-    def __init__(self, **kwargs):
-        self.adtMessageJsonizer = ADTMessageJsonizer(**kwargs)
-        self.jsonizerDict = {
-            'ADT-00': self.adtMessageJsonizer,
-            'ADT-01': self.adtMessageJsonizer,
-            'ADT-12': self.adtMessageJsonizer,
-            'ADT-21': self.adtMessageJsonizer,
-            'ADT-22': self.adtMessageJsonizer,
-            'ADT-31': self.adtMessageJsonizer,
-            'ADT-32': self.adtMessageJsonizer,
-            'ADT-41': self.adtMessageJsonizer,
-            'ADT-42': self.adtMessageJsonizer,
-            'ADT-51': self.adtMessageJsonizer,
-            'ADT-52': self.adtMessageJsonizer,
-            'ADT-61': ADT61MessageJsonizer(**kwargs),
-            'PPR-01': PPR01MessageJsonizer(**kwargs),
-            'OMD': OMDMessageJsonizer(**kwargs),
-            'OMP-01': OMP01MessageJsonizer(**kwargs),
-            'OMP-11': OMP11MessageJsonizer(**kwargs),
-            'OMP-02': OMP02MessageJsonizer(**kwargs),
-            'OMP-12': OMP12MessageJsonizer(**kwargs),
-            'OML-01': OML01MessageJsonizer(**kwargs),
-            'OML-11': OML11MessageJsonizer(**kwargs),
-            'OMG-01': OMG01MessageJsonizer(**kwargs),
-            'OMG-11': OMG11MessageJsonizer(**kwargs),
-            'OMG-02': OMG02MessageJsonizer(**kwargs),
-            'OMG-12': OMG12MessageJsonizer(**kwargs),
-            'OMG-03': OMG03MessageJsonizer(**kwargs),
-            'OMG-13': OMG13MessageJsonizer(**kwargs)
-            }
-    
-    def jsonize(self, dataCategory, message):
-        return self.jsonizerDict[dataCategory].jsonize(message)
+    def setProfiler(self, profiler):
+        # 共有しているjsonizerは書き換えず、このJsonizer専用の計測するjsonizerに取り替える
+        self.kwargs['profiler'] = profiler
+        self.jsonizerDict = CategoryJsonizers(self.kwargs, self.jsonizerDict.projections)
@@ -0,0 +1,365 @@
+import argparse
+import asyncio
+import datetime
+import io
+import itertools
+import json
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .main import Jsonizer
+
+# MLLP(Minimal Lower Layer Protocol)でHL7 v2メッセージを受信し、ファイルを経由せずにJSON化するasyncioのサーバ。
+# フレーム: <VT(0x0B)> メッセージ <FS(0x1C)><CR(0x0D)>
+START_BLOCK = b'\x0b'
+END_BLOCK = b'\x1c\r'
+
+# MSH-9(メッセージ型^トリガーイベント)からデータ種別への対応。'メッセージ型^トリガーイベント'、'メッセージ型'の順に探す。
+# 値は文字列か、callable(message) -> データ種別(Noneなら未対応)。
+# RDE^O11(処方・注射オーダ)、RAS^O17(処方・注射実施)、OMG^O19(放射線・内視鏡・生理検査)はMSH-9だけでは区別できないため、
+# 既定では処方、放射線検査とする。注射なども受信する場合はcategory_mapで上書きする。
+DEFAULT_CATEGORY_MAP = {
+    'ADT^A08': 'ADT-00',
+    'ADT^A54': 'ADT-01', 'ADT^A55': 'ADT-01',
+    'ADT^A04': 'ADT-12',
+    'ADT^A14': 'ADT-21', 'ADT^A27': 'ADT-21',
+    'ADT^A01': 'ADT-22', 'ADT^A11': 'ADT-22',
+    'ADT^A21': 'ADT-31', 'ADT^A52': 'ADT-31',
+    'ADT^A22': 'ADT-32', 'ADT^A53': 'ADT-32',
+    'ADT^A15': 'ADT-41', 'ADT^A26': 'ADT-41',
+    'ADT^A02': 'ADT-42', 'ADT^A12': 'ADT-42',
+    'ADT^A16': 'ADT-51', 'ADT^A25': 'ADT-51',
+    'ADT^A03': 'ADT-52', 'ADT^A13': 'ADT-52',
+    'ADT^A60': 'ADT-61',
+    'PPR': 'PPR-01',
+    'OMD': 'OMD',
+    'RDE^O11': 'OMP-01',
+    'RAS^O17': 'OMP-11',
+    'OML^O33': 'OML-01',
+    'OUL^R22': 'OML-11',
+    'OMG^O19': 'OMG-01',
+}
+
+def splitMSH(message):
+    # return: MSHのフィールドのlist(MSH-nはfields[n - 1])と成分の区切り文字。MSHで始まらなければ(None, None)
+    if not message.startswith('MSH') or len(message) < 8:
+        return None, None
+    end = message.find('\r')
+    fields = (message if end < 0 else message[:end]).split(message[3])
+    return fields, fields[1][:1] or '^'
+
+def inferCategory(message, categoryMap=DEFAULT_CATEGORY_MAP):
+    # MSH-9からデータ種別を決める。return: データ種別。対応していなければNone
+    fields, componentSeparator = splitMSH(message)
+    if fields is None or len(fields) < 9:
+        return None
+    messageType = fields[8].split(componentSeparator)
+    for key in ('^'.join(messageType[:2]), messageType[0]):
+        if key in categoryMap:
+            category = categoryMap[key]
+            return category(message) if callable(category) else category
+    return None
+
+def asMessage(text):
+    # return: jsonizeに渡すメッセージ。改行を含まない文字列(MSHだけのメッセージ)はファイルのパスとみなされるので、
+    # セグメントのlistにする
+    return text if '\r' in text or '\n' in text else [text]
+
+def escapeText(text, separators='|^~\\&'):
+    # ACKに入れる文字列のHL7エスケープ
+    escapes = dict(zip(separators[:5], ('\\F\\', '\\S\\', '\\R\\', '\\E\\', '\\T\\')))
+    return ''.join(escapes.get(c, c) for c in text.replace('\r', ' ').replace('\n', ' '))
+
+def buildAck(message, code, controlId, text=None, errorCode=None):
+    # code: 'AA'(受理), 'AE'(エラー), 'AR'(拒否)。errorCode: HL7表0357のコード('207^Application internal error'など)
+    fields, componentSeparator = splitMSH(message)
+    if fields is None:
+        fields, componentSeparator = ['MSH', '^~\\&'], '^'
+    fields += [''] * (12 - len(fields))
+    separators = '|' + fields[1]
+    trigger = fields[8].split(componentSeparator)
+    trigger = trigger[1] if len(trigger) > 1 else ''
+    now = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    msh = '|'.join(['MSH', fields[1], fields[4], fields[5], fields[2], fields[3], now, '',
+        f'ACK^{trigger}^ACK', controlId, fields[10] or 'P', fields[11] or '2.5'])
+    msa = f'MSA|{code}|{fields[9]}'
+    if text:
+        msa += '|' + escapeText(text, separators)
+    segments = [msh, msa]
+    if errorCode:
+        segments.append(f'ERR|||{errorCode}^HL70357|E')
+    return '\r'.join(segments) + '\r'
+
+def frame(message, encoding='iso-2022-jp'):
+    return START_BLOCK + message.encode(encoding) + END_BLOCK
+
+async def readFrame(reader):
+    # return: フレームの中身(bytes)。接続が閉じられたらNone
+    try:
+        data = await reader.readuntil(END_BLOCK)
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise
+        return None
+    start = data.find(START_BLOCK)
+    return data[start + 1 if start >= 0 else 0:-len(END_BLOCK)]
+
+_workerJsonizer = None
+
+def _initWorker(jsonizerKwargs):
+    global _workerJsonizer
+    # Ctrl+Cはサーバのプロセスで受けて、プールを終了する
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _workerJsonizer = Jsonizer(**jsonizerKwargs)
+
+def _jsonizeMessage(dataCategory, message, text, jsonizer=None):
+    # text: Trueならjson.dumps(..., ensure_ascii=False)と同じテキストを返す
+    jsonizer = jsonizer or _workerJsonizer
+    if text:
+        buffer = io.StringIO()
+        jsonizer.jsonizeTo(dataCategory, asMessage(message), buffer)
+        return buffer.getvalue()
+    return jsonizer.jsonize(dataCategory, asMessage(message))
+
+class MLLPServer():
+    # sink(dataCategory, result, message): 変換結果の受け取り先。コルーチン関数でもよい。
+    #   sinkが正常に返ってからACK(AA)を返す。例外を投げるとACK(AE)を返す。
+    #   同じ接続のメッセージは受信順にsinkに渡す(変換は並列に行う)。
+    # category_map: DEFAULT_CATEGORY_MAPに追加・上書きする対応
+    # executor: 'process'(既定。CPUを使う変換をプロセスプールで行う), 'thread', またはExecutor
+    # workers: プールの大きさ。Noneならos.cpu_count()
+    # max_pending: サーバ全体で変換中・sinkへ渡す前のメッセージの上限。
+    #   上限に達すると新しいフレームを読まないので、sinkが遅れるとTCPで送信側に背圧がかかる
+    # window: 1接続でACKを返す前に先読みするメッセージ数
+    # text: Trueならresultはjsonのテキスト(プロセス間の受け渡しも軽くなる)
+    # kwargsはJsonizerに渡される
+    def __init__(self, sink, host='127.0.0.1', port=2575, category_map=None, executor='process', workers=None,
+            max_pending=256, window=32, text=False, max_message_size=16 * 1024 * 1024, **kwargs):
+        self.sink = sink
+        self.host = host
+        self.port = port
+        self.categoryMap = {**DEFAULT_CATEGORY_MAP, **(category_map or {})}
+        self.encoding = kwargs.get('encoding', 'iso-2022-jp')
+        self.text = text
+        self.window = window
+        self.maxPending = max_pending
+        self.maxMessageSize = max_message_size
+        self.jsonizer = None
+        if executor == 'process':
+            self.executor = ProcessPoolExecutor(workers or os.cpu_count(), initializer=_initWorker,
+                initargs=(kwargs,))
+        elif executor == 'thread':
+            self.jsonizer = Jsonizer(**kwargs)
+            self.executor = ThreadPoolExecutor(workers or os.cpu_count())
+        else:
+            self.jsonizer = Jsonizer(**kwargs)
+            self.executor = executor
+        self.ownsExecutor = executor in ('process', 'thread')
+        self.controlIds = itertools.count(1)
+        self.counts = {'received': 0, 'accepted': 0, 'errors': 0, 'rejected': 0}
+        self.connections = 0
+        self.handlers = set()
+        self.server = None
+        self.pending = None
+
+    async def start(self):
+        self.pending = asyncio.Semaphore(self.maxPending)
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=self.maxMessageSize)
+        if self.port == 0:
+            self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serveForever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            for task in list(self.handlers):
+                task.cancel()
+            await asyncio.gather(*self.handlers, return_exceptions=True)
+            await self.server.wait_closed()
+            self.server = None
+        if self.ownsExecutor:
+            self.executor.shutdown()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def stats(self):
+        return {**self.counts, 'connections': self.connections}
+
+    def ackControlId(self):
+        return f'ACK{next(self.controlIds):017d}'
+
+    def convert(self, dataCategory, message):
+        # return: 変換結果のFuture
+        loop = asyncio.get_running_loop()
+        if self.jsonizer is None:
+            return loop.run_in_executor(self.executor, _jsonizeMessage, dataCategory, message, self.text)
+        return loop.run_in_executor(self.executor, _jsonizeMessage, dataCategory, message, self.text,
+            self.jsonizer)
+
+    async def handle(self, reader, writer):
+        # 読み込み側(receive)は変換を投入してwindowまで先読みし、書き込み側(deliver)が受信順にsinkへ渡してACKを返す
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        self.connections += 1
+        queue = asyncio.Queue(self.window)
+        deliver = asyncio.create_task(self.deliver(queue, writer))
+        try:
+            await self.receive(reader, queue)
+            await queue.put(None)
+            await deliver
+        except asyncio.CancelledError:
+            # サーバの終了
+            pass
+        finally:
+            # receiveが例外で終わったときも、deliverがqueueを待ち続けないようにする
+            deliver.cancel()
+            # deliverが受け取らなかったメッセージの変換を取り消し、枠を返す
+            while not queue.empty():
+                item = queue.get_nowait()
+                if item is None:
+                    continue
+                if isinstance(item[2], asyncio.Future):
+                    item[2].cancel()
+                self.pending.release()
+            writer.close()
+            self.connections -= 1
+            self.handlers.discard(task)
+
+    async def receive(self, reader, queue):
+        try:
+            while True:
+                data = await readFrame(reader)
+                if data is None:
+                    return
+                await self.pending.acquire()
+                self.counts['received'] += 1
+                try:
+                    await queue.put(self.submit(data))
+                except BaseException:
+                    # queueに入らなかったメッセージの枠を返す
+                    self.pending.release()
+                    raise
+        except (asyncio.LimitOverrunError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    def submit(self, data):
+        # return: deliverに渡す(message, dataCategory, 変換結果のFuture)。
+        # 文字コードの誤りは(None, None, エラーの内容)、対応しないメッセージ型は(message, None, None)
+        try:
+            message = data.decode(self.encoding)
+        except UnicodeDecodeError as e:
+            return None, None, f'{type(e).__name__}: {e}'
+        # 改行はLFやCRLFで送られることもある
+        message = message.replace('\r\n', '\r').replace('\n', '\r').strip('\r')
+        dataCategory = inferCategory(message, self.categoryMap)
+        if dataCategory is None:
+            return message, None, None
+        return message, dataCategory, self.convert(dataCategory, message)
+
+    async def deliver(self, queue, writer):
+        # 接続が切れても、先読みしたメッセージはsinkへ渡す(ACKを受け取れなかった送信側は再送する)
+        connected = True
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            try:
+                ack = await self.process(*item)
+            finally:
+                self.pending.release()
+            if not connected:
+                continue
+            try:
+                writer.write(frame(ack, self.encoding))
+                await writer.drain()
+            except ConnectionError:
+                connected = False
+
+    async def process(self, message, dataCategory, future):
+        # return: ACKのテキスト
+        if message is None:
+            # 文字コードの誤り。futureはエラーの内容
+            self.counts['errors'] += 1
+            return buildAck('', 'AE', self.ackControlId(), future, '207^Application internal error')
+        if dataCategory is None:
+            self.counts['rejected'] += 1
+            fields, componentSeparator = splitMSH(message)
+            messageType = fields[8] if fields is not None and len(fields) > 8 else ''
+            return buildAck(message, 'AR', self.ackControlId(), f'Unsupported message type: {messageType}',
+                '200^Unsupported message type')
+        try:
+            result = await future
+            accepted = self.sink(dataCategory, result, message)
+            if asyncio.iscoroutine(accepted) or isinstance(accepted, asyncio.Future):
+                await accepted
+        except Exception as e:
+            self.counts['errors'] += 1
+            return buildAck(message, 'AE', self.ackControlId(), f'{type(e).__name__}: {e}',
+                '207^Application internal error')
+        self.counts['accepted'] += 1
+        return buildAck(message, 'AA', self.ackControlId())
+
+async def sendMessages(messages, host='127.0.0.1', port=2575, encoding='iso-2022-jp', window=32):
+    # MLLPのクライアント。messagesを1つの接続で送り、ACKのテキストのlistを返す。windowまでACKを待たずに送る
+    reader, writer = await asyncio.open_connection(host, port, limit=16 * 1024 * 1024)
+    acks = []
+    inflight = 0
+    try:
+        for message in messages:
+            writer.write(frame(message, encoding))
+            inflight += 1
+            if inflight >= window:
+                await writer.drain()
+                acks.append((await readFrame(reader)).decode(encoding))
+                inflight -= 1
+        await writer.drain()
+        for _ in range(inflight):
+            acks.append((await readFrame(reader)).decode(encoding))
+    finally:
+        writer.close()
+    return acks
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ssmix2jsonize-mllp',
+        description='MLLPで受信したHL7メッセージをNDJSONに変換します。')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2575)
+    parser.add_argument('--output', default=None, help='出力するNDJSONファイル。省略すると標準出力')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-pending', type=int, default=256)
+    parser.add_argument('--category-map', default=None,
+        help='MSH-9とデータ種別の対応を上書きするJSON。例: {"RDE^O11": "OMP-02"}')
+    parser.add_argument('--no-deidentify', dest='deidentify', action='store_false')
+    parser.add_argument('--encoding', default='iso-2022-jp')
+    args = parser.parse_args(argv)
+
+    output = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+
+    def sink(dataCategory, result, message):
+        output.write(f'{{"ssmix2_data_category": {json.dumps(dataCategory)}, "message": {result}}}\n')
+
+    server = MLLPServer(sink, args.host, args.port, json.loads(args.category_map or '{}'), workers=args.workers,
+        max_pending=args.max_pending, text=True, deidentify=args.deidentify, encoding=args.encoding)
+    try:
+        asyncio.run(server.serveForever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
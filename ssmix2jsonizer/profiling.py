@@ -0,0 +1,137 @@
+import threading
+import time
+
+from .main import SEGMENT_STRUCTURE, FIELD_VARIES, PRIMARY_CONVERTER_SET
+
+# jsonizerの計測。Jsonizer(profiler=Profiler())またはjsonizer.setProfiler(profiler)で有効にする。
+# 有効にしたjsonizerだけ、jsonizeSegmentとフィールドプランの変換関数を計測用の関数で包むので、
+# 無効なとき(既定)の変換処理には何も加わらない。
+
+class ProfiledFieldPlans(dict):
+    # FieldPlansの変換関数を、データ型ごとに計測する関数で包んだもの
+    def __init__(self, fieldPlans, profiler):
+        super().__init__()
+        self.fieldPlans = fieldPlans
+        self.profiler = profiler
+
+    def __missing__(self, segmentType):
+        fieldStructures = SEGMENT_STRUCTURE[segmentType]
+        segmentPlan = []
+        for seq, (fieldName, action, isRepeat, converter) in enumerate(self.fieldPlans[segmentType]):
+            if converter is None:
+                pass
+            elif action == FIELD_VARIES:
+                converter = {variantDataType: (variantName, variantAction,
+                        self.profiler.wrapConverter(variantConverter, variantDataType))
+                    for variantDataType, (variantName, variantAction, variantConverter) in converter.items()}
+            else:
+                converter = self.profiler.wrapConverter(converter, fieldStructures[seq]['DataType'])
+            segmentPlan.append((fieldName, action, isRepeat, converter))
+        segmentPlan = tuple(segmentPlan)
+        self[segmentType] = segmentPlan
+        return segmentPlan
+
+class Profiler():
+    # セグメント型ごと、データ型ごとの件数・時間(ns)・入力バイト数(UTF-8)を数える。
+    # フック: onSegment(hook) hook(segmentType, segment, result, elapsedNs)
+    #         onField(hook)   hook(dataType, data, value, elapsedNs)
+    # 複合型フィールドのメモ(memo_size)でヒットしたフィールドは、データ型の計測に含まれない(プリミティブ型は常に計測する)
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.segments = {} # {segmentType: [count, ns, bytes]}
+        self.dataTypes = {} # {dataType: [count, ns, bytes]}
+        self.segmentHooks = []
+        self.fieldHooks = []
+        self._plans = {}
+
+    def onSegment(self, hook):
+        self.segmentHooks.append(hook)
+        return hook
+
+    def onField(self, hook):
+        self.fieldHooks.append(hook)
+        return hook
+
+    def wrapPlans(self, fieldPlans):
+        # 同じFieldPlansを使うjsonizer(ADTなど)では、計測用のプランも共有する
+        key = id(fieldPlans)
+        if key not in self._plans:
+            self._plans[key] = ProfiledFieldPlans(fieldPlans, self)
+        return self._plans[key]
+
+    def wrapConverter(self, converter, dataType):
+        counter = self.dataTypes.setdefault(dataType, [0, 0, 0])
+        clock = time.perf_counter_ns
+        lock = self.lock
+        hooks = self.fieldHooks
+
+        def convert(context, data):
+            start = clock()
+            value = converter(context, data)
+            elapsed = clock() - start
+            size = len(data.encode('utf-8'))
+            with lock:
+                counter[0] += 1
+                counter[1] += elapsed
+                counter[2] += size
+            for hook in hooks:
+                hook(dataType, data, value, elapsed)
+            return value
+        # 包んだ変換関数もプリミティブ型として扱い、メモ(memo_size)の対象にしない
+        if converter in PRIMARY_CONVERTER_SET:
+            PRIMARY_CONVERTER_SET.add(convert)
+        return convert
+
+    def wrapSegment(self, jsonizeSegment):
+        clock = time.perf_counter_ns
+        lock = self.lock
+        hooks = self.segmentHooks
+        segments = self.segments
+
+        def profiledJsonizeSegment(segment, context=None):
+            start = clock()
+            result = jsonizeSegment(segment, context)
+            elapsed = clock() - start
+            segmentType = segment[:3]
+            size = len(segment.encode('utf-8'))
+            with lock:
+                counter = segments.setdefault(segmentType, [0, 0, 0])
+                counter[0] += 1
+                counter[1] += elapsed
+                counter[2] += size
+            for hook in hooks:
+                hook(segmentType, segment, result, elapsed)
+            return result
+        return profiledJsonizeSegment
+
+    def reset(self):
+        with self.lock:
+            for counters in (self.segments, self.dataTypes):
+                for counter in counters.values():
+                    counter[:] = [0, 0, 0]
+
+    def asDict(self):
+        # return: {'segments': {segmentType: {'count', 'ns', 'bytes'}}, 'data_types': {dataType: {...}}}
+        with self.lock:
+            return {name: {key: {'count': count, 'ns': ns, 'bytes': size}
+                    for key, (count, ns, size) in sorted(counters.items()) if count}
+                for name, counters in (('segments', self.segments), ('data_types', self.dataTypes))}
+
+    def prometheus(self, prefix='ssmix2jsonizer'):
+        # return: Prometheusのテキスト形式
+        lines = []
+        stats = self.asDict()
+        for name, label in (('segments', 'segment_type'), ('data_types', 'data_type')):
+            unit = name[:-1]
+            for metric, key, scale, description in (
+                    ('total', 'count', 1, 'Number of converted'),
+                    ('seconds_total', 'ns', 1e-9, 'Time spent converting'),
+                    ('bytes_total', 'bytes', 1, 'UTF-8 bytes of input to')):
+                metricName = f'{prefix}_{name}_total' if key == 'count' else f'{prefix}_{unit}_{metric}'
+                lines.append(f'# HELP {metricName} {description} {name.replace("_", " ")}.')
+                lines.append(f'# TYPE {metricName} counter')
+                # データ型''は各セグメントの0番目のフィールド(セグメント型)
+                for labelValue, values in stats[name].items():
+                    value = values[key] * scale if scale != 1 else values[key]
+                    lines.append(f'{metricName}{{{label}="{labelValue}"}} {value}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,186 @@
+import hashlib
+import hmac
+import threading
+
+from .cache import LRUCache
+from .main import SEGMENT_STRUCTURE, PRIMARY_DATA_TYPES, FIELD_CONVERT, FIELD_MASK, compileProjection
+
+# 仮名化。Jsonizer(pseudonymizer=Pseudonymizer(key, store='tokens.sqlite'))で、識別子のフィールドを
+# 鍵つきハッシュ(HMAC-SHA256)のトークンに置き換える。同じ鍵なら同じIDは常に同じトークンになるので、
+# メッセージをまたいで患者を突き合わせられる。
+# 複合型(CX, EIなど)は第1成分(ID)だけを置き換え、チェックディジット、割り当て機関、IDの種類は残す。
+# トークンと元の値の対応はプロセス内のLRUにメモし、storeを指定するとSQLiteにまとめて(batch_size件ごとに)記録する。
+# トークンは鍵から決まるので、変換中にstoreを読むことはない。storeは鍵を持つ管理者が元の値を引くため(lookup)のもの。
+
+# 既定の対象。PID-2 Patient ID, PID-3 Patient Identifier List, PID-4 Alternate Patient ID, PV1-19 Visit Number
+PSEUDONYM_FIELDS = ['PID.2', 'PID.3', 'PID.4', 'PV1.19']
+# SQLiteのプレースホルダの数の上限(999)より小さく
+LOOKUP_CHUNK = 500
+
+class PseudonymizedFieldPlans(dict):
+    # FieldPlansの対象フィールドの変換関数を、値をトークンに置き換えてから変換する関数で包んだもの
+    def __init__(self, fieldPlans, pseudonymizer, fields):
+        super().__init__()
+        self.fieldPlans = fieldPlans
+        self.pseudonymizer = pseudonymizer
+        self.fields = dict(fields)
+
+    def __missing__(self, segmentType):
+        segmentPlan = self.fieldPlans[segmentType]
+        if segmentType in self.fields:
+            fieldStructures = SEGMENT_STRUCTURE[segmentType]
+            segmentPlan = list(segmentPlan)
+            for seq in self.fields[segmentType]:
+                fieldName, action, isRepeat, converter = segmentPlan[seq]
+                # 匿名化で伏せるフィールド(IDENTITY_FIELDS)も、'**DEIDENTIFIED**'の代わりにトークンにする。
+                # 出力しないフィールド、MSH-2、OBX-5はそのまま
+                if action not in (FIELD_CONVERT, FIELD_MASK):
+                    continue
+                composite = fieldStructures[seq]['DataType'] not in PRIMARY_DATA_TYPES
+                segmentPlan[seq] = (fieldName, FIELD_CONVERT, isRepeat,
+                    self.pseudonymizer.wrapConverter(converter, composite))
+            segmentPlan = tuple(segmentPlan)
+        self[segmentType] = segmentPlan
+        return segmentPlan
+
+class Pseudonymizer():
+    # key: 秘密鍵(bytesまたはstr)。length: トークンの16進数の桁数。prefix: トークンの前に付ける文字列
+    # store: トークンと元の値を記録するSQLiteファイルのパス。別の鍵で作られたstoreはValueError
+    # プロセスプールに渡すと、各プロセスでstoreを開き直す
+    def __init__(self, key, store=None, memo_size=65536, length=32, prefix='', batch_size=1024):
+        self.key = key.encode('utf-8') if isinstance(key, str) else bytes(key)
+        self.storePath = store
+        self.memoSize = memo_size
+        self.length = length
+        self.prefix = prefix
+        self.batchSize = batch_size
+        # storeに鍵の指紋を記録し、別の鍵のトークンが混ざらないようにする
+        self.keyId = hmac.new(self.key, b'ssmix2jsonizer pseudonym key', hashlib.sha256).hexdigest()[:16]
+        self._setup()
+
+    def _setup(self):
+        self.memo = LRUCache(self.memoSize)
+        self.lock = threading.Lock()
+        self.pending = []
+        self.connection = None
+        self._plans = {}
+
+    def __getstate__(self):
+        return {'key': self.key, 'storePath': self.storePath, 'memoSize': self.memoSize, 'length': self.length,
+            'prefix': self.prefix, 'batchSize': self.batchSize, 'keyId': self.keyId}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setup()
+
+    def __repr__(self):
+        # Manifestの設定などに使われるので、鍵そのものは含めない
+        return f'Pseudonymizer(key_id={self.keyId!r}, length={self.length}, prefix={self.prefix!r})'
+
+    def configKey(self):
+        return (self.keyId, self.length, self.prefix)
+
+    def token(self, value):
+        token = self.memo.get(value)
+        if token is None:
+            token = self.prefix + hmac.new(self.key, value.encode('utf-8'), hashlib.sha256).hexdigest()[:self.length]
+            self.memo.put(value, token)
+            if self.storePath is not None:
+                with self.lock:
+                    self.pending.append((token, value))
+                    if len(self.pending) >= self.batchSize:
+                        self._flush()
+        return token
+
+    def tokens(self, values):
+        # return: valuesのそれぞれのトークンのlist
+        tokens = {}
+        return [tokens[value] if value in tokens else tokens.setdefault(value, self.token(value))
+            for value in values]
+
+    def pseudonymize(self, context, data, composite):
+        # data: フィールド(繰り返しの1つ)の文字列。return: IDをトークンに置き換えた文字列
+        components = data.split(context.COMPONENT_SEPARATOR) if composite else [data]
+        value = components[0]
+        if not value:
+            return data
+        if context.ESCAPE_CHARACTER in value:
+            value = context.removeEscape(value)
+        components[0] = self.token(value)
+        return context.COMPONENT_SEPARATOR.join(components)
+
+    def wrapConverter(self, converter, composite):
+        pseudonymize = self.pseudonymize
+
+        def convert(context, data):
+            return converter(context, pseudonymize(context, data, composite))
+        return convert
+
+    def wrapPlans(self, fieldPlans, fields=None):
+        # fields: ['PID.3', ...]。Noneなら PSEUDONYM_FIELDS。同じFieldPlansと対象なら、包んだプランも共有する
+        fields = compileProjection(PSEUDONYM_FIELDS if fields is None else fields)
+        key = (id(fieldPlans), fields)
+        if key not in self._plans:
+            self._plans[key] = PseudonymizedFieldPlans(fieldPlans, self, fields)
+        return self._plans[key]
+
+    def _connect(self):
+        if self.connection is None:
+            import sqlite3
+            self.connection = sqlite3.connect(self.storePath, timeout=60, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS tokens (token TEXT PRIMARY KEY, value TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+            self.connection.execute("INSERT OR IGNORE INTO meta VALUES ('key_id', ?)", (self.keyId,))
+            self.connection.commit()
+            row = self.connection.execute("SELECT value FROM meta WHERE name = 'key_id'").fetchone()
+            if row[0] != self.keyId:
+                self.connection.close()
+                self.connection = None
+                raise ValueError(f'{self.storePath} was created with a different key.')
+        return self.connection
+
+    def _flush(self):
+        if not self.pending:
+            return
+        connection = self._connect()
+        connection.executemany('INSERT OR IGNORE INTO tokens VALUES (?, ?)', self.pending)
+        connection.commit()
+        self.pending = []
+
+    def flush(self):
+        # メモリ上の対応をstoreに書き出す
+        with self.lock:
+            self._flush()
+
+    def lookup(self, tokens):
+        # return: {トークン: 元の値}。storeに無いトークンは含まれない
+        if self.storePath is None:
+            raise ValueError('lookup requires a token store.')
+        tokens = list(set(tokens))
+        found = {}
+        with self.lock:
+            self._flush()
+            connection = self._connect()
+            for i in range(0, len(tokens), LOOKUP_CHUNK):
+                chunk = tokens[i:i + LOOKUP_CHUNK]
+                found.update(connection.execute(
+                    f'SELECT token, value FROM tokens WHERE token IN ({",".join("?" * len(chunk))})', chunk))
+        return found
+
+    def stats(self):
+        return self.memo.stats()
+
+    def close(self):
+        with self.lock:
+            if self.storePath is not None:
+                self._flush()
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,114 @@
+import marshal
+import os
+import sys
+import threading
+from collections.abc import Mapping
+
+JSON_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'json')
+CACHE_DIR = os.path.join(JSON_DIR, '__pycache__')
+
+# Falseにすると、バイナリキャッシュを読み書きせず毎回jsonを読む
+USE_SCHEMA_CACHE = True
+
+class SchemaTable(Mapping):
+    # json/以下のスキーマ表を、初めて参照されたときに読み込むMapping。
+    # キャッシュ(marshal)はトップレベルのキー(データ種別、セグメント型、データ型)ごとに直列化してあり、
+    # 値は参照されたキーの分だけ復元する。キャッシュにはjsonの(st_mtime_ns, st_size)とハッシュを記録し、
+    # statが一致すればjsonを読まない。一致しなければjsonを読んでハッシュを比べ、変わっていればキャッシュを作り直す。
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.jsonPath = os.path.join(JSON_DIR, fileName)
+        self._blobs = None
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def cachePath(self):
+        cacheTag = sys.implementation.cache_tag or 'marshal'
+        return os.path.join(CACHE_DIR, f'{os.path.splitext(self.fileName)[0]}.{cacheTag}.bin')
+
+    def _load(self):
+        with self._lock:
+            if self._blobs is None:
+                self._loadUnlocked()
+
+    def _loadUnlocked(self):
+        cached = None
+        if USE_SCHEMA_CACHE:
+            stat = os.stat(self.jsonPath)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            cached = self._readCache()
+            if cached is not None and cached[0] == stamp:
+                self._blobs = cached[2]
+                return
+        import hashlib
+        with open(self.jsonPath, 'rb') as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        if cached is not None and cached[1] == digest:
+            # 内容は同じで、mtimeだけが変わった(チェックアウトし直したなど)。statを記録し直す
+            self._blobs = cached[2]
+            self._writeCache(stamp, digest, cached[2])
+            return
+        import json
+        table = json.loads(raw.decode('utf-8'))
+        self._values.update(table)
+        self._blobs = {key: None for key in table}
+        if USE_SCHEMA_CACHE:
+            self._writeCache(stamp, digest, {key: marshal.dumps(value) for key, value in table.items()})
+
+    def _readCache(self):
+        # return: (stamp, digest, blobs) or None
+        try:
+            with open(self.cachePath(), 'rb') as f:
+                stamp, digest, blobs = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        return tuple(stamp), digest, blobs
+
+    def _writeCache(self, stamp, digest, blobs):
+        # パッケージが書き込み不可の場所にあれば、キャッシュは作らない
+        path = self.cachePath()
+        tmpPath = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(tmpPath, 'wb') as f:
+                marshal.dump((stamp, digest, blobs), f)
+            os.replace(tmpPath, path)
+        except OSError:
+            try:
+                os.remove(tmpPath)
+            except OSError:
+                pass
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        if self._blobs is None:
+            self._load()
+            if key in self._values:
+                return self._values[key]
+        blob = self._blobs[key]
+        value = self._values.setdefault(key, marshal.loads(blob))
+        return value
+
+    def __iter__(self):
+        if self._blobs is None:
+            self._load()
+        return iter(self._blobs)
+
+    def __len__(self):
+        if self._blobs is None:
+            self._load()
+        return len(self._blobs)
+
+    def __contains__(self, key):
+        if key in self._values:
+            return True
+        if self._blobs is None:
+            self._load()
+        return key in self._blobs
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.fileName!r})'
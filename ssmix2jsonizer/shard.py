@@ -0,0 +1,197 @@
+import json
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .bulk import chunked, walkStorage, _initWorker, _convertChunk
+
+# 標準化ストレージの分割変換。pid[0:3]のディレクトリをshard_count個のシャードに決まった規則(CRC32)で割り当て、
+# シャードごとに独立したプロセス(別のノードでもよい)で変換する。プロセス間で共有するのはファイルシステムだけ。
+# シャードの出力は出力ディレクトリの
+#   shard-IIII-of-NNNN.ndjson             変換結果(bulk.convertStorageと同じ形式)
+#   shard-IIII-of-NNNN.errors.ndjson      失敗したファイル
+#   shard-IIII-of-NNNN.checkpoint         進捗(JSON Lines)
+# 変換は<pid[0:3]>/<pid[3:6]>のディレクトリ(単位)ごとに名前順に行い、単位を書き終えるごとに出力をfsyncしてから、
+# 出力・エラーのファイルの長さと集計をチェックポイントに追記する。
+# 途中で止まったシャードを同じ引数で再実行すると、出力を最後のチェックポイントの長さまで切り詰め、
+# 記録済みの単位を飛ばして続きから変換するので、同じメッセージが2回出力されることはない。
+# 再実行時に増えていた単位も変換する。
+
+# <pid[0:3]>/<pid[3:6]>
+UNIT_DEPTH = 2
+
+def shardOf(prefix, shardCount):
+    # return: pid[0:3]のディレクトリ名を割り当てるシャードの番号。ノード、Pythonのバージョンによらず同じ
+    return zlib.crc32(prefix.encode('utf-8')) % shardCount
+
+def listDirectories(directory):
+    try:
+        return sorted(entry.name for entry in os.scandir(directory) if entry.is_dir(follow_symlinks=False))
+    except OSError:
+        return []
+
+def shardUnits(root, shardIndex, shardCount):
+    # return: シャードに割り当てられた単位('<pid[0:3]>/<pid[3:6]>')を名前順にyieldする
+    for prefix in listDirectories(root):
+        if shardOf(prefix, shardCount) != shardIndex:
+            continue
+        for second in listDirectories(os.path.join(root, prefix)):
+            yield f'{prefix}/{second}'
+
+def shardName(shardIndex, shardCount):
+    return f'shard-{shardIndex:04d}-of-{shardCount:04d}'
+
+class Checkpoint():
+    # シャードの進捗。1行目に設定、以降は単位を書き終えるごとに
+    # {"unit": ..., "output": 出力の長さ, "errors": エラーの長さ, "summary": {...}}を追記する。
+    # 書きかけの行(追記中に止まった場合)は読み込み時に捨てる。設定の異なるチェックポイントはValueError
+    def __init__(self, path, config):
+        self.path = path
+        self.done = set()
+        self.output = 0
+        self.errors = 0
+        self.summary = {'converted': 0, 'failed': 0, 'skipped': 0, 'units': 0}
+        valid = 0
+        header = None
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b'\n'):
+                        break
+                    valid += len(line)
+                    if header is None:
+                        header = entry
+                        continue
+                    self.done.add(entry['unit'])
+                    self.output = entry['output']
+                    self.errors = entry['errors']
+                    self.summary = entry['summary']
+        if header is not None and header['config'] != config:
+            raise ValueError(f'{path} was written with a different configuration.')
+        self.file = open(path, 'ab')
+        self.file.truncate(valid)
+        if header is None:
+            self.append({'config': config})
+
+    def append(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def record(self, unit, output, errors, summary):
+        self.done.add(unit)
+        self.output = output
+        self.errors = errors
+        self.summary = dict(summary)
+        self.append({'unit': unit, 'output': output, 'errors': errors, 'summary': self.summary})
+
+    def close(self):
+        self.file.close()
+
+def readCheckpoint(path):
+    # return: チェックポイントの最後の集計。単位を1つも書き終えていなければNone
+    summary = None
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            summary = entry.get('summary', summary)
+    return summary
+
+def shardSummaries(outputDir):
+    # return: {シャード名: 集計}。全ノードのシャードの進捗をまとめて見るときに使う
+    summaries = {}
+    for name in sorted(os.listdir(outputDir)):
+        if name.startswith('shard-') and name.endswith('.checkpoint'):
+            summaries[name[:-len('.checkpoint')]] = readCheckpoint(os.path.join(outputDir, name))
+    return summaries
+
+def openTruncated(path, size):
+    # 追記用に開き、最後のチェックポイントより後に書かれた部分を捨てる
+    f = open(path, 'ab')
+    f.truncate(size)
+    return f
+
+def syncFile(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+def convertShard(root, outputDir, shard_index, shard_count, processes=None, chunksize=256, **kwargs):
+    # シャードshard_index(0から)に割り当てられた単位を、プロセスプールで並列に変換する。
+    # 途中で止まった場合は同じ引数で再実行すると続きから変換する。kwargsはJsonizerにそのまま渡される。
+    # return: シャード全体(前回までの分を含む)の{'converted': 件数, 'failed': 件数, 'skipped': データ種別不明の件数,
+    #   'units': 単位の数}
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f'shard_index must be in [0, {shard_count}). {shard_index} was given.')
+    root = os.path.abspath(os.fspath(root))
+    processes = processes or os.cpu_count() or 1
+    os.makedirs(outputDir, exist_ok=True)
+    name = os.path.join(outputDir, shardName(shard_index, shard_count))
+    checkpoint = Checkpoint(name + '.checkpoint', json.dumps(kwargs, sort_keys=True, default=repr))
+    summary = dict(checkpoint.summary)
+    output = openTruncated(name + '.ndjson', checkpoint.output)
+    errorOutput = openTruncated(name + '.errors.ndjson', checkpoint.errors)
+
+    def unitTasks(unit):
+        # return: (chunk, 単位の最後のチャンクか, データ種別不明の件数)をyieldする。最後のチャンクは空のこともある
+        skipped = 0
+
+        def files():
+            nonlocal skipped
+            for dataCategory, path in walkStorage(os.path.join(root, unit), UNIT_DEPTH):
+                if dataCategory is None:
+                    skipped += 1
+                    continue
+                yield dataCategory, path, None
+
+        previous = None
+        for chunk in chunked(files(), chunksize):
+            if previous is not None:
+                yield previous, False, 0
+            previous = chunk
+        yield previous or [], True, skipped
+
+    # 単位の順に書き出すため、投入した順に回収する
+    pending = deque()
+
+    def collect():
+        future, unit, last, skipped = pending.popleft()
+        if future is not None:
+            text, count, errors, _ = future.result()
+            output.write(text.encode('utf-8'))
+            summary['converted'] += count
+            summary['failed'] += len(errors)
+            for path, error in errors:
+                errorOutput.write((json.dumps({'path': path, 'error': error}, ensure_ascii=False) + '\n').encode('utf-8'))
+        summary['skipped'] += skipped
+        if last:
+            summary['units'] += 1
+            # チェックポイントに記録する前に出力を書き出しておく
+            syncFile(output)
+            syncFile(errorOutput)
+            checkpoint.record(unit, output.tell(), errorOutput.tell(), summary)
+
+    try:
+        with ProcessPoolExecutor(processes, initializer=_initWorker, initargs=(root, kwargs)) as executor:
+            for unit in shardUnits(root, shard_index, shard_count):
+                if unit in checkpoint.done:
+                    continue
+                for chunk, last, skipped in unitTasks(unit):
+                    # 走査中のファイル一覧を全てキューに積まないよう、実行中のタスク数を制限する
+                    while len(pending) >= processes * 2:
+                        collect()
+                    pending.append((executor.submit(_convertChunk, chunk) if chunk else None, unit, last, skipped))
+            while pending:
+                collect()
+    finally:
+        output.close()
+        errorOutput.close()
+        checkpoint.close()
+    return summary
@@ -0,0 +1,201 @@
+import gzip
+import os
+import queue
+import threading
+
+# 変換結果(NDJSONのテキスト)の出力先。圧縮(gzip, zstd)と、大きさ・行数によるファイルの切り替え(ローテーション)を行い、
+# 圧縮と書き込みは別スレッドで行う。zlibとzstdは圧縮中にGILを解放するので、変換(呼び出し側のスレッド)と重なる。
+#
+#   with OutputSink('out/part-00000.ndjson', compression='gzip', max_bytes=256 * 1024 * 1024) as sink:
+#       jsonizer.jsonizeTo('ADT-00', message, sink)
+#       sink.write('\n')
+#   sink.paths  # ['out/part-00000.00000.ndjson.gz', 'out/part-00000.00001.ndjson.gz', ...]
+#
+# 書き込んだテキストはbuffer_sizeまでためてから、まとめて書き込みスレッドに渡す。書き込みスレッドの処理待ちが
+# queue_size件を超えると、writeは空くまで待つ(背圧)。書き込みスレッドで起きた例外は、次のwrite, flush, closeで送出する。
+# ファイルの切り替えは行の区切りでのみ行うので、1行(1メッセージ)が2つのファイルに分かれることはない。
+
+COMPRESSIONS = ('gzip', 'zstd')
+SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+# flushの合図
+_FLUSH = object()
+
+def zstdModule():
+    # return: Python 3.14以降のcompression.zstd、無ければzstandard。どちらも無ければImportError
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        raise ImportError('zstd compression requires Python 3.14 or later, or the zstandard package.')
+
+def openCompressed(raw, compression, level=None):
+    # raw: 書き込み用のバイナリファイル。return: 書き込むと圧縮してrawに書き出すファイル(closeしてもrawは閉じない)
+    if compression is None:
+        return raw
+    if compression == 'gzip':
+        # mtime=0: 同じ内容なら同じバイト列になるように
+        return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6 if level is None else level, mtime=0)
+    if compression == 'zstd':
+        zstd = zstdModule()
+        if zstd.__name__ == 'zstandard':
+            return zstd.ZstdCompressor(level=3 if level is None else level).stream_writer(raw, closefd=False)
+        return zstd.ZstdFile(raw, 'wb', level=level)
+    raise ValueError(f'compression must be one of {COMPRESSIONS} or None. {compression} was given.')
+
+def rotatedPath(path, index):
+    # 'out/part-00000.ndjson', 1 -> 'out/part-00000.00001.ndjson'
+    directory, name = os.path.split(path)
+    stem, dot, extension = name.partition('.')
+    return os.path.join(directory, f'{stem}.{index:05d}{dot}{extension}')
+
+class OutputSink():
+    # path: 出力するファイルのパス。compressionに応じて'.gz', '.zst'を付ける
+    # max_bytes: 1ファイルの大きさ(圧縮後)の上限の目安。超えたら次の行から次のファイルに書く
+    # max_lines: 1ファイルの行数の上限
+    # max_bytes, max_lines を指定すると、ファイル名に通し番号を付ける(rotatedPath)
+    def __init__(self, path, compression=None, level=None, max_bytes=None, max_lines=None,
+            buffer_size=1024 * 1024, queue_size=8, encoding='utf-8'):
+        if compression not in SUFFIXES:
+            raise ValueError(f'compression must be one of {COMPRESSIONS} or None. {compression} was given.')
+        if compression == 'zstd':
+            # 書き込みスレッドで初めて分かるより先に、zstdが使えなければここで例外にする
+            zstdModule()
+        if max_lines is not None and max_lines < 1:
+            raise ValueError(f'max_lines must be at least 1. {max_lines} was given.')
+        self.path = os.fspath(path) + SUFFIXES[compression]
+        self.compression = compression
+        self.level = level
+        self.maxBytes = max_bytes
+        self.maxLines = max_lines
+        self.rotates = max_bytes is not None or max_lines is not None
+        self.bufferSize = buffer_size
+        self.encoding = encoding
+        self.paths = []
+        self.lines = 0 # 全体の行数
+        self.pending = []
+        self.pendingSize = 0
+        self.closed = False
+        self.error = None
+        # 以下は書き込みスレッドだけが使う
+        self.raw = None
+        self.file = None
+        self.fileLines = 0
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self._run, name='ssmix2jsonizer-sink', daemon=True)
+        self.thread.start()
+
+    def write(self, text):
+        if self.closed:
+            raise ValueError('I/O operation on closed sink.')
+        self.pending.append(text)
+        self.pendingSize += len(text)
+        if self.pendingSize >= self.bufferSize:
+            self._submit()
+        return len(text)
+
+    def _submit(self):
+        self._raiseError()
+        if self.pending:
+            text = ''.join(self.pending)
+            self.pending = []
+            self.pendingSize = 0
+            self.lines += text.count('\n')
+            self.queue.put(text)
+
+    def _raiseError(self):
+        if self.error is not None:
+            raise self.error
+
+    def flush(self):
+        # 渡したテキストを全てファイルに書き出すまで待つ
+        self._submit()
+        self.queue.put(_FLUSH)
+        self.queue.join()
+        self._raiseError()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._submit()
+        finally:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+        self._raiseError()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # 以下は書き込みスレッド
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if self.error is None:
+                    if item is None:
+                        self._closeFile()
+                    elif item is _FLUSH:
+                        if self.file is not None:
+                            self.file.flush()
+                            self.raw.flush()
+                    else:
+                        self._write(item)
+            except BaseException as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+            if item is None:
+                return
+
+    def _openFile(self):
+        path = rotatedPath(self.path, len(self.paths)) if self.rotates else self.path
+        self.raw = open(path, 'wb')
+        self.file = openCompressed(self.raw, self.compression, self.level)
+        self.fileLines = 0
+        self.paths.append(path)
+
+    def _closeFile(self):
+        if self.file is not None:
+            if self.file is not self.raw:
+                self.file.close()
+            self.raw.close()
+            self.file = None
+            self.raw = None
+
+    def _write(self, text):
+        while text:
+            if self.file is None:
+                self._openFile()
+            count = text.count('\n')
+            if self.maxLines is not None and self.fileLines + count >= self.maxLines:
+                # max_lines行目の終わりまでを書き、次のファイルに切り替える
+                end = -1
+                for _ in range(self.maxLines - self.fileLines):
+                    end = text.find('\n', end + 1)
+                self.file.write(text[:end + 1].encode(self.encoding))
+                text = text[end + 1:]
+                self._closeFile()
+                continue
+            if self.maxBytes is not None and count:
+                # 行の区切りまでを書いてから大きさを確かめ、超えていれば残りは次のファイルに書く。
+                # 上限を大きく超えないよう、1回に書くのは上限までの残り(文字数)に収まる行まで(1行がそれより長ければその1行)
+                limit = max(self.maxBytes - self.raw.tell(), 1)
+                end = text.rfind('\n', 0, limit) + 1 or text.find('\n') + 1
+                self.file.write(text[:end].encode(self.encoding))
+                self.fileLines += text.count('\n', 0, end)
+                text = text[end:]
+                if self.raw.tell() >= self.maxBytes:
+                    self._closeFile()
+                continue
+            self.file.write(text.encode(self.encoding))
+            self.fileLines += count
+            text = ''
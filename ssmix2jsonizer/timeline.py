@@ -0,0 +1,275 @@
+import argparse
+import heapq
+import io
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from .bulk import chunked, walkStorage
+from .diagnostics import Diagnostics
+from .main import Jsonizer
+from .mllp import asMessage
+from .typed import DTM_REGEX, toEpochMillis
+
+# 患者ごとのタイムライン。変換したメッセージをPID-3で集め、EVN-2(無ければMSH-7)の順に並べて、
+# 1行1患者の{"patient_id": ..., "messages": [{"path": ..., "ssmix2_data_category": ..., "message": {...}}, ...]}
+# で書き出す。メモリに収まらない量を扱えるよう、外部ソートで並べる。
+#   1. メッセージを変換し、(患者, 日時, 入力順)のキーを付けた行をrun_bytesまでメモリにためる
+#   2. たまったらキーで並べ替え、一時ファイル(ラン)に書き出す
+#   3. ランをk-wayマージ(heapq.merge)し、患者ごとに続けて書き出す。ランがMERGE_FAN_INより多ければ、先に部分ごとにマージする
+# メモリ使用量はrun_bytesとMERGE_FAN_INで決まり、1人の患者のメッセージが多くても増えない。
+# 患者IDはPID-3の最初の繰り返しのID(第1成分)。Jsonizerにpseudonymizerを指定していれば、そのトークンを使う。
+# 日時を解釈できないメッセージは、その患者の最後に入力順で並べる。
+
+# 一度にマージするランの数(同時に開くファイルの数)
+MERGE_FAN_IN = 64
+DEFAULT_RUN_BYTES = 64 * 1024 * 1024
+# 日時にタイムゾーンが無いときのオフセット(SS-MIX2は日本時間)
+DEFAULT_TIMEZONE = '+0900'
+# キーを取り出すときの問題(閉じないエスケープなど)は、変換するときにも報告されるので、ここでは報告しない
+KEY_DIAGNOSTICS = Diagnostics(sample=0)
+
+def firstComponent(context, raw):
+    # return: 最初の繰り返しの第1成分(エスケープを解除したもの)
+    value = raw.split(context.REPETITION_SEPARATOR, 1)[0].split(context.COMPONENT_SEPARATOR, 1)[0]
+    return context.removeEscape(value) if context.ESCAPE_CHARACTER in value else value
+
+def eventTime(view, defaultTimezone=DEFAULT_TIMEZONE):
+    # return: EVN-2(無いか解釈できなければMSH-7)のUTCのエポックミリ秒。どちらも無いか解釈できなければNone
+    for path in ('EVN.2', 'MSH.7'):
+        value = firstComponent(view.context, view.rawValue(path))
+        if not value:
+            continue
+        m = DTM_REGEX.match(value)
+        if m is None:
+            continue
+        year, month, day, hour, minute, second, fraction, offset = m.groups()
+        try:
+            return toEpochMillis(int(year), int(month or 1), int(day or 1), int(hour or 0), int(minute or 0),
+                int(second or 0), fraction, offset or defaultTimezone)
+        except ValueError:
+            continue
+    return None
+
+def timelineKey(jsonizer, dataCategory, text, seq):
+    # return: (患者ID, 日時が無ければ1, 日時, 入力順)。患者IDが無ければ''
+    view = jsonizer.view(dataCategory, asMessage(text))
+    view.context.diagnostics = KEY_DIAGNOSTICS
+    patient = firstComponent(view.context, view.rawValue('PID.3'))
+    if patient and jsonizer.pseudonymizer is not None:
+        patient = jsonizer.pseudonymizer.token(patient)
+    time = eventTime(view)
+    return (patient, 1, 0, seq) if time is None else (patient, 0, time, seq)
+
+def convertRecord(jsonizer, dataCategory, text, source, seq):
+    # return: (キー, 1行のJSONテキスト)
+    key = timelineKey(jsonizer, dataCategory, text, seq)
+    buffer = io.StringIO()
+    buffer.write(json.dumps({'path': source, 'ssmix2_data_category': dataCategory},
+        ensure_ascii=False)[:-1] + ', "message": ')
+    jsonizer.jsonizeTo(dataCategory, asMessage(text), buffer)
+    buffer.write('}')
+    return key, buffer.getvalue()
+
+def spillRuns(records, directory, runBytes=DEFAULT_RUN_BYTES):
+    # records: (キー, 行)のiterable。return: 並べ替えたランのパスのリスト
+    # ランの各行は'キーのJSON\t行'。json.dumpsは文字列中のタブ、改行をエスケープするので、そのまま区切りに使える
+    paths = []
+    buffer = []
+    size = 0
+
+    def spill():
+        buffer.sort(key=lambda record: record[0])
+        path = os.path.join(directory, f'run-{len(paths):06d}.tsv')
+        with open(path, 'w', encoding='utf-8') as f:
+            for key, line in buffer:
+                f.write(json.dumps(key, ensure_ascii=False) + '\t' + line + '\n')
+        paths.append(path)
+        buffer.clear()
+
+    for key, line in records:
+        buffer.append((key, line))
+        size += len(line)
+        if size >= runBytes:
+            spill()
+            size = 0
+    if buffer:
+        spill()
+    return paths
+
+def readRun(path):
+    # return: (キー, 行)をyieldする
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            keyText, _, record = line.partition('\t')
+            yield tuple(json.loads(keyText)), record[:-1]
+
+def mergeRuns(paths, directory, fanIn=MERGE_FAN_IN):
+    # return: 全てのランをキーの順にマージした(キー, 行)のiterator。ランが多ければ中間のランにマージしてから
+    generation = 0
+    while len(paths) > fanIn:
+        merged = []
+        for i in range(0, len(paths), fanIn):
+            group = paths[i:i + fanIn]
+            path = os.path.join(directory, f'merge-{generation:03d}-{len(merged):06d}.tsv')
+            with open(path, 'w', encoding='utf-8') as f:
+                for key, line in heapq.merge(*map(readRun, group), key=lambda record: record[0]):
+                    f.write(json.dumps(key, ensure_ascii=False) + '\t' + line + '\n')
+            for used in group:
+                os.remove(used)
+            merged.append(path)
+        paths = merged
+        generation += 1
+    return heapq.merge(*map(readRun, paths), key=lambda record: record[0])
+
+def writeTimelines(merged, output):
+    # 患者ごとに1行で書き出す。患者のメッセージはためずに、そのまま書き出す
+    # return: 患者数
+    patients = 0
+    current = None
+    for key, line in merged:
+        if key[0] != current:
+            if patients:
+                output.write(']}\n')
+            current = key[0]
+            patients += 1
+            output.write('{"patient_id": ' + json.dumps(current or None, ensure_ascii=False) + ', "messages": [')
+        else:
+            output.write(', ')
+        output.write(line)
+    if patients:
+        output.write(']}\n')
+    return patients
+
+def aggregateMessages(messages, output, jsonizer=None, run_bytes=DEFAULT_RUN_BYTES, tmp_dir=None, errors=None,
+        **kwargs):
+    # messages: (データ種別, メッセージの文字列, 出力のpathに入れる値)のiterable
+    # errors: 失敗したメッセージを{"path": ..., "error": ...}の行で書き出すファイルライクオブジェクト
+    # return: {'patients': 患者数, 'messages': 件数, 'failed': 件数, 'runs': ランの数}
+    jsonizer = jsonizer or Jsonizer(**kwargs)
+    summary = {'patients': 0, 'messages': 0, 'failed': 0, 'runs': 0}
+
+    def records():
+        for seq, (dataCategory, text, source) in enumerate(messages):
+            try:
+                record = convertRecord(jsonizer, dataCategory, text, source, seq)
+            except Exception as e:
+                summary['failed'] += 1
+                if errors is not None:
+                    errors.write(json.dumps({'path': source, 'error': f'{type(e).__name__}: {e}'},
+                        ensure_ascii=False) + '\n')
+                continue
+            summary['messages'] += 1
+            yield record
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as directory:
+        runs = spillRuns(records(), directory, run_bytes)
+        summary['runs'] = len(runs)
+        summary['patients'] = writeTimelines(mergeRuns(runs, directory), output)
+    return summary
+
+_workerJsonizer = None
+_workerRoot = None
+_workerEncoding = None
+
+def _initWorker(root, jsonizerKwargs):
+    global _workerJsonizer, _workerRoot, _workerEncoding
+    _workerJsonizer = Jsonizer(**jsonizerKwargs)
+    _workerRoot = root
+    _workerEncoding = jsonizerKwargs.get('encoding', 'iso-2022-jp')
+
+def _convertChunk(chunk):
+    # chunk: [(入力順, データ種別, パス), ...]。return: ([(キー, 行), ...], [(相対パス, error), ...])
+    records = []
+    errors = []
+    for seq, dataCategory, path in chunk:
+        relpath = os.path.relpath(path, _workerRoot)
+        try:
+            # ビューと変換で同じ文字列を使うので、先に読み込む(改行はuniversal newlines)
+            with open(path, encoding=_workerEncoding) as f:
+                text = f.read()
+            records.append(convertRecord(_workerJsonizer, dataCategory, text, relpath, seq))
+        except Exception as e:
+            errors.append((relpath, f'{type(e).__name__}: {e}'))
+    if _workerJsonizer.pseudonymizer is not None:
+        _workerJsonizer.pseudonymizer.flush()
+    return records, errors
+
+def aggregateStorage(root, output, processes=None, chunksize=256, run_bytes=DEFAULT_RUN_BYTES, tmp_dir=None,
+        errors=None, **kwargs):
+    # SS-MIX2標準化ストレージ全体を、プロセスプールで並列に変換して患者ごとのタイムラインにする。
+    # kwargsはJsonizerにそのまま渡される。
+    # return: {'patients': 患者数, 'messages': 件数, 'failed': 件数, 'skipped': データ種別不明の件数, 'runs': ランの数}
+    root = os.path.abspath(os.fspath(root))
+    processes = processes or os.cpu_count() or 1
+    summary = {'patients': 0, 'messages': 0, 'failed': 0, 'skipped': 0, 'runs': 0}
+
+    def targetFiles():
+        for seq, (dataCategory, path) in enumerate(walkStorage(root)):
+            if dataCategory is None:
+                summary['skipped'] += 1
+                continue
+            yield seq, dataCategory, path
+
+    def collect(future):
+        records, failures = future.result()
+        summary['messages'] += len(records)
+        summary['failed'] += len(failures)
+        if errors is not None:
+            for path, error in failures:
+                errors.write(json.dumps({'path': path, 'error': error}, ensure_ascii=False) + '\n')
+        return records
+
+    def records(executor):
+        # 走査中のファイル一覧を全てキューに積まないよう、実行中のタスク数を制限する
+        pending = set()
+        for chunk in chunked(targetFiles(), chunksize):
+            if len(pending) >= processes * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from collect(future)
+            pending.add(executor.submit(_convertChunk, chunk))
+        for future in pending:
+            yield from collect(future)
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as directory:
+        with ProcessPoolExecutor(processes, initializer=_initWorker, initargs=(root, kwargs)) as executor:
+            runs = spillRuns(records(executor), directory, run_bytes)
+        summary['runs'] = len(runs)
+        summary['patients'] = writeTimelines(mergeRuns(runs, directory), output)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ssmix2jsonize-timeline',
+        description='SS-MIX2標準化ストレージを、患者ごとに日時順に並べたNDJSONに変換します。')
+    parser.add_argument('root', help='SS-MIX2標準化ストレージのルートディレクトリ')
+    parser.add_argument('output', help='出力するNDJSONファイル')
+    parser.add_argument('--errors', default=None, help='変換に失敗したファイルを記録するファイル')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=256)
+    parser.add_argument('--run-mb', type=int, default=DEFAULT_RUN_BYTES // (1024 * 1024),
+        help='並べ替えのためにメモリにためる量(MB)。超えたら一時ファイルに書き出す')
+    parser.add_argument('--tmp-dir', default=None, help='一時ファイルを置くディレクトリ')
+    parser.add_argument('--no-deidentify', dest='deidentify', action='store_false')
+    parser.add_argument('--field-name-lang', choices=['en', 'ja'], default='en')
+    parser.add_argument('--element-name-lang', choices=['en', 'ja'], default='en')
+    parser.add_argument('--encoding', default='iso-2022-jp')
+    args = parser.parse_args(argv)
+
+    errors = open(args.errors, 'w', encoding='utf-8') if args.errors else None
+    try:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            summary = aggregateStorage(args.root, output, args.processes, args.chunksize,
+                args.run_mb * 1024 * 1024, args.tmp_dir, errors, deidentify=args.deidentify,
+                field_name_lang=args.field_name_lang, element_name_lang=args.element_name_lang,
+                encoding=args.encoding)
+    finally:
+        if errors is not None:
+            errors.close()
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
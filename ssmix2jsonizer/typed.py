@@ -0,0 +1,178 @@
+import datetime
+import re
+from array import array
+from decimal import Decimal
+
+# 型つき出力(typed_values=True)で使うNM, DT, DTM, TMの変換と、列単位の一括変換。
+# numeric_type: 'float' or 'decimal'
+# datetime_format: 'iso'(ISO 8601の文字列。記載された精度のまま) or 'epoch'(UTCのエポックミリ秒の整数。TMは0時からのミリ秒)
+# default_timezone: DT, DTMにタイムゾーンが無いときのオフセット('+0900'など)。Noneならisoではオフセットを付けず、epochではUTCとみなす
+NUMERIC_TYPES = ('float', 'decimal')
+DATETIME_FORMATS = ('iso', 'epoch')
+
+# DTM_PATTERN(main.py)と同じ値を受け付け、要素ごとにグループにしたもの
+DTM_GROUPS = (r'(\d{4})(?:(0[1-9]|1[0-2])(?:(0[1-9]|[12][0-9]|3[01])(?:([01][0-9]|2[0-4])(?:([0-5][0-9])'
+    r'(?:([0-5][0-9])(?:\.([0-9]{1,4}))?)?)?)?)?)?([+-](?:0[0-9]|1[0-3])[0-5][0-9])?')
+DTM_REGEX = re.compile(f'^{DTM_GROUPS}$')
+DT_REGEX = re.compile(r'^(\d{4})(?:(0[1-9]|1[0-2])(0[1-9]|[12][0-9]|3[01])?)?$')
+TM_REGEX = re.compile(r'^(?:([01][0-9]|2[0-4])(?:([0-5][0-9])(?:([0-5][0-9])(?:\.([0-9]{1,4}))?)?)?)?'
+    r'([+-](?:0[0-9]|1[0-3])[0-5][0-9])?$')
+# HL7のNM: 符号、数字、小数点のみ(指数表記なし)
+NM_REGEX = re.compile(r'^[+-]?(?:\d+(?:\.\d*)?|\.\d+)$')
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+def offsetMinutes(offset):
+    # '+0900' -> 540
+    sign = -1 if offset[0] == '-' else 1
+    return sign * (int(offset[1:3]) * 60 + int(offset[3:5]))
+
+def isoOffset(offset):
+    return f'{offset[:3]}:{offset[3:]}'
+
+def toEpochMillis(year, month, day, hour, minute, second, fraction, offset):
+    # 24時は翌日の0時。存在しない日付はValueError
+    extraDay = hour == 24
+    dt = datetime.datetime(year, month, day, 0 if extraDay else hour, minute, second,
+        tzinfo=datetime.timezone(datetime.timedelta(minutes=offsetMinutes(offset) if offset else 0)))
+    if extraDay:
+        dt += datetime.timedelta(days=1)
+    millis = (dt - EPOCH) // datetime.timedelta(milliseconds=1)
+    return millis + int(fraction.ljust(3, '0')[:3]) if fraction else millis
+
+def isValidDate(year, month, day):
+    # 正規表現では月ごとの日数を確かめないので、存在しない日付(20210231など)をここで除く
+    if not day:
+        return True
+    try:
+        datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        return False
+    return True
+
+def compileTypedConverters(numericType='float', datetimeFormat='iso', defaultTimezone='+0900'):
+    # return: {'NM': converter, 'DT': ..., 'DTM': ..., 'TM': ...}。converter(context, data)
+    if numericType not in NUMERIC_TYPES:
+        raise ValueError(f'numeric_type must be one of {NUMERIC_TYPES}. {numericType} was given.')
+    if datetimeFormat not in DATETIME_FORMATS:
+        raise ValueError(f'datetime_format must be one of {DATETIME_FORMATS}. {datetimeFormat} was given.')
+    if defaultTimezone is not None and not re.match(r'^[+-](0[0-9]|1[0-3])[0-5][0-9]$', defaultTimezone):
+        raise ValueError(f'default_timezone must be like "+0900". {defaultTimezone} was given.')
+
+    def convertNumeric(context, data):
+        if NM_REGEX.match(data):
+            return Decimal(data) if numericType == 'decimal' else float(data)
+        context.report('NM_FORMAT', data)
+        return None
+
+    def convertDate(context, data):
+        m = DT_REGEX.match(data)
+        if m is None:
+            context.report('DT_FORMAT', data)
+            return None
+        year, month, day = m.groups()
+        if datetimeFormat == 'iso':
+            if not isValidDate(year, month, day):
+                context.report('DT_FORMAT', data)
+                return None
+            return '-'.join(part for part in (year, month, day) if part)
+        try:
+            return toEpochMillis(int(year), int(month or 1), int(day or 1), 0, 0, 0, None, defaultTimezone)
+        except ValueError:
+            context.report('DT_FORMAT', data)
+            return None
+
+    def convertDateTime(context, data):
+        m = DTM_REGEX.match(data)
+        if m is None:
+            context.report('DTM_FORMAT', data)
+            return None
+        year, month, day, hour, minute, second, fraction, offset = m.groups()
+        offset = offset or defaultTimezone
+        if datetimeFormat == 'iso':
+            if not isValidDate(year, month, day):
+                context.report('DTM_FORMAT', data)
+                return None
+            value = '-'.join(part for part in (year, month, day) if part)
+            if hour:
+                value += 'T' + ':'.join(part for part in (hour, minute, second) if part)
+                if fraction:
+                    value += '.' + fraction
+                if offset:
+                    value += isoOffset(offset)
+            return value
+        try:
+            return toEpochMillis(int(year), int(month or 1), int(day or 1), int(hour or 0), int(minute or 0),
+                int(second or 0), fraction, offset)
+        except ValueError:
+            context.report('DTM_FORMAT', data)
+            return None
+
+    def convertTime(context, data):
+        m = TM_REGEX.match(data)
+        if m is None:
+            context.report('TM_FORMAT', data)
+            return None
+        hour, minute, second, fraction, offset = m.groups()
+        if datetimeFormat == 'iso':
+            value = ':'.join(part for part in (hour, minute, second) if part)
+            if fraction:
+                value += '.' + fraction
+            if offset:
+                value += isoOffset(offset)
+            return value
+        return ((int(hour or 0) * 60 + int(minute or 0)) * 60 + int(second or 0)) * 1000 \
+            + (int(fraction.ljust(3, '0')[:3]) if fraction else 0)
+
+    return {'NM': convertNumeric, 'DT': convertDate, 'DTM': convertDateTime, 'TM': convertTime}
+
+def decimalEncoder(encode):
+    # return: encode(json.JSONEncoderのencode)と同じテキストを返す関数。
+    # Decimalはfloatを経由せずにstr()の表記のままJSONの数値として書き出す(NMの検証を通った有限の値だけ)
+    def encodeDecimal(value):
+        valueType = type(value)
+        if valueType is Decimal:
+            return str(value)
+        if valueType is dict:
+            return '{' + ', '.join(encode(key) + ': ' + encodeDecimal(item) for key, item in value.items()) + '}'
+        if valueType is list:
+            return '[' + ', '.join(encodeDecimal(item) for item in value) + ']'
+        return encode(value)
+    return encodeDecimal
+
+def _lines(values):
+    # 改行を含む値は不正な値として扱う
+    return '\n'.join(value.replace('\n', '\x00') for value in values)
+
+INVALID_NM_LINE = re.compile(r'^(?![+-]?(?:\d+(?:\.\d*)?|\.\d+)$).*$', re.MULTILINE)
+
+def convertNumbers(values):
+    # 文字列のリストをまとめてfloatにする。NMでない値はNaN
+    # 検証は全体で1回の正規表現の置換で行い、numpyがあれば変換もまとめて行う
+    if not values:
+        return array('d')
+    cleaned = INVALID_NM_LINE.sub('nan', _lines(values)).split('\n')
+    try:
+        import numpy
+    except ImportError:
+        return array('d', map(float, cleaned))
+    return array('d', numpy.array(cleaned).astype(numpy.float64).tobytes())
+
+DTM_LINE = re.compile(f'^(?:{DTM_GROUPS})?$|^.*$', re.MULTILINE)
+
+def parseDateTimes(values):
+    # DTMの文字列のリストをまとめてdatetime(タイムゾーンは無視し、記載された時刻のまま)にする。不正な値はNone
+    # 値ごとに正規表現を呼ばず、全体を1回走査する
+    result = []
+    for m in DTM_LINE.finditer(_lines(values)):
+        year, month, day, hour, minute, second, fraction, offset = m.groups()
+        if year is None:
+            result.append(None)
+            continue
+        try:
+            result.append(datetime.datetime(int(year), int(month or 1), int(day or 1), int(hour or 0),
+                int(minute or 0), int(second or 0), int(fraction.ljust(6, '0')) if fraction else 0))
+        except ValueError:
+            # 24時、存在しない日付など
+            result.append(None)
+    return result
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# パッケージと、合成メッセージ(benchmarks/synthetic.py)などのベンチマークのスクリプトをimportできるようにする
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, ROOT)
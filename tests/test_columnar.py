@@ -0,0 +1,30 @@
+import csv
+
+from ssmix2jsonizer.columnar import OBX_COLUMNS, OBXColumnarWriter
+
+MSH = 'MSH|^~\\&|HIS123|SEND|GW|RCV|20111220224447||OUL^R22^OUL_R22|20111220000001|P|2.5||||||~ISO IR87||ISO 2022-1994'
+MESSAGE = '\r'.join([
+    MSH,
+    'PID|0001||9999013||患者^太郎^^^^^L^I||19480405|M',
+    'OBX|1|NM|3A010^ALB^JC10||4.2|g/dL^^ISO+|||||F|||20111220120000',
+    'OBX|2|SN|3A015^TP^JC10||^7.1|g/dL|||||F|||20111220',
+    'OBX|3|SN|3B035^AST^JC10||<^10|U/L|||||F|||20111299120000',
+    'OBX|4|NM|3B050^ALT^JC10||abc|U/L||H~N|||F',
+])
+
+def test_csv_round_trip(tmp_path):
+    path = tmp_path / 'obx.csv'
+    with OBXColumnarWriter(path, format='csv', batch_size=2) as writer:
+        # MSHだけのメッセージはファイルのパスとみなさず、OBXが無いので0行
+        assert writer.add('OML-11', MSH) == 0
+        assert writer.add('OML-11', MESSAGE) == 4
+    assert writer.rows == 4
+    with open(path, encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == [name for name, columnType in OBX_COLUMNS]
+    assert [row['numeric_value'] for row in rows] == ['4.2', '7.1', '', '']
+    assert [row['observation_datetime'] for row in rows] == ['2011-12-20T12:00:00', '2011-12-20T00:00:00', '', '']
+    assert rows[0]['message_datetime'] == '2011-12-20T22:44:47'
+    assert rows[0]['patient_id'] == '9999013'
+    assert rows[0]['units'] == 'g/dL'
+    assert rows[3]['value'] == 'abc' and rows[3]['abnormal_flags'] == 'H~N'
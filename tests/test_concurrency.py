@@ -0,0 +1,10 @@
+import pytest
+
+from concurrency_stress import stress
+
+@pytest.mark.filterwarnings('ignore')
+def test_shared_jsonizer_across_threads():
+    # 1つのJsonizerを複数スレッドから使い、区切り文字の異なるメッセージが混ざっても結果が変わらない
+    total, failures = stress(threads=8, rounds=100)
+    assert total == 800
+    assert failures == []
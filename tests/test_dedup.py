@@ -0,0 +1,44 @@
+import sqlite3
+from decimal import Decimal
+
+import pytest
+
+from ssmix2jsonizer.dedup import MessageDeduplicator
+from synthetic import generateMessages
+
+def spilledRows(path):
+    # 別の接続から見える(コミット済みの)件数
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+    finally:
+        connection.close()
+
+@pytest.mark.filterwarnings('ignore')
+def test_spill_is_committed_in_batches(tmp_path):
+    path = tmp_path / 'dedup.sqlite'
+    messages = generateMessages('ADT-00', 25)
+    dedup = MessageDeduplicator(maxsize=4, spill=path, batch_size=5)
+    for message in messages:
+        dedup.jsonize('ADT-00', message)
+    # 21件が追い出され、そのうち20件はコミット済み
+    assert spilledRows(path) == 20
+    dedup.close()
+    assert spilledRows(path) == 25
+    with MessageDeduplicator(maxsize=4, spill=path) as dedup:
+        for message in messages:
+            dedup.jsonize('ADT-00', message)
+        assert dedup.stats()['duplicates'] == 25
+
+def test_duplicate_keeps_decimal():
+    # 重複したメッセージでも、numeric_type='decimal'の数値はDecimalのまま返る
+    message = ('MSH|^~\\&|A|B|C|D|20210805123000||OUL^R22^OUL_R22|1|P|2.5||||||~ISO IR87||ISO 2022-1994\r'
+        'PID|||123||Y^T\rSPM|1\rOBR|1\rOBX|1|NM|1^a^JC10||1.10|\rOBX|2|NM|2^b^JC10||12|\r')
+    dedup = MessageDeduplicator(typed_values=True, numeric_type='decimal')
+    first = dedup.jsonize('OML-11', message)
+    second = dedup.jsonize('OML-11', message)
+    assert dedup.stats()['duplicates'] == 1
+    assert second == first
+    values = [obx['05_ObservationValue_NM'][0] for obx in second['SPECIMEN_Nested'][0]['ORDER_Nested'][0]['OBX_Nested']]
+    assert values == [Decimal('1.10'), Decimal('12')]
+    assert all(type(value) is Decimal for value in values)
@@ -0,0 +1,32 @@
+from ssmix2jsonizer import Jsonizer
+from ssmix2jsonizer.diagnostics import Diagnostics
+
+# AL1-2, AL1-3(CWE)に閉じないエスケープ
+MESSAGE = '\r'.join([
+    'MSH|^~\\&|HIS123|SEND|GW|RCV|20111220224447||ADT^A08^ADT_A01|20111220000001|P|2.5',
+    'EVN||201112202100',
+    'PID|0001||9999013||患者^太郎^^^^^L^I||19480405|M',
+    'PV1|0001|I',
+    'AL1|1|DA^薬剤\\アレルギー^HL70127|1^ペニシリン\\^99XYZ',
+])
+
+def convert(jsonizer, diagnostics, count=3):
+    results = []
+    for _ in range(count):
+        issues = []
+        results.append((jsonizer.jsonize('ADT-00', MESSAGE, issues), issues))
+    return results, diagnostics.stats()
+
+def test_memo_hits_report_issues():
+    # メモから結果を返したメッセージにも、メモしない場合と同じ問題が報告される
+    diagnostics = Diagnostics()
+    expected = convert(Jsonizer(diagnostics=diagnostics), diagnostics)
+    diagnostics = Diagnostics()
+    jsonizer = Jsonizer(diagnostics=diagnostics, memo_size=64)
+    actual = convert(jsonizer, diagnostics)
+    assert jsonizer.memoStats()['hits'] > 0
+    assert actual == expected
+    assert expected[1]['UNCLOSED_ESCAPE'] == 6
+    for _, issues in actual[0]:
+        assert [(issue.code, issue.segment, issue.field) for issue in issues] == [
+            ('UNCLOSED_ESCAPE', 'AL1', 2), ('UNCLOSED_ESCAPE', 'AL1', 3)]
@@ -0,0 +1,89 @@
+import http.server
+import json
+import threading
+
+import pytest
+
+from ssmix2jsonizer.esbulk import BulkError, BulkWriter, HTTPSender
+
+MESSAGE = '\r'.join([
+    'MSH|^~\\&|HIS123|SEND|GW|RCV|20111220224447.3399||ADT^A08^ADT_A01|20111220000001|P|2.5||||||~ISO IR87||ISO 2022-1994',
+    'EVN||201112202100',
+    'PID|0001||9999013||患者^太郎^^^^^L^I||19480405|M',
+    'PV1|0001|I',
+])
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    # server.response: 返す本文(bytes)と、Content-Lengthに書く長さ(Noneなら本文の長さ)の組
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body, length = self.server.response
+        self.server.requests += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body) if length is None else length))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def send(server, chunks=3):
+    sender = HTTPSender(f'http://127.0.0.1:{server.server_address[1]}/_bulk', retries=1, backoff=0, timeout=5)
+    writer = BulkWriter(sender, 'ssmix2', max_docs=1)
+    for _ in range(chunks):
+        writer.add('ADT-00', MESSAGE)
+    return writer, sender
+
+def test_success(server):
+    server.response = (json.dumps({'errors': False, 'items': []}).encode('utf-8'), None)
+    writer, sender = send(server)
+    writer.close()
+    assert sender.stats() == {'requests': 3, 'retried': 0, 'failures': 0}
+
+@pytest.mark.parametrize('response', [
+    (b'<html>Bad Gateway</html>', None), # JSONでない
+    (b'{"errors": false, "ite', 100), # 途中で切れた
+    (b'[]', None), # オブジェクトでない
+])
+def test_bad_response_is_retried_and_reported(server, response):
+    server.response = response
+    writer, sender = send(server)
+    with pytest.raises(BulkError):
+        writer.close()
+    # 失われたチャンクは無く、全て再送したうえで失敗として記録される
+    assert sender.stats() == {'requests': 6, 'retried': 3, 'failures': 3}
+    assert server.requests == 6
+
+def test_unexpected_error_is_raised_on_close(server):
+    server.response = (json.dumps({'errors': False, 'items': []}).encode('utf-8'), None)
+    sender = HTTPSender(f'http://127.0.0.1:{server.server_address[1]}/_bulk')
+
+    def post(body):
+        raise RuntimeError('unexpected')
+
+    sender._post = post
+    sender(b'{}\n')
+    with pytest.raises(RuntimeError):
+        sender.close()
+
+def test_single_segment_message():
+    # MSHだけのメッセージ(改行を含まない)はファイルのパスとみなさない
+    msh = MESSAGE.split('\r')[0]
+    chunks = []
+    writer = BulkWriter(chunks.append, 'ssmix2')
+    assert writer.add('ADT-00', msh) == 'ADT-00_20111220000001'
+    writer.close()
+    action, document = chunks[0].decode('utf-8').splitlines()
+    assert json.loads(action) == {'index': {'_index': 'ssmix2', '_id': 'ADT-00_20111220000001'}}
+    assert 'MSH' in json.loads(document)
@@ -0,0 +1,71 @@
+import asyncio
+import os
+
+from ssmix2jsonizer import Jsonizer
+from ssmix2jsonizer.batchfile import jsonizeBatchFile
+from ssmix2jsonizer.mllp import MLLPServer, frame, sendMessages
+
+# MSHだけのメッセージ(改行を含まない)
+MSH_ONLY = 'MSH|^~\\&|HIS123|SEND|GW|RCV|20111220224447||ADT^A08^ADT_A01|20111220000001|P|2.5'
+MESSAGE = '\r'.join([
+    MSH_ONLY,
+    'EVN||201112202100',
+    'PID|0001||9999013||患者^太郎^^^^^L^I||19480405|M',
+    'PV1|0001|I',
+])
+
+def ackCode(ack):
+    return ack.split('\r')[1].split('|')[1]
+
+async def roundTrip(messages, **kwargs):
+    received = []
+
+    def sink(dataCategory, result, message):
+        received.append((dataCategory, result))
+
+    async with MLLPServer(sink, port=0, executor='thread', workers=2, **kwargs) as server:
+        acks = await sendMessages(messages, port=server.port)
+    return acks, received
+
+def test_single_segment_message_is_accepted(tmp_path, monkeypatch):
+    # メッセージがファイルのパスとして開かれないことも確かめる
+    monkeypatch.chdir(tmp_path)
+    acks, received = asyncio.run(roundTrip([MSH_ONLY, MESSAGE]))
+    assert [ackCode(ack) for ack in acks] == ['AA', 'AA']
+    assert received[0] == ('ADT-00', Jsonizer().jsonize('ADT-00', [MSH_ONLY]))
+    assert received[1] == ('ADT-00', Jsonizer().jsonize('ADT-00', MESSAGE))
+    assert os.listdir(tmp_path) == []
+
+def test_single_segment_message_in_batch_file(tmp_path):
+    path = tmp_path / 'batch.hl7'
+    path.write_bytes((MSH_ONLY + '\r' + MESSAGE + '\r').encode('iso-2022-jp'))
+    results = list(jsonizeBatchFile(path))
+    assert [dataCategory for _, dataCategory, _ in results] == ['ADT-00', 'ADT-00']
+    assert results[0][2] == Jsonizer().jsonize('ADT-00', [MSH_ONLY])
+
+def test_receive_error_releases_pending():
+    # receiveが例外で終わっても、deliverは終了し、先読みしたメッセージの枠は返される
+    async def run():
+        async with MLLPServer(lambda *args: None, port=0, executor='thread', workers=1, max_pending=4) as server:
+            convert = server.convert
+
+            def failingConvert(dataCategory, message):
+                if server.counts['received'] > 1:
+                    raise RuntimeError('cannot schedule new futures after shutdown')
+                return convert(dataCategory, message)
+
+            server.convert = failingConvert
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            writer.write(frame(MESSAGE, 'iso-2022-jp') * 3)
+            await writer.drain()
+            await reader.read()
+            writer.close()
+            while server.connections:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+            others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            return server.pending._value, others
+
+    permits, others = asyncio.run(run())
+    assert permits == 4
+    assert others == []
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from ssmix2jsonizer import Jsonizer
+from ssmix2jsonizer.main import normalizeConfig
+from ssmix2jsonizer.profiling import Profiler
+
+MESSAGE = ['MSH|^~\\&|HIS123|SEND|GW|RCV|20111220224447||ADT^A08^ADT_A01|20111220000001|P|2.5']
+
+def test_same_config_shares_instances():
+    assert Jsonizer(field_name_lang='en').jsonizerDict['ADT-00'] is Jsonizer().jsonizerDict['ADT-00']
+    assert normalizeConfig({'field_name_lang': 'en'}) == normalizeConfig({})
+    with pytest.raises(TypeError):
+        normalizeConfig({'unknown_option': 1})
+
+def test_profiled_jsonizers_are_not_shared():
+    profiler = Profiler()
+    plain = Jsonizer()
+    profiled = Jsonizer(profiler=profiler)
+    other = Jsonizer(profiler=profiler)
+    assert profiled.jsonizerDict['ADT-00'] is not other.jsonizerDict['ADT-00']
+    # 1つのJsonizerの計測を変えても、同じ設定の他のJsonizerは変わらない
+    other.jsonizerDict['ADT-00'].setProfiler(None)
+    profiled.jsonize('ADT-00', MESSAGE)
+    assert profiler.asDict()['segments']['MSH']['count'] == 1
+    later = Jsonizer()
+    later.setProfiler(Profiler())
+    assert plain.jsonizerDict['ADT-00'].profiler is None
+    assert later.jsonizerDict['ADT-00'] is not plain.jsonizerDict['ADT-00']
+
+def test_import_does_not_load_inspect():
+    # inspectのimportは重いので、importとjsonizerの生成では読み込まない
+    code = ('import sys, ssmix2jsonizer; ssmix2jsonizer.Jsonizer().jsonizerDict["ADT-00"]; '
+        'print("inspect" in sys.modules)')
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == 'False'
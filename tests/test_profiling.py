@@ -0,0 +1,21 @@
+from ssmix2jsonizer import Jsonizer
+from ssmix2jsonizer.profiling import Profiler
+
+MESSAGE = '\r'.join([
+    'MSH|^~\\&|HIS123|SEND|GW|RCV|20111220224447||ADT^A08^ADT_A01|20111220000001|P|2.5',
+    'EVN||201112202100',
+    'PID|0001||9999013^^^^PI||患者^太郎^^^^^L^I||19480405|M',
+    'PV1|0001|I',
+])
+
+def test_profiler_with_memo():
+    # 計測してもメモの対象は変わらず、プリミティブ型の変換は毎回計測される
+    profiler = Profiler()
+    profiled = Jsonizer(profiler=profiler, memo_size=100)
+    plain = Jsonizer(memo_size=100)
+    for _ in range(2):
+        assert profiled.jsonize('ADT-00', MESSAGE) == plain.jsonize('ADT-00', MESSAGE)
+    assert profiled.memoStats() == plain.memoStats()
+    dataTypes = profiler.asDict()['data_types']
+    # 1回の変換でST, IS, SIはそれぞれ2回
+    assert [dataTypes[dataType]['count'] for dataType in ('ST', 'IS', 'SI')] == [4, 4, 4]
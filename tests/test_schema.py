@@ -0,0 +1,27 @@
+import json
+import os
+
+from ssmix2jsonizer import schema
+
+def load(fileName):
+    table = schema.SchemaTable(fileName)
+    return dict(table.items())
+
+def test_cache_follows_json(tmp_path, monkeypatch):
+    monkeypatch.setattr(schema, 'JSON_DIR', str(tmp_path))
+    monkeypatch.setattr(schema, 'CACHE_DIR', str(tmp_path / '__pycache__'))
+    path = tmp_path / 'TABLE.json'
+    path.write_text(json.dumps({'A': [1, 2]}))
+    assert load('TABLE.json') == {'A': [1, 2]}
+    assert os.listdir(tmp_path / '__pycache__')
+    stat = os.stat(path)
+    # statが一致すればjsonは読まない(同じ大きさで書き換えてmtimeを戻すと、キャッシュの値が返る)
+    path.write_text(json.dumps({'A': [3, 4]}))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert load('TABLE.json') == {'A': [1, 2]}
+    # mtimeが変われば読み直す
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+    assert load('TABLE.json') == {'A': [3, 4]}
+    # 内容が同じでmtimeだけが変わったときは、ハッシュが一致するのでキャッシュを使う
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2000000))
+    assert load('TABLE.json') == {'A': [3, 4]}
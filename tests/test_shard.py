@@ -0,0 +1,16 @@
+import pytest
+
+from ssmix2jsonizer.bulk import main
+from shard_local import run
+
+@pytest.mark.filterwarnings('ignore')
+def test_killed_shard_resumes_without_duplicates_or_loss():
+    # シャード0を最初のチェックポイントの後に(ワーカーごと)止めて再実行し、全シャードの出力を分割しない変換と比べる
+    result = run(messages=100, shardCount=3, killAfter=0, log=lambda *args: None)
+    assert result['killed']
+    assert (result['duplicates'], result['missing'], result['unexpected']) == (0, 0, 0)
+
+def test_shards_option_is_rejected_with_shard_count(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        main([str(tmp_path), str(tmp_path / 'out'), '--shard-index', '0', '--shard-count', '2', '--shards', '4'])
+    assert '--shards' in capsys.readouterr().err
@@ -0,0 +1,58 @@
+import gzip
+import io
+import os
+import warnings
+
+import pytest
+
+from ssmix2jsonizer import Jsonizer
+from ssmix2jsonizer.sinks import OutputSink
+from synthetic import generateMessages
+
+MESSAGES = generateMessages('ADT-00', 300)
+
+@pytest.fixture(scope='module')
+def expected():
+    # 切り替えずに書き出した場合のテキスト
+    jsonizer = Jsonizer()
+    buffer = io.StringIO()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for message in MESSAGES:
+            jsonizer.jsonizeTo('ADT-00', message, buffer)
+            buffer.write('\n')
+    return buffer.getvalue()
+
+def writeMessages(sink):
+    jsonizer = Jsonizer()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for message in MESSAGES:
+            jsonizer.jsonizeTo('ADT-00', message, sink)
+            sink.write('\n')
+
+def readText(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return f.read()
+
+@pytest.mark.parametrize('compression, maxBytes', [(None, 64 * 1024), ('gzip', 8 * 1024)])
+def test_rotate_by_size(tmp_path, expected, compression, maxBytes):
+    # jsonizeToは1行を何回にも分けて書くので、書き込みスレッドに渡すまとまりの境界は行の途中になる
+    with OutputSink(tmp_path / 'part-00000.ndjson', compression, max_bytes=maxBytes, buffer_size=10000) as sink:
+        writeMessages(sink)
+    assert len(sink.paths) > 1
+    texts = [readText(path) for path in sink.paths]
+    assert ''.join(texts) == expected
+    for text in texts:
+        assert text.endswith('\n')
+    # 最後のファイル以外は上限に達してから切り替える
+    for path in sink.paths[:-1]:
+        assert os.path.getsize(path) >= maxBytes
+
+def test_rotate_by_lines(tmp_path, expected):
+    with OutputSink(tmp_path / 'part-00000.ndjson', max_lines=70, buffer_size=10000) as sink:
+        writeMessages(sink)
+    texts = [readText(path) for path in sink.paths]
+    assert [text.count('\n') for text in texts] == [70, 70, 70, 70, 20]
+    assert ''.join(texts) == expected
@@ -0,0 +1,36 @@
+import io
+import json
+
+from ssmix2jsonizer import Jsonizer
+from ssmix2jsonizer.diagnostics import Diagnostics
+from ssmix2jsonizer.timeline import aggregateMessages
+
+def message(controlId, evn2, msh7):
+    return '\r'.join([
+        f'MSH|^~\\&|HIS123|SEND|GW|RCV|{msh7}||ADT^A08^ADT_A01|{controlId}|P|2.5',
+        f'EVN||{evn2}',
+        'PID|0001||9999013||患者^太郎^^^^^L^I||19480405|M',
+        'PV1|0001|I',
+    ])
+
+def test_unparsable_evn2_falls_back_to_msh7():
+    messages = [
+        ('ADT-00', message('1', '20210231120000', '20210803100000'), 'a'), # EVN-2は存在しない日付
+        ('ADT-00', message('2', '20210804100000', '20210804100000'), 'b'),
+        ('ADT-00', message('3', 'XXXX', '20210802100000'), 'c'), # EVN-2は形式不正
+        ('ADT-00', message('4', '', ''), 'd'), # 日時なし
+    ]
+    output = io.StringIO()
+    summary = aggregateMessages(messages, output, Jsonizer(diagnostics=Diagnostics()), run_bytes=1)
+    assert summary['patients'] == 1
+    timeline = json.loads(output.getvalue())
+    assert [record['path'] for record in timeline['messages']] == ['c', 'a', 'b', 'd']
+
+def test_single_segment_message(tmp_path, monkeypatch):
+    # MSHだけのメッセージがファイルのパスとして開かれない
+    monkeypatch.chdir(tmp_path)
+    msh = message('1', '', '20210805100000').split('\r')[0]
+    output = io.StringIO()
+    summary = aggregateMessages([('ADT-00', msh, 'a')], output, Jsonizer(diagnostics=Diagnostics()))
+    assert (summary['messages'], summary['failed']) == (1, 0)
+    assert json.loads(output.getvalue())['messages'][0]['message'] == Jsonizer().jsonize('ADT-00', [msh])
@@ -0,0 +1,49 @@
+import io
+import json
+from decimal import Decimal
+
+import pytest
+
+from ssmix2jsonizer.diagnostics import Diagnostics
+from ssmix2jsonizer.main import Jsonizer, MessageContext
+from ssmix2jsonizer.typed import compileTypedConverters
+
+@pytest.mark.parametrize('datetimeFormat', ['iso', 'epoch'])
+@pytest.mark.parametrize('dataType, value, code', [
+    ('DT', '20210231', 'DT_FORMAT'),
+    ('DT', '20230229', 'DT_FORMAT'),
+    ('DTM', '20210431120000', 'DTM_FORMAT'),
+    ('DTM', '20210231', 'DTM_FORMAT'),
+])
+def test_nonexistent_date(datetimeFormat, dataType, value, code):
+    # 存在しない日付は、出力の形式によらずnullになり、問題として報告される
+    converters = compileTypedConverters(datetimeFormat=datetimeFormat)
+    issues = []
+    context = MessageContext(Diagnostics(), issues)
+    assert converters[dataType](context, value) is None
+    assert [issue.code for issue in issues] == [code]
+
+@pytest.mark.parametrize('dataType, value, iso', [
+    ('DT', '20240229', '2024-02-29'),
+    ('DT', '202102', '2021-02'),
+    ('DTM', '20210805123000+0900', '2021-08-05T12:30:00+09:00'),
+])
+def test_valid_date(dataType, value, iso):
+    issues = []
+    context = MessageContext(Diagnostics(), issues)
+    assert compileTypedConverters(datetimeFormat='iso')[dataType](context, value) == iso
+    assert isinstance(compileTypedConverters(datetimeFormat='epoch')[dataType](context, value), int)
+    assert issues == []
+
+NM_MESSAGE = ('MSH|^~\\&|A|B|C|D|20210805123000||OUL^R22^OUL_R22|1|P|2.5||||||~ISO IR87||ISO 2022-1994\r'
+    'PID|||123||Y^T\rSPM|1\rOBR|1\r'
+    'OBX|1|NM|1^a^JC10||1.10|\rOBX|2|NM|2^b^JC10||12|\rOBX|3|NM|3^c^JC10||0.0000001|\r')
+
+def test_jsonize_to_decimal():
+    # Decimalはfloatを経由せず、記載された桁のままJSONの数値として書き出される
+    jsonizer = Jsonizer(typed_values=True, numeric_type='decimal')
+    buffer = io.StringIO()
+    jsonizer.jsonizeTo('OML-11', NM_MESSAGE, buffer)
+    text = buffer.getvalue()
+    assert '[1.10]' in text and '[12]' in text and '[1E-7]' in text
+    assert json.loads(text, parse_float=Decimal, parse_int=Decimal) == jsonizer.jsonize('OML-11', NM_MESSAGE)